@@ -0,0 +1,266 @@
+import hashlib
+import json
+import math
+import os
+import random
+import sys
+import time
+
+# Stand-ins for define, ridft, dscf, eiger and xtb, to benchmark the orchestration without Turbomole or xtb.
+# Each program sleeps for a size-dependent time and writes the files the real program writes (control, basis,
+# mos, energy, TM.out, eiger.out, xtb.log, gradient), in the format the parsers of this repository read.
+# The energies are a cheap deterministic function of the geometry, the functional and the basis.
+# Only the standard library is imported, the start-up of a fake program should stay close to that of a real one.
+#
+# Environment:
+#   FAKE_QM_SCALE      factor of all sleep times (default 1.0, 0 for no sleeping at all)
+#   FAKE_QM_COSTS      JSON overriding entries of default_costs, e.g. {"ridft": [0.1, 0.5, 3]}
+#   FAKE_QM_FAIL_RATE  fraction of the SCFs that do not converge (default 0.0)
+#   FAKE_QM_LOG        file each program run appends a JSON line to: program, cwd, natoms and the seconds slept
+
+# seconds = base + coefficient * (natoms / 20) ** exponent
+default_costs = {"define": [0.05, 0.0, 1],
+                 "ridft": [0.1, 0.2, 3],
+                 "dscf": [0.1, 0.4, 3],
+                 "eiger": [0.01, 0.0, 1],
+                 "xtb": [0.02, 0.02, 2]}
+
+AToBohr = 1.889725989
+HToeV = 27.211399
+
+# rough atomic energies in Hartree
+atomic_energies = {"h": -0.5, "c": -37.8, "n": -54.5, "o": -75.0, "f": -99.7, "s": -398.1, "cl": -460.1}
+
+
+def sleep_time(program, natoms):
+    costs = dict(default_costs, **json.loads(os.environ.get("FAKE_QM_COSTS", "{}")))
+    base, coefficient, exponent = costs[program]
+    return float(os.environ.get("FAKE_QM_SCALE", "1.0")) * (base + coefficient * (natoms / 20.0) ** exponent)
+
+
+def log_run(program, natoms, seconds):
+    path = os.environ.get("FAKE_QM_LOG")
+    if path is None:
+        return
+    with open(path, "a") as fp:
+        fp.write(json.dumps({"program": program, "cwd": os.getcwd(), "natoms": natoms, "seconds": seconds}) + "\n")
+
+
+def read_coord(path="coord"):
+    """
+    :return: elements and coordinates in Bohr of a Turbomole coord file
+    """
+    elements, coords = [], []
+    with open(path, "r") as fp:
+        for line in fp:
+            fields = line.split()
+            if len(fields) == 4 and not line.startswith("$"):
+                coords.append([float(x) for x in fields[:3]])
+                elements.append(fields[3].lower())
+    return elements, coords
+
+
+def read_xyz(path):
+    """
+    :return: elements and coordinates in Angstrom of a single-frame xyz file
+    """
+    with open(path, "r") as fp:
+        lines = fp.read().splitlines()
+    natoms = int(lines[0])
+    elements = [line.split()[0].lower() for line in lines[2:2 + natoms]]
+    coords = [[float(x) for x in line.split()[1:4]] for line in lines[2:2 + natoms]]
+    return elements, coords
+
+
+def model_energy(elements, coords, functional="b-p", basis="def-SV(P)"):
+    """
+    Deterministic stand-in for a total energy in Hartree: atomic energies shifted by functional and basis
+    plus a smooth pair term, so that different geometries get different energies
+    """
+    shift = 1.0 + (int(hashlib.md5(("%s %s" % (functional, basis)).encode()).hexdigest()[:6], 16) % 1000) * 1e-6
+    energy = shift * sum(atomic_energies.get(e, -10.0) for e in elements)
+    for i in range(len(coords)):
+        for j in range(i):
+            energy -= 0.01 * math.exp(-0.5 * math.dist(coords[i], coords[j]))
+    return energy
+
+
+def control_groups(path="control"):
+    groups = {}
+    current = None
+    with open(path, "r") as fp:
+        for line in fp:
+            if line.startswith("$"):
+                current = line.split()[0]
+                groups[current] = [line.rstrip("\n")]
+            elif current is not None:
+                groups[current].append(line.rstrip("\n"))
+    return groups
+
+
+def define():
+    answers = sys.stdin.read()
+    elements, _ = read_coord()
+    seconds = sleep_time("define", len(elements))
+    time.sleep(seconds)
+
+    lines = answers.splitlines()
+    basis = "def-SV(P)"
+    iterations = 30
+    for i, line in enumerate(lines):
+        if line.startswith("b all "):
+            basis = line.split()[2]
+        elif line == "iter" and i + 1 < len(lines):
+            iterations = int(lines[i + 1])
+    dft = "dft\non" in answers
+    ri = "ri\non" in answers
+
+    control = ["$title", "$symmetry c1", "$user-defined bonds    file=coord", "$coord    file=coord", "$atoms"]
+    for element in sorted(set(elements)):
+        indices = [str(i + 1) for i, e in enumerate(elements) if e == element]
+        control.append("%-3s%s" % (element, ",".join(indices)))
+        control.append("   basis =%s %s" % (element, basis))
+        if ri:
+            control.append("   jbas  =%s universal" % (element))
+    control += ["$basis    file=basis",
+                "$rundimensions",
+                "   natoms=%i" % (len(elements)),
+                "$scfmo   file=mos",
+                "$closed shells",
+                " a       1-%i                                   ( 2 )" % (max(1, len(elements) // 2)),
+                "$scfiterlimit      %i" % (iterations),
+                "$scfconv        5",
+                "$scfdamp   start=0.300  step=0.050  min=0.100",
+                "$energy    file=energy",
+                "$grad    file=gradient",
+                "$last step     define"]
+    if dft:
+        control += ["$dft", "   functional b-p", "   gridsize   m3"]
+    if ri:
+        control += ["$rij", "$jbas    file=auxbasis", "$ricore     1500"]
+    with open("control", "w") as fp:
+        fp.write("\n".join(control) + "\n$end\n")
+    for name in ("basis", "auxbasis", "mos"):
+        with open(name, "w") as fp:
+            fp.write("$%s\n$end\n" % (name))
+    print(" define : TURBOMOLE stand-in of the orchestration benchmarks")
+    sys.stderr.write(" define ended normally\n")
+    log_run("define", len(elements), seconds)
+
+
+def scf(program):
+    elements, coords = read_coord()
+    groups = control_groups()
+    functional = groups["$dft"][1].split()[1] if "$dft" in groups else "hf"
+    basis = groups["$atoms"][2].split()[2] if "$atoms" in groups else "def-SV(P)"
+    limit = int(groups["$scfiterlimit"][0].split()[1]) if "$scfiterlimit" in groups else 30
+    seconds = sleep_time(program, len(elements))
+
+    energy = model_energy(elements, coords, functional, basis)
+    # seeded by the calculation, a rerun of the same calculation fails the same way
+    rng = random.Random(hashlib.md5(open("coord").read().encode() + functional.encode() + basis.encode()).hexdigest())
+    converges = rng.random() >= float(os.environ.get("FAKE_QM_FAIL_RATE", "0.0"))
+    iterations = min(limit, 8 + len(elements) // 10) if converges else limit
+
+    start = time.time()
+    print(" %s : TURBOMOLE stand-in of the orchestration benchmarks" % (program))
+    print("            %i atoms, functional %s, basis %s" % (len(elements), functional, basis))
+    print("")
+    print(" ITERATION  ENERGY          1e-ENERGY        2e-ENERGY     NORM[dD(SAO)]  TOL", flush=True)
+    for iteration in range(1, iterations + 1):
+        # the iterations are written as they happen, for the SCF monitor
+        time.sleep(seconds / iterations)
+        deviation = 0.5 ** iteration if converges else 1e-3 * (1 + rng.random())
+        density = 0.0 if iteration == 1 else 2.0 * deviation
+        one_electron = 2.5 * energy
+        line = "  %3i  %.10f    %.10f     %.10f    %.3E %.3E" % (iteration, energy + deviation, one_electron,
+                                                                   energy + deviation - one_electron, density, 1e-10)
+        print(line.replace("E", "D"), flush=True)
+    seconds = time.time() - start
+
+    if not converges:
+        print(" ATTENTION: %s did not converge!" % (program))
+        log_run(program, len(elements), seconds)
+        sys.exit(1)
+    print(" convergence criteria satisfied after %5i iterations" % (iterations))
+    print("")
+    print("                  ------------------------------------------")
+    print("                 |  total energy      = %19.11f  |" % (energy))
+    print("                  ------------------------------------------")
+    if "$pop" in groups:
+        print("")
+        print("     atom      charge    n(s)      n(p)      n(d)")
+        charges = [0.1 * math.sin(sum(c)) for c in coords]
+        mean = sum(charges) / len(charges)
+        for i, (element, charge) in enumerate(zip(elements, charges)):
+            print("%5i  %-2s %8.5f   0.00000   0.00000   0.00000" % (i + 1, element, charge - mean))
+    with open("energy", "w") as fp:
+        fp.write("$energy      SCF               SCFKIN            SCFPOT\n")
+        fp.write("     1  %18.11f  %18.11f  %18.11f\n" % (energy, -energy, 2 * energy))
+        fp.write("$end\n")
+    print("")
+    print(" %s : all done" % (program))
+    log_run(program, len(elements), seconds)
+
+
+def eiger():
+    elements, _ = read_coord()
+    seconds = sleep_time("eiger", len(elements))
+    time.sleep(seconds)
+    energy = None
+    with open("energy", "r") as fp:
+        for line in fp:
+            if not line.startswith("$"):
+                energy = float(line.split()[1])
+    homo = max(1, len(elements) // 2)
+    print(" eiger : TURBOMOLE stand-in of the orchestration benchmarks")
+    print("")
+    print("    Total energy  =  %18.10f H  =  %16.5f eV" % (energy, energy * HToeV))
+    print("")
+    print("          Nr.   Orbital    Occupation    Energy")
+    print("    HOMO: %4i  %5i a        2.000  %10.5f H = %10.4f eV" % (homo, homo, -0.3, -0.3 * HToeV))
+    print("    LUMO: %4i  %5i a        0.000  %10.5f H = %10.4f eV" % (homo + 1, homo + 1, 0.05, 0.05 * HToeV))
+    log_run("eiger", len(elements), seconds)
+
+
+def xtb(args):
+    elements, coords = read_xyz([a for a in args if a.endswith(".xyz")][0])
+    seconds = sleep_time("xtb", len(elements))
+    time.sleep(seconds)
+    energy = model_energy(elements, coords, "gfn2", "xtb") / 8.0
+    print("      -----------------------------------------------------------")
+    print("     |                   x T B   (orchestration benchmark stand-in)  |")
+    print("      -----------------------------------------------------------")
+    print("")
+    print("           -------------------------------------------------")
+    print("          | TOTAL ENERGY            %20.12f Eh   |" % (energy))
+    print("          | GRADIENT NORM               0.000000000000 Eh/α |")
+    print("           -------------------------------------------------")
+    if "--grad" in args:
+        with open("gradient", "w") as fp:
+            fp.write("$grad\n  cycle =      1    SCF energy =   %.10f   |dE/dxyz| =  0.000000\n" % (energy))
+            for element, c in zip(elements, coords):
+                fp.write("   %.14E   %.14E   %.14E      %s\n" % (c[0] * AToBohr, c[1] * AToBohr, c[2] * AToBohr, element))
+            for _ in coords:
+                fp.write("   %.14E   %.14E   %.14E\n" % (0.0, 0.0, 0.0))
+            fp.write("$end\n")
+    if "--opt" in args or "--ohess" in args:
+        with open("xtbopt.xyz", "w") as fp:
+            fp.write("%i\n energy: %.12f\n" % (len(elements), energy))
+            for element, c in zip(elements, coords):
+                fp.write("%s %.8f %.8f %.8f\n" % (element.capitalize(), c[0], c[1], c[2]))
+    sys.stderr.write(" normal termination of xtb\n")
+    log_run("xtb", len(elements), seconds)
+
+
+def main(program):
+    if program == "define":
+        define()
+    elif program in ("ridft", "dscf"):
+        scf(program)
+    elif program == "eiger":
+        eiger()
+    elif program == "xtb":
+        xtb(sys.argv[1:])
+    else:
+        raise ValueError("no stand-in for %s" % (program))
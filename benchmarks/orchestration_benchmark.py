@@ -0,0 +1,227 @@
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repo_dir)
+
+import utils.cores as cores
+import utils.metrics as metrics
+import utils.xyz_utils as xyz
+
+# End-to-end benchmark of the orchestration: create_placeholder_categories.py and calculate_energies_for_categories.py
+# run as they do in production, but with the stand-in programs of benchmarks/bin first in PATH (see fake_qm.py).
+# The stand-ins sleep instead of computing and log how long, so everything else a calculation takes is overhead
+# of this repository: starting the programs, preparing and reading files, caches, journals, the pool.
+#
+#   python benchmarks/orchestration_benchmark.py --workers 1 2 4 --num_molecules 40
+#
+# reports per worker count the calculations per second, the mean overhead per calculation and the speedup over
+# the first worker count, and exits with status 1 if the overhead per calculation of the first worker count
+# exceeds the stored baseline (benchmarks/baseline.json) by more than the tolerance.
+# --update_baseline stores the measured overhead instead, the baseline is specific to a machine.
+
+bin_dir = os.path.join(repo_dir, "benchmarks", "bin")
+default_baseline = os.path.join(repo_dir, "benchmarks", "baseline.json")
+default_flavours = os.path.join(repo_dir, "input_files", "small_flavours.json")
+default_pool_sources = [os.path.join(repo_dir, "input_files", name)
+                        for name in ("Ala_cap_rad.xyz", "alaala_alaala.xyz", "alathr_valval_alaala.xyz")]
+
+
+def write_pool(filename, num_frames, sources=default_pool_sources, noise=0.05, seed=0):
+    """
+    Writes a pool of num_frames geometries, randomly displaced copies of the frames of the source files
+    """
+    coords_sources, elements_sources = [], []
+    for source in sources:
+        coords, elements = xyz.readXYZs(source)
+        coords_sources.extend(coords)
+        elements_sources.extend(elements)
+    rng = np.random.default_rng(seed)
+    picks = rng.integers(len(coords_sources), size=num_frames)
+    coords = [coords_sources[i] + rng.normal(scale=noise, size=np.shape(coords_sources[i])) for i in picks]
+    xyz.exportXYZs(coords, [elements_sources[i] for i in picks], filename)
+
+
+def run_step(argv, cwd, env, output_file):
+    """
+    Runs one of the scripts of the pipeline, its output goes to output_file
+    :return: wall time in seconds
+    """
+    start = time.time()
+    with open(output_file, "a") as fp:
+        completed = subprocess.run([sys.executable] + argv, cwd=cwd, env=env, stdout=fp, stderr=subprocess.STDOUT)
+    if completed.returncode != 0:
+        raise RuntimeError("%s failed with exit code %i, see %s" % (os.path.basename(argv[0]), completed.returncode,
+                                                                   output_file))
+    return time.time() - start
+
+
+def summarize(output_dir, fake_log):
+    """
+    :return: calculations, workers, calculations per second, overhead per calculation and the like of one run
+    """
+    records = metrics.read_metrics(os.path.join(output_dir, "metrics"))
+    if len(records) == 0:
+        raise RuntimeError("no metrics records in %s" % (output_dir))
+    with open(fake_log, "r") as fp:
+        program_runs = [json.loads(line) for line in fp]
+    span = max(r["start"] + r["wall_time"] for r in records) - min(r["start"] for r in records)
+    program_seconds = sum(run["seconds"] for run in program_runs)
+    between = [r["between_jobs"] for r in records if r.get("between_jobs") is not None]
+    outcomes = {}
+    for r in records:
+        outcomes[r["outcome"]] = outcomes.get(r["outcome"], 0) + 1
+    # the most calculations running at the same time, the pools of the tasks may come and go
+    events = sorted([(r["start"], 1) for r in records] + [(r["start"] + r["wall_time"], -1) for r in records])
+    concurrency = np.cumsum([change for _, change in events])
+    return {"calculations": len(records),
+            "workers": int(np.max(concurrency)),
+            "outcomes": outcomes,
+            "program_runs": len(program_runs),
+            "span": span,
+            "calculations_per_second": len(records) / span,
+            "mean_wall_time": float(np.mean([r["wall_time"] for r in records])),
+            "mean_program_time": program_seconds / len(records),
+            # everything a calculation takes besides the simulated work of the programs
+            "overhead_per_calculation": (sum(r["wall_time"] for r in records) - program_seconds) / len(records),
+            "mean_between_jobs": float(np.mean(between)) if len(between) > 0 else None}
+
+
+def run_benchmark(work_dir, num_workers, num_molecules, flavour_file=default_flavours, pool_size=None,
+                  qm_method="dft", scale=1.0, fail_rate=0.0, calc_args=(), seed=0):
+    """
+    Runs the pipeline once per number of workers on the same placeholder categories
+    :param calc_args: further arguments of calculate_energies_for_categories.py, e.g. ["--define_cache"]
+    :return: list of the summaries of the runs
+    """
+    os.makedirs(work_dir, exist_ok=True)
+    pool = os.path.join(work_dir, "pool.xyz")
+    write_pool(pool, pool_size or max(100, 2 * num_molecules), seed=seed)
+    env = dict(os.environ, PATH=bin_dir + os.pathsep + os.environ.get("PATH", ""), FAKE_QM_SCALE=str(scale),
+               FAKE_QM_FAIL_RATE=str(fail_rate))
+
+    summaries = []
+    for workers in num_workers:
+        run_dir = os.path.join(work_dir, "workers_%i" % (workers))
+        if os.path.exists(run_dir):
+            shutil.rmtree(run_dir)
+        os.makedirs(run_dir)
+        output_file = os.path.join(run_dir, "pipeline.out")
+        env["FAKE_QM_LOG"] = os.path.join(run_dir, "programs.jsonl")
+        run_step([os.path.join(repo_dir, "create_placeholder_categories.py"), flavour_file, pool, str(num_molecules),
+                  "placeholder", "--seed", str(seed)], run_dir, env, output_file)
+        wall_time = run_step([os.path.join(repo_dir, "calculate_energies_for_categories.py"), "placeholder", "output",
+                              str(workers), "--qm_method", qm_method, "--log_level", "WARNING"] + list(calc_args),
+                             run_dir, env, output_file)
+        summary = summarize(os.path.join(run_dir, "output"), env["FAKE_QM_LOG"])
+        summary.update({"requested_workers": workers, "pipeline_wall_time": wall_time})
+        summaries.append(summary)
+        print("%3i workers: %4i calculations in %7.2fs, %6.2f calculations/s, overhead %6.1f ms per calculation"
+              % (workers, summary["calculations"], summary["span"], summary["calculations_per_second"],
+                 1e3 * summary["overhead_per_calculation"]), flush=True)
+    return summaries
+
+
+def print_report(summaries):
+    reference = summaries[0]
+    print("%8s %8s %8s %10s %12s %12s %10s %9s %11s" % ("workers", "used", "calcs", "calcs/s", "overhead ms",
+                                                        "program ms", "between ms", "speedup", "efficiency"))
+    for s in summaries:
+        speedup = s["calculations_per_second"] / reference["calculations_per_second"]
+        efficiency = speedup * reference["workers"] / s["workers"]
+        between = "-" if s["mean_between_jobs"] is None else "%.1f" % (1e3 * s["mean_between_jobs"])
+        print("%8i %8i %8i %10.2f %12.1f %12.1f %10s %9.2f %11.2f" % (
+            s["requested_workers"], s["workers"], s["calculations"], s["calculations_per_second"],
+            1e3 * s["overhead_per_calculation"], 1e3 * s["mean_program_time"], between, speedup, efficiency))
+    for s in summaries:
+        failed = {k: v for k, v in s["outcomes"].items() if k != "ok"}
+        if len(failed) > 0:
+            print("%i workers: calculations that did not finish ok: %s" % (s["requested_workers"], failed))
+
+
+def check_baseline(summaries, baseline_file, qm_method, tolerance, settings):
+    """
+    :return: True if the overhead per calculation of the first run is within tolerance of the baseline
+    """
+    if not os.path.exists(baseline_file):
+        print("No baseline in %s, run with --update_baseline to store one" % (baseline_file))
+        return True
+    with open(baseline_file, "r") as fp:
+        baseline = json.load(fp).get(qm_method)
+    if baseline is None:
+        print("No baseline for %s in %s" % (qm_method, baseline_file))
+        return True
+    differing = sorted(key for key in settings if baseline.get(key) != settings[key])
+    if len(differing) > 0:
+        print("WARNING: the baseline was measured with different %s" % (", ".join(differing)))
+    measured = summaries[0]["overhead_per_calculation"]
+    limit = baseline["overhead_per_calculation"] * (1.0 + tolerance)
+    print("Overhead per calculation: %.1f ms, baseline %.1f ms, limit %.1f ms"
+          % (1e3 * measured, 1e3 * baseline["overhead_per_calculation"], 1e3 * limit))
+    return measured <= limit
+
+
+def update_baseline(summaries, baseline_file, qm_method, settings):
+    baseline = {}
+    if os.path.exists(baseline_file):
+        with open(baseline_file, "r") as fp:
+            baseline = json.load(fp)
+    baseline[qm_method] = dict(settings, overhead_per_calculation=summaries[0]["overhead_per_calculation"],
+                               calculations_per_second=summaries[0]["calculations_per_second"],
+                               workers=summaries[0]["requested_workers"])
+    with open(baseline_file, "w") as fp:
+        json.dump(baseline, fp, indent=4)
+    print("Stored the baseline of %s in %s" % (qm_method, baseline_file))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, nargs='+', default=None,
+                        help="worker counts to run, the first one is compared to the baseline "
+                             "(default: 1, 2, 4, ... up to the available CPUs)")
+    parser.add_argument('--num_molecules', type=int, default=20, help="molecules per category")
+    parser.add_argument('--flavour_file', default=default_flavours)
+    parser.add_argument('--pool_size', type=int, default=None, help="geometries in the generated pool")
+    parser.add_argument('--qm_method', default="dft", choices=["dft", "xtb"])
+    parser.add_argument('--scale', type=float, default=1.0, help="factor of the sleep times of the stand-in programs")
+    parser.add_argument('--fail_rate', type=float, default=0.0, help="fraction of SCFs that do not converge")
+    parser.add_argument('--calc_args', nargs=argparse.REMAINDER, default=[],
+                        help="further arguments of calculate_energies_for_categories.py, must come last")
+    parser.add_argument('--work_dir', default=None, help="directory of the runs, kept (default: a temporary directory)")
+    parser.add_argument('--baseline', default=default_baseline)
+    parser.add_argument('--tolerance', type=float, default=0.5,
+                        help="allowed relative increase of the overhead per calculation over the baseline")
+    parser.add_argument('--update_baseline', action='store_true')
+    parser.add_argument('--report', default=None, help="JSON file to write the summaries to")
+    args = parser.parse_args()
+
+    num_workers = args.workers
+    if num_workers is None:
+        num_cpus = len(cores.available_cpus())
+        num_workers = [2 ** i for i in range(num_cpus.bit_length()) if 2 ** i <= num_cpus]
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="orchestration_benchmark_")
+    try:
+        summaries = run_benchmark(work_dir, num_workers, args.num_molecules, flavour_file=args.flavour_file,
+                                  pool_size=args.pool_size, qm_method=args.qm_method, scale=args.scale,
+                                  fail_rate=args.fail_rate, calc_args=args.calc_args)
+    finally:
+        if args.work_dir is None:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    print_report(summaries)
+    if args.report is not None:
+        with open(args.report, "w") as fp:
+            json.dump(summaries, fp, indent=4)
+
+    settings = {"num_molecules": args.num_molecules, "flavour_file": os.path.basename(args.flavour_file),
+                "scale": args.scale, "calc_args": args.calc_args}
+    if args.update_baseline:
+        update_baseline(summaries, args.baseline, args.qm_method, settings)
+    elif not check_baseline(summaries, args.baseline, args.qm_method, args.tolerance, settings):
+        sys.exit("The overhead per calculation regressed past the baseline")
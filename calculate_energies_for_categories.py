@@ -1,23 +1,80 @@
 import argparse
+import logging
 import os
 import shutil
+import time
 import numpy as np
-from parallel_qm import find_all_task_dirs, calculate_energies_for_task
+import utils.claims as claims
+import utils.log as log
+import utils.result_cache as result_cache
+import utils.scf_monitor as scf_monitor
+from parallel_qm import find_all_task_dirs, calculate_energies_for_task, calculate_energies_for_tasks, estimate_run, \
+    order_tasks_by_cost
+from utils.scratch import scratch_root
 
+logger = logging.getLogger(__name__)
 
-def calculate_energies_for_categories(temp_dir, output_dir, num_workers):
+
+def calculate_energies_for_categories(temp_dir, output_dir, num_workers, global_pool=False, define_cache=False,
+                                      warm_start=False, threads_per_calc=None, scratch=False, archive=False,
+                                      keep_files=None, result_store=False, result_cache_dir=None,
+                                      result_cache_max_gb=None, result_cache_max_age_days=None, timings_file=None,
+                                      dry_run=False, log_level="INFO", distributed=False, lease_timeout=600,
+                                      backend="process", timeout_factor=None, min_timeout=600, speculative=False,
+                                      scf_monitor_thresholds=None, run_eiger=True, qm_method="dft"):
     """
     :param temp_dir: Path to the directory storing the temporary placeholder categories
     :param output_dir: Where to store the dataset
     :param num_workers: The number of workers / number of parallel executions
+    :param global_pool: If True, the molecules of all tasks share one global queue drained by one persistent pool
+    :param define_cache: If True, define runs once per flavour and element composition and is reused for all molecules
+    :param warm_start: If True, converged orbitals are kept and seed later flavours of the same geometry and basis.
+                       The tasks are run cheapest flavour first. In the global pool mode, the other flavours of a
+                       geometry and basis wait for its cheapest flavour. In the distributed mode this is best-effort:
+                       an expensive task that another launch claims while the cheap one still runs gets no seeds.
+    :param threads_per_calc: Threads of each QM calculation, None to split the CPU allocation equally between the workers
+    :param scratch: If True, the calculations run in per-worker directories on the node-local scratch disk ($TMPDIR)
+                    and the calculation directories are copied back to the working directory in the background
+    :param archive: If True, the calculation directories are appended to compressed per-task archives in output_dir/archives
+                    instead of being kept as loose files
+    :param keep_files: Names of the files of each calculation directory to keep, None to keep all files
+    :param result_store: If True, every result is also appended to the consolidated result store in output_dir/results
+    :param result_cache_dir: Directory of a persistent result cache shared between runs, None for no cache
+    :param result_cache_max_gb: Size limit of the result cache, enforced before the run
+    :param result_cache_max_age_days: Cache entries unused for longer than this are evicted before the run
+    :param timings_file: File that the wall times of the calculations are appended to and that calibrates the cost
+                         model ordering the jobs longest-first, None for output_dir/timings.jsonl
+    :param dry_run: If True, only print the predicted CPU-hours and makespan of the run and calculate nothing
+    :param log_level: INFO for one line per calculation, DEBUG for the full coordinates, settings and results.
+                      The workers log to their own files in output_dir/logs.
+    :param distributed: If True, any number of launches can share temp_dir (e.g. on several nodes). Each one claims
+                        one task at a time and stays until all tasks are done, to take over the tasks of dead launches.
+    :param lease_timeout: Seconds after which the task of a launch that stopped renewing its lease is reclaimed
+    :param backend: "process" for a pool of worker processes, "thread" for a pool of threads in this process that
+                    only drive the external programs (no Python process per worker)
+    :param timeout_factor: If given, a calculation is killed after timeout_factor times its predicted wall time
+                           and recorded with the outcome "timeout" (its energy stays None and is retried by a later run)
+    :param min_timeout: Lower bound in seconds of the wall-clock limit of a calculation
+    :param speculative: If True, workers that go idle at the end of the queue start a second copy of the longest
+                        running calculation and the copy that finishes first is kept
+    :param scf_monitor_thresholds: If given, the SCF output is followed while it runs and calculations that diverge,
+                                   stall or oscillate are killed, with these thresholds differing from
+                                   scf_monitor.default_thresholds ({} for the defaults). The abort reason is the
+                                   outcome of the calculation in the metrics.
+    :param run_eiger: If False, eiger does not run after the SCF and the energy is read from the energy file,
+                      converted to eV with the factor of this repository instead of the one of eiger
+    :param qm_method: "dft" for Turbomole with the functional and basis of each task, "xtb" for cheap GFN2-xTB labels
     """
     path_to_temp_tasks = os.path.join(temp_dir, "tasks")
     path_to_finished_tasks = os.path.join(output_dir, "tasks")
 
-    if not os.path.exists(path_to_finished_tasks):
-        os.makedirs(path_to_finished_tasks)
+    if not dry_run:
+        os.makedirs(path_to_finished_tasks, exist_ok=True)
+    log.setup_logging(log_level, log_dir=None if dry_run else os.path.join(output_dir, "logs"))
+    if timings_file is None:
+        timings_file = os.path.join(output_dir, "timings.jsonl")
 
-    base_settings = {"qm_method": "dft",
+    base_settings = {"qm_method": qm_method,
                      "delete_calculation_dirs": False,
                      "copy_mos": False,
                      "use_dispersions": True,
@@ -25,35 +82,176 @@ def calculate_energies_for_categories(temp_dir, output_dir, num_workers):
                      "partial_chrg": False,
                      "unp_el": 1,
                      "h20": False,
+                     "threads_per_calc": threads_per_calc,
+                     "keep_files": keep_files,
+                     "backend": backend,
+                     "timeout_factor": timeout_factor,
+                     "min_timeout": min_timeout,
+                     "speculative": speculative,
+                     "scf_monitor": scf_monitor_thresholds,
+                     "run_eiger": run_eiger,
+                     "timings_file": os.path.abspath(timings_file),
+                     # one record of phase timings per calculation, summarized by metrics_report.py
+                     "metrics_dir": os.path.abspath(os.path.join(output_dir, "metrics")),
                      }
+    if define_cache:
+        base_settings["define_cache_dir"] = os.path.abspath(os.path.join(temp_dir, "define_cache"))
+    if result_cache_dir is not None:
+        base_settings["result_cache_dir"] = os.path.abspath(result_cache_dir)
+    if result_cache_dir is not None and not dry_run:
+        result_cache.evict(base_settings["result_cache_dir"],
+                           max_bytes=None if result_cache_max_gb is None else result_cache_max_gb * 1e9,
+                           max_age_days=result_cache_max_age_days)
+    if result_store:
+        base_settings["result_store_dir"] = os.path.abspath(os.path.join(output_dir, "results"))
+    if archive:
+        base_settings["archive_dir"] = os.path.abspath(os.path.join(output_dir, "archives"))
+    if scratch:
+        base_settings["scratch_dir"] = scratch_root()
+    if warm_start:
+        base_settings["warm_start_dir"] = os.path.abspath(os.path.join(temp_dir, "warm_start"))
 
     all_todo_task_dirs = find_all_task_dirs(path_to_temp_tasks)
-    print("All of the task dir to be calculated are:", all_todo_task_dirs)
+    if warm_start:
+        all_todo_task_dirs = [os.path.basename(path) for path in order_tasks_by_cost(
+            [os.path.join(path_to_temp_tasks, task_dir) for task_dir in all_todo_task_dirs])]
+    logger.info("All of the task dir to be calculated are: %s", all_todo_task_dirs)
 
-    for task_dir in all_todo_task_dirs:
-        print("Task to be calculated directory ", task_dir)
-        path_task_todo_dir = os.path.join(path_to_temp_tasks, task_dir)
+    if dry_run:
+        estimate_run(paths_to_tasks=[os.path.join(path_to_temp_tasks, task_dir) for task_dir in all_todo_task_dirs],
+                     settings=base_settings,
+                     number_of_workers=num_workers)
+        return
+
+    def finish_task(path_task_todo_dir, energies):
+        task_dir = os.path.basename(path_task_todo_dir)
         path_task_done_dir = os.path.join(path_to_finished_tasks, task_dir)
-        energies = calculate_energies_for_task(path_to_task=path_task_todo_dir,
-                                               settings=base_settings,
-                                               number_of_workers=num_workers)
-        
         output_file_name = f"labels_01_energies.npy"
-        print("Saving the output files in path: ", path_task_todo_dir, '/', output_file_name)
+        logger.info("Saving the output files in path: %s/%s", path_task_todo_dir, output_file_name)
+        # typed float64 array, failed calculations are NaN
+        energies = np.array([np.nan if e is None else e for e in energies], dtype=np.float64)
         np.save(os.path.join(path_task_todo_dir, output_file_name), energies)
 
         # move task to done
-        print("Moving task to done, from ", path_task_todo_dir, " to ", path_task_done_dir)
+        logger.info("Moving task to done, from %s to %s", path_task_todo_dir, path_task_done_dir)
         shutil.move(path_task_todo_dir, path_task_done_dir)
 
+    if distributed:
+        if global_pool:
+            raise ValueError("the distributed mode claims one task at a time and does not support the global pool")
+        path_to_running = os.path.join(temp_dir, "running")
+        owner = claims.owner_id()
+        heartbeat_interval = lease_timeout / 10
+        while True:
+            claims.reclaim_expired(path_to_running, path_to_temp_tasks, lease_timeout, owner)
+            # in the order of all_todo_task_dirs (reclaimed tasks included), tasks added since the start last
+            task_dirs = find_all_task_dirs(path_to_temp_tasks)
+            task_dirs = [t for t in all_todo_task_dirs if t in task_dirs] + [t for t in task_dirs if t not in all_todo_task_dirs]
+            path_task_todo_dir = claims.claim_task(path_to_temp_tasks, path_to_running, task_dirs, owner)
+            if path_task_todo_dir is None:
+                if len(claims.running_tasks(path_to_running)) == 0:
+                    break
+                # the other launches are still busy, stay to take over their tasks should they die
+                time.sleep(heartbeat_interval)
+                continue
+            heartbeat = claims.Heartbeat(path_task_todo_dir, owner, heartbeat_interval)
+            try:
+                energies = calculate_energies_for_task(path_to_task=path_task_todo_dir,
+                                                       settings=base_settings,
+                                                       number_of_workers=num_workers,
+                                                       lease=heartbeat)
+            finally:
+                heartbeat.stop()
+            if heartbeat.lost or not claims.release_task(path_task_todo_dir, owner):
+                logger.warning("Discarding the results of %s, the task was reclaimed by another launch", path_task_todo_dir)
+                continue
+            finish_task(path_task_todo_dir, energies)
+        logger.info("No tasks left to claim")
+        return
+
+    if global_pool:
+        paths_task_todo_dirs = [os.path.join(path_to_temp_tasks, task_dir) for task_dir in all_todo_task_dirs]
+        calculate_energies_for_tasks(paths_to_tasks=paths_task_todo_dirs,
+                                     settings=base_settings,
+                                     number_of_workers=num_workers,
+                                     finish_task=finish_task)
+        return
+
+    for task_dir in all_todo_task_dirs:
+        logger.info("Task to be calculated directory %s", task_dir)
+        path_task_todo_dir = os.path.join(path_to_temp_tasks, task_dir)
+        energies = calculate_energies_for_task(path_to_task=path_task_todo_dir,
+                                               settings=base_settings,
+                                               number_of_workers=num_workers)
+        finish_task(path_task_todo_dir, energies)
+
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument('temp_dir')
     parser.add_argument('output_dir')
     parser.add_argument('num_workers')
+    parser.add_argument('--global_pool', action='store_true',
+                        help="put the molecules of all tasks into one queue drained by one persistent pool")
+    parser.add_argument('--define_cache', action='store_true',
+                        help="run define once per flavour and element composition instead of once per molecule")
+    parser.add_argument('--warm_start', action='store_true',
+                        help="seed the SCF with the converged orbitals of cheaper flavours of the same geometry and basis")
+    parser.add_argument('--threads_per_calc', type=int, default=None,
+                        help="threads of each QM calculation (default: the CPU allocation split equally between the workers)")
+    parser.add_argument('--scratch', action='store_true',
+                        help="run the calculations on the node-local scratch disk ($TMPDIR) and copy them back in the background")
+    parser.add_argument('--archive', action='store_true',
+                        help="append the calculation directories to compressed per-task archives instead of keeping loose files")
+    parser.add_argument('--keep_files', nargs='+', default=None,
+                        help="files of each calculation directory to keep, e.g. TM.out control (default: all)")
+    parser.add_argument('--result_store', action='store_true',
+                        help="also append every result to the consolidated result store in output_dir/results")
+    parser.add_argument('--result_cache', default=None,
+                        help="directory of a persistent cache of results, reused by all runs that point to it")
+    parser.add_argument('--result_cache_max_gb', type=float, default=None,
+                        help="evict the least recently used cache entries above this size")
+    parser.add_argument('--result_cache_max_age_days', type=float, default=None,
+                        help="evict cache entries unused for longer than this")
+    parser.add_argument('--timings_file', default=None,
+                        help="file of recorded wall times that calibrates the cost model (default: output_dir/timings.jsonl)")
+    parser.add_argument('--dry_run', action='store_true',
+                        help="only print the predicted CPU-hours and makespan, e.g. before submitting to SLURM")
+    parser.add_argument('--log_level', default="INFO", choices=["DEBUG", "INFO", "WARNING", "ERROR"],
+                        help="INFO logs one line per calculation, DEBUG also the full coordinates, settings and results")
+    parser.add_argument('--distributed', action='store_true',
+                        help="let several launches (e.g. SLURM array elements) share temp_dir by claiming one task at a time")
+    parser.add_argument('--lease_timeout', type=float, default=600,
+                        help="seconds after which a task of a launch that stopped sending heartbeats is reclaimed")
+    parser.add_argument('--backend', default="process", choices=["process", "thread"],
+                        help="run the calculations from worker processes or from threads of one coordinator process")
+    parser.add_argument('--timeout_factor', type=float, default=None,
+                        help="kill a calculation after this multiple of its predicted wall time (default: no limit)")
+    parser.add_argument('--min_timeout', type=float, default=600,
+                        help="lower bound in seconds of the wall-clock limit of a calculation")
+    parser.add_argument('--speculative', action='store_true',
+                        help="let idle workers at the end of the queue run a second copy of the longest running calculation")
+    parser.add_argument('--scf_monitor', nargs='*', default=None, metavar="KEY=VALUE",
+                        help="kill SCFs that diverge, stall or oscillate, optionally with thresholds differing from the "
+                             "defaults, e.g. stall_iterations=60 (known: %s)" % (", ".join(scf_monitor.default_thresholds)))
+    parser.add_argument('--skip_eiger', action='store_true',
+                        help="do not run eiger after the SCF, read the energy from the energy file (no eiger.out, HOMO/LUMO)")
+    parser.add_argument('--qm_method', default="dft", choices=["dft", "xtb"],
+                        help="Turbomole DFT with the functional and basis of each task, or xtb for cheap labels")
     args = parser.parse_args()
     print("Calculating energies ...")
     print("main function arguments are: ", args.temp_dir, args.output_dir, args.num_workers)
-    calculate_energies_for_categories(args.temp_dir, args.output_dir, int(args.num_workers))
+    calculate_energies_for_categories(args.temp_dir, args.output_dir, int(args.num_workers),
+                                      global_pool=args.global_pool, define_cache=args.define_cache,
+                                      warm_start=args.warm_start, threads_per_calc=args.threads_per_calc,
+                                      scratch=args.scratch, archive=args.archive, keep_files=args.keep_files,
+                                      result_store=args.result_store, result_cache_dir=args.result_cache,
+                                      result_cache_max_gb=args.result_cache_max_gb,
+                                      result_cache_max_age_days=args.result_cache_max_age_days,
+                                      timings_file=args.timings_file, dry_run=args.dry_run, log_level=args.log_level,
+                                      distributed=args.distributed, lease_timeout=args.lease_timeout,
+                                      backend=args.backend, timeout_factor=args.timeout_factor,
+                                      min_timeout=args.min_timeout, speculative=args.speculative,
+                                      scf_monitor_thresholds=None if args.scf_monitor is None else scf_monitor.parse_thresholds(args.scf_monitor),
+                                      run_eiger=not args.skip_eiger, qm_method=args.qm_method)
     print("Done")
\ No newline at end of file
@@ -2,19 +2,27 @@ import argparse
 import json
 import math
 import os
-import random
 import shutil
 import numpy as np
 
 import utils.xyz_utils as xyz
+import utils.xyz_index as xyz_index
+import utils.sampling as sampling
+import utils.diversity as diversity
 
-def create_placeholder_categories(flavour_file, molecule_xyz_file, num_molecules, output_temp_dir):
+def create_placeholder_categories(flavour_file, molecule_xyz_file, num_molecules, output_temp_dir, overlap=0.0, seed=None,
+                                  sampler="uniform", dedup_rmsd=0.05):
     """
     This function creates placeholder categories that will be used by the next function to create the actual categories.
     :param flavour_file: Stores two lists: all functionals and basis sets. Example file: example_files/func_and_base.json
     :param molecule_xyz_file: Filtered dataset to sample molecules from. Example file: example_files/inputs.xyz
     :param num_molecules: The number of molecules per category
     :param output_temp_dir: The directory that stores the temporary placeholder categories
+    :param overlap: Fraction of the molecules of a category that all categories share
+    :param seed: Seed of the sampling, None for a random seed (which is recorded in info.json either way)
+    :param sampler: "uniform" draws the molecules at random, "diverse" drops near-duplicate frames and picks the
+                    molecules by farthest-point sampling (pools of one molecule, e.g. MD trajectories)
+    :param dedup_rmsd: RMSD in Angstrom below which the diverse sampler treats nearby frames as duplicates
     """
     if os.path.exists(output_temp_dir):
         shutil.rmtree(output_temp_dir)
@@ -45,15 +53,36 @@ def create_placeholder_categories(flavour_file, molecule_xyz_file, num_molecules
     num_flavours = len(dft_flavours)
     print("Found number of flavours is: ", num_flavours)
 
-    num_digits_needed = math.ceil(np.log10(num_flavours))
-    for single_flavour in dft_flavours:
-        # sample X molecules
+    # the frame index lets every flavour seek straight to its sampled frames, compressed pools are read once instead
+    if molecule_xyz_file.endswith((".gz", ".xz")):
         coords_all, elements_all = xyz.readXYZs(molecule_xyz_file)
         assert len(coords_all) == len(elements_all)
         num_all_mol = len(coords_all)
-        sampled_indices = random.sample(range(num_all_mol), int(single_flavour["num_molecules"]))
-        coords = [coords_all[i] for i in sampled_indices]
-        elements = [elements_all[i] for i in sampled_indices]
+    else:
+        pool_index = xyz_index.load_index(molecule_xyz_file)
+        num_all_mol = len(pool_index["offsets"])
+    print("Found number of molecules in the pool is: ", num_all_mol)
+
+    if sampler == "diverse":
+        plan = diversity.plan_diverse_samples(molecule_xyz_file, num_flavours, int(num_molecules), overlap=overlap,
+                                              seed=seed, dedup_rmsd=dedup_rmsd)
+        print("Found number of distinct molecules in the pool is: ", plan["num_unique"])
+    else:
+        plan = sampling.plan_samples(num_all_mol, num_flavours, int(num_molecules), overlap=overlap, seed=seed)
+    print("Sampling with seed %i, %i molecules are shared by all flavours" % (plan["seed"], len(plan["shared_indices"])))
+
+    # every sampled frame is read once, no matter how many flavours use it
+    unique_indices = np.unique(np.concatenate(plan["flavour_indices"]))
+    if molecule_xyz_file.endswith((".gz", ".xz")):
+        frames = {i: (coords_all[i], elements_all[i]) for i in unique_indices}
+    else:
+        coords_unique, elements_unique = xyz_index.read_frames_list(molecule_xyz_file, unique_indices, pool_index)
+        frames = dict(zip(unique_indices, zip(coords_unique, elements_unique)))
+
+    num_digits_needed = math.ceil(np.log10(num_flavours))
+    for single_flavour, sampled_indices in zip(dft_flavours, plan["flavour_indices"]):
+        coords = [frames[i][0] for i in sampled_indices]
+        elements = [frames[i][1] for i in sampled_indices]
 
         task_coord_filename = f"data_01_{single_flavour['functional']}###{single_flavour['basisset']}.xyz"
         task_dir_path = os.path.join(temp_task_dir,
@@ -64,6 +93,16 @@ def create_placeholder_categories(flavour_file, molecule_xyz_file, num_molecules
 
         xyz.exportXYZs(coords, elements, os.path.join(task_dir_path, task_coord_filename))
 
+        # the sampled pool indices of all categories together make up the molecule x flavour matrix
+        single_flavour["sample_indices"] = sampled_indices.tolist()
+        single_flavour["sampling"] = {"pool": os.path.abspath(molecule_xyz_file),
+                                      "num_pool": num_all_mol,
+                                      "seed": plan["seed"],
+                                      "overlap": overlap,
+                                      "num_shared": len(plan["shared_indices"]),
+                                      "sampler": sampler}
+        if sampler == "diverse":
+            single_flavour["sampling"].update({"dedup_rmsd": dedup_rmsd, "num_unique": plan["num_unique"]})
         with open(os.path.join(task_dir_path, "info.json"), 'w') as fp:
             json.dump(single_flavour, fp)
 
@@ -74,8 +113,17 @@ if __name__ == "__main__":
     parser.add_argument('molecule_xyz_file')
     parser.add_argument('num_molecules')
     parser.add_argument('output_temp_dir')
+    parser.add_argument('--overlap', type=float, default=0.0,
+                        help='fraction of the molecules of a category that all categories share (0 to 1)')
+    parser.add_argument('--seed', type=int, default=None, help='seed of the sampling, for reproducible categories')
+    parser.add_argument('--sampler', default="uniform", choices=["uniform", "diverse"],
+                        help='uniform: random molecules, diverse: deduplicated pool and farthest-point sampling '
+                             '(pools of one molecule)')
+    parser.add_argument('--dedup_rmsd', type=float, default=0.05,
+                        help='RMSD (Angstrom) below which the diverse sampler drops nearby frames as duplicates')
     args = parser.parse_args()
     print("Creating placeholder categories ... ")
     create_placeholder_categories(args.flavour_file, args.molecule_xyz_file, int(args.num_molecules),
-                                  args.output_temp_dir)
+                                  args.output_temp_dir, overlap=args.overlap, seed=args.seed,
+                                  sampler=args.sampler, dedup_rmsd=args.dedup_rmsd)
     print("Done")
\ No newline at end of file
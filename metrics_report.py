@@ -0,0 +1,78 @@
+import argparse
+import numpy as np
+
+import utils.metrics as metrics
+
+group_keys = {"functional": lambda r: r.get("functional"),
+              "basis": lambda r: r.get("basis"),
+              "method": lambda r: r.get("method"),
+              "task": lambda r: r.get("task"),
+              "worker": lambda r: r.get("worker"),
+              "outcome": lambda r: r.get("outcome"),
+              "size": lambda r: "%i-%i atoms" % (r["natoms"] // 10 * 10, r["natoms"] // 10 * 10 + 9)}
+
+phases = ["setup", "define", "scf", "eiger", "parse", "finish"]
+
+
+def metrics_report(metrics_dir, group_by):
+    """
+    Prints where the CPU-hours of a run went, summed over groups of calculations
+    :param metrics_dir: metrics directory of a run, e.g. output_dir/metrics
+    :param group_by: keys to group the calculations by, see group_keys
+    :return: the rows of the report
+    """
+    records = metrics.read_metrics(metrics_dir)
+    print("Found %i metrics records in %s" % (len(records), metrics_dir))
+    if len(records) == 0:
+        return []
+
+    groups = {}
+    for r in records:
+        groups.setdefault(tuple(str(group_keys[key](r)) for key in group_by), []).append(r)
+
+    rows = []
+    for group, members in groups.items():
+        wall_times = np.array([r["wall_time"] for r in members])
+        threads = np.array([r.get("threads") or 1 for r in members])
+        phase_times = {p: sum([r["phases"].get(p, 0.0) for r in members]) for p in phases}
+        other = sum(wall_times) - sum(phase_times.values())
+        iterations = [r["scf_iterations"] for r in members if r.get("scf_iterations") is not None]
+        rss = [r["child_max_rss_kb"] for r in members if r.get("child_max_rss_kb") is not None]
+        between = [r["between_jobs"] for r in members if r.get("between_jobs") is not None]
+        rows.append({"group": group,
+                     "calculations": len(members),
+                     "failed": sum([r["outcome"] not in ("ok", "cached", "cancelled") for r in members]),
+                     "cpu_hours": float(np.sum(wall_times * threads)) / 3600,
+                     "mean_wall_time": float(np.mean(wall_times)),
+                     "phase_shares": {p: t / max(sum(wall_times), 1e-12) for p, t in phase_times.items()},
+                     "other_share": other / max(sum(wall_times), 1e-12),
+                     "mean_scf_iterations": float(np.mean(iterations)) if len(iterations) > 0 else None,
+                     "max_rss_mb": max(rss) / 1024 if len(rss) > 0 else None,
+                     "mean_between_jobs": float(np.mean(between)) if len(between) > 0 else None})
+    rows.sort(key=lambda row: row["cpu_hours"], reverse=True)
+
+    total_cpu_hours = sum([row["cpu_hours"] for row in rows])
+    header = "%-40s %6s %6s %10s %6s %9s " % (" / ".join(group_by), "calcs", "failed", "CPU-hours", "share", "mean wall")
+    header += " ".join(["%6s" % (p) for p in phases + ["other"]])
+    header += " %8s %8s %8s" % ("SCF it", "RSS MB", "between")
+    print(header)
+    for row in rows:
+        line = "%-40s %6i %6i %10.3f %5.1f%% %8.1fs " % (" / ".join(row["group"])[:40], row["calculations"], row["failed"],
+                                                        row["cpu_hours"], 100 * row["cpu_hours"] / max(total_cpu_hours, 1e-12),
+                                                        row["mean_wall_time"])
+        line += " ".join(["%5.1f%%" % (100 * row["phase_shares"][p]) for p in phases] + ["%5.1f%%" % (100 * row["other_share"])])
+        line += " %8s %8s %8s" % ("-" if row["mean_scf_iterations"] is None else "%.1f" % (row["mean_scf_iterations"]),
+                                  "-" if row["max_rss_mb"] is None else "%.0f" % (row["max_rss_mb"]),
+                                  "-" if row["mean_between_jobs"] is None else "%.2fs" % (row["mean_between_jobs"]))
+        print(line)
+    print("Total: %i calculations, %.3f CPU-hours" % (len(records), total_cpu_hours))
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('metrics_dir', help="metrics directory of a run, e.g. output_dir/metrics")
+    parser.add_argument('--by', nargs='+', default=["functional", "basis", "size"], choices=sorted(group_keys),
+                        help="keys to group the calculations by")
+    args = parser.parse_args()
+    metrics_report(args.metrics_dir, args.by)
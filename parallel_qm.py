@@ -1,28 +1,169 @@
 import copy
 import json
+import logging
 import os
-from multiprocessing.pool import Pool
+import time
 import numpy as np
 
+import utils.cores as cores
+import utils.cost_model as cost_model
 import utils.dft_utils as dft
+import utils.dispatch as dispatch
+import utils.engine as engine
+import utils.journal as journal
+import utils.metrics as metrics
+import utils.result_store as result_store
+import utils.warm_start as warm_start
 import utils.xtb_utils as xtb
 import utils.xyz_utils as xyz
 
+logger = logging.getLogger(__name__)
+
 dft_settings = {"copy_mos": False,
                 "use_dispersions": True,
                 "turbomole_method": "ridft",
                 "turbomole_basis": "6-311++G**", #  def2-SV(P)  6-311++G**
                 "turbomole_functional": "bmk"} #  BMK?? b3-lyp
 
-def calculate_energies_for_task(path_to_task, settings, number_of_workers):
+def calculate_energies_for_task(path_to_task, settings, number_of_workers, lease=None):
     """
     Function that calculates energies for placeholder categories
     :param path_to_task: path to placeholder category
     :param settings: settings for dft
     :param number_of_workers: number of workers
+    :param lease: claims.Heartbeat of the task in the distributed mode, once the lease is lost the calculations
+                  are stopped and nothing more is written into the task
     :return:
     """
-    print("Calculate energies for task in path: ", path_to_task)
+    logger.info("Calculate energies for task in path: %s", path_to_task)
+    items, coords_all = prepare_task_items(path_to_task, settings)
+    items, energies_done = skip_journaled_items(path_to_task, items)
+    # longest job first, so that no expensive molecule starts last and dominates the makespan
+    calibration = cost_model.calibrate_cost_model(settings.get("timings_file"))
+    items.sort(key=lambda item: predicted_wall_time(item[1], calibration), reverse=True)
+    assign_job_timeouts(items, settings, calibration)
+    logger.debug("Provided items are: %s", items)
+
+    if settings.get("result_store_dir") is not None:
+        store = result_store.ResultStoreWriter(settings["result_store_dir"])
+    else:
+        store = None
+
+    energies = calc_energies_for_items(items, number_of_workers=number_of_workers, coords_all=coords_all,
+                                       path_to_task=path_to_task, energies_all=energies_done,
+                                       threads_per_calc=settings.get("threads_per_calc"), store=store,
+                                       backend=settings.get("backend", "process"),
+                                       speculative=settings.get("speculative", False), lease=lease)
+    if store is not None:
+        store.close()
+
+    return energies
+
+
+def calculate_energies_for_tasks(paths_to_tasks, settings, number_of_workers, finish_task):
+    """
+    Function that calculates energies for several placeholder categories with one persistent pool.
+    The (task, molecule) jobs of all tasks go into one global queue and every task is finished
+    as soon as its last molecule completes.
+    :param paths_to_tasks: paths to placeholder categories
+    :param settings: settings for dft
+    :param number_of_workers: number of workers
+    :param finish_task: called as finish_task(path_to_task, energies) when all molecules of a task are done
+    """
+    pending = {}
+    jobs = []
+    calibration = cost_model.calibrate_cost_model(settings.get("timings_file"))
+    for path_to_task in paths_to_tasks:
+        items, coords_all = prepare_task_items(path_to_task, settings)
+        items, energies_done = skip_journaled_items(path_to_task, items)
+        assign_job_timeouts(items, settings, calibration)
+        pending[path_to_task] = {"coords": coords_all,
+                                 "items": dict(items),
+                                 "energies": energies_done,
+                                 "remaining": len(items)}
+        for identifier, data in items:
+            jobs.append((path_to_task, identifier, data))
+    logger.info("The number of jobs in the global queue is: %i", len(jobs))
+
+    if settings.get("warm_start_dir") is not None:
+        # cheapest flavours first, and the other flavours of a geometry and basis wait for the cheapest one,
+        # so that its converged orbitals are ready when they start
+        jobs.sort(key=lambda job: cost_model.relative_cost(job[2][2]["turbomole_functional"], job[2][2]["turbomole_basis"], job[2][1]))
+        after = warm_start_dependencies([job[2] for job in jobs])
+    else:
+        # longest job first, so that no expensive molecule starts last and dominates the makespan
+        jobs.sort(key=lambda job: predicted_wall_time(job[2], calibration), reverse=True)
+        after = None
+
+    if settings.get("result_store_dir") is not None:
+        store = result_store.ResultStoreWriter(settings["result_store_dir"])
+    else:
+        store = None
+
+    for path_to_task in paths_to_tasks:
+        if pending[path_to_task]["remaining"] == 0:
+            finish_task(path_to_task, pending[path_to_task]["energies"])
+
+    pool, pool_workers = cores.make_pool(number_of_workers, settings.get("threads_per_calc"), settings.get("backend", "process"))
+    with pool:
+        for path_to_task, molidx, results_here in dispatch.imap_unordered(pool, pool_workers, qm_job, jobs, settings.get("speculative", False),
+                                                                                 after=after):
+            task = pending[path_to_task]
+            task["energies"][molidx] = checked_energy(molidx, task["coords"][molidx], results_here)
+            journal.append_to_journal(path_to_task, molidx, task["energies"][molidx])
+            record_job_timing(task["items"][molidx], results_here, task["energies"][molidx])
+            if store is not None:
+                store_result(store, path_to_task, task["items"][molidx], task["energies"][molidx])
+            task["remaining"] -= 1
+            logger.info("Got result for molecule %i of %s: %s", molidx, path_to_task, task["energies"][molidx])
+            if task["remaining"] == 0:
+                finish_task(path_to_task, task["energies"])
+
+        pool.close()
+        pool.join()
+    if store is not None:
+        store.close()
+    logger.info("The global pool finished all %i jobs", len(jobs))
+
+
+def warm_start_dependencies(datas):
+    """
+    Lets every calculation wait for the first calculation of the same geometry and basis (see warm_start.warm_start_key)
+    :param datas: [coords, elements, task_settings] of the calculations, cheapest flavour first
+    :return: for every calculation the index of the calculation it waits for, None for the first ones
+    """
+    first = {}
+    after = []
+    for index, (coords, elements, task_settings) in enumerate(datas):
+        # charge and unpaired electrons as qm_task runs dft_calc
+        key = warm_start.warm_start_key(coords, elements, task_settings, 0, 1)
+        after.append(first.get(key))
+        first.setdefault(key, index)
+    return after
+
+
+def order_tasks_by_cost(paths_to_tasks):
+    """
+    Orders placeholder categories from the cheapest flavour to the most expensive one, by the relative cost
+    of their first molecule, so that with a warm start the cheap flavours of a geometry run first
+    """
+    def task_cost(path_to_task):
+        with open(os.path.join(path_to_task, "info.json"), 'r') as fp:
+            flavour_def = json.load(fp)
+        xyz_file = [x for x in os.listdir(path_to_task) if x.endswith(".xyz")][0]
+        _, elements_all = xyz.readXYZs(os.path.join(path_to_task, xyz_file))
+        return cost_model.relative_cost(flavour_def["functional"], flavour_def["basisset"], elements_all[0])
+
+    return sorted(paths_to_tasks, key=task_cost)
+
+
+def prepare_task_items(path_to_task, settings):
+    """
+    Reads a placeholder category and builds the items to calculate
+    :param path_to_task: path to placeholder category
+    :param settings: settings for dft
+    :return: the items and the coordinates of all molecules
+    """
     # load flavour information from placeholder category dir
     with open(os.path.join(path_to_task, "info.json"), 'r') as fp:
         flavour_def = json.load(fp)
@@ -40,71 +181,241 @@ def calculate_energies_for_task(path_to_task, settings, number_of_workers):
     coords_all, elements_all = xyz.readXYZs(os.path.join(path_to_task, xyz_file))
     assert len(coords_all) == len(elements_all)
     num_calcs = len(coords_all)
-    print("The number of calculations to be performed is:", num_calcs)
+    logger.info("The number of calculations to be performed is: %i", num_calcs)
 
     task_settings = create_flavour_setting(base_settings=settings, flavour_def=flavour_def)
-    print("Task settings are equal to:", task_settings)
+    task_settings["task_name"] = os.path.basename(os.path.normpath(path_to_task))
+    if settings.get("archive_dir") is not None:
+        # the archives live outside the task directory, which is moved to done while copy-backs may still be running
+        task_settings["archive_path"] = os.path.join(settings["archive_dir"], "%s.pack" % (os.path.basename(os.path.normpath(path_to_task))))
+    logger.debug("Task settings are equal to: %s", task_settings)
 
     items = [(i, [coords_all[i], elements_all[i], task_settings]) for i in range(num_calcs)]
-    print("Provided items are: ", items)
-
-    energies = calc_energies_for_items(items, number_of_workers=number_of_workers, coords_all=coords_all)
+    return items, coords_all
 
-    return energies
 
-
-def calc_energies_for_items(items, number_of_workers, coords_all):
+def calc_energies_for_items(items, number_of_workers, coords_all, path_to_task=None, energies_all=None,
+                            threads_per_calc=None, store=None, backend="process", speculative=False, lease=None):
     """
 
     :param items: Items to calculate the energies for
     :param number_of_workers:
     :param coords_all:
+    :param path_to_task: If given, every result is appended to the checkpoint journal of this task as soon as it arrives
+    :param energies_all: Energies that are already known, e.g. from the journal (None for the molecules still to do)
+    :param threads_per_calc: Threads per calculation, None to split the CPU allocation equally between the workers
+    :param store: If given, a ResultStoreWriter that every result is appended to (requires path_to_task)
+    :param backend: "process" for a pool of worker processes, "thread" for a pool of threads of this process
+    :param speculative: If True, idle workers start a second copy of the longest running calculation once all items
+                        have been handed out, and the copy that finishes first is kept
+    :param lease: claims.Heartbeat of the task, None outside of the distributed mode
     :return:
     """
-    with Pool(number_of_workers) as pool:
-        # issues tasks to process pool
-        results = pool.starmap_async(qm_task, items).get()
+    if energies_all is None:
+        energies_all = [None] * len(coords_all)
+    items_by_molidx = dict(items)
 
-        # iterate results
-        energies_all = []
+    pool, pool_workers = cores.make_pool(number_of_workers, threads_per_calc, backend)
+    with pool:
+        # issues tasks to process pool and iterate results as they complete
         # gradients_all = []
-        for molidx, results_here in enumerate(results):
-            print("Got result: {}".format(results_here["energy"]), flush=True)
+        stop = None if lease is None else lease.lost_event
+        for molidx, results_here in dispatch.imap_unordered(pool, pool_workers, qm_item, items, speculative, stop=stop):
+            # a launch that lost the task must not write into it, another launch may be working on it by now
+            if lease is not None and not lease.held():
+                continue
+            logger.info("Got result for molecule %i: %s", molidx, results_here["energy"])
             # sanity check:
-            coords_i = items[molidx][1][0]
+            coords_i = items_by_molidx[molidx][0]
             assert coords_all[molidx] == coords_i
-            diff = np.array(results_here["coords"]) - np.array(coords_all[molidx])
-            if np.max(np.abs(diff)) > 1e-5:
-                print("WARNING: the coordinates of molecule {} do not agree with results".format(molidx))
-                results_here["energy"] = None
-                results_here["gradient"] = None
-            energies_all.append(results_here["energy"])
+            energies_all[molidx] = checked_energy(molidx, coords_all[molidx], results_here)
+            if path_to_task is not None:
+                journal.append_to_journal(path_to_task, molidx, energies_all[molidx])
+            record_job_timing(items_by_molidx[molidx], results_here, energies_all[molidx])
+            if store is not None:
+                store_result(store, path_to_task, items_by_molidx[molidx], energies_all[molidx])
             # gradients_all.append(results_here["gradient"].tolist())
         
         pool.close()
         pool.join()
-        print("The pool finished, yielding ", energies_all)
+        logger.debug("The pool finished, yielding %s", energies_all)
     # process pool is closed automatically
     return energies_all
 
 
+def estimate_run(paths_to_tasks, settings, number_of_workers):
+    """
+    Dry run: predicts the cost of the molecules still to calculate in the placeholder categories
+    without running anything, e.g. to size a SLURM job
+    :param paths_to_tasks: paths to placeholder categories
+    :param settings: settings for dft
+    :param number_of_workers: number of workers the run will use
+    :return: total CPU-hours and makespan in hours
+    """
+    calibration = cost_model.calibrate_cost_model(settings.get("timings_file"))
+    if calibration["num_records"] > 0:
+        print("Cost model calibrated with %i recorded timings" % (calibration["num_records"]))
+    else:
+        logger.warning("No recorded timings in %s, the predictions use the uncalibrated cost model", settings.get("timings_file"))
+    threads = settings.get("threads_per_calc") or 1
+
+    wall_times = []
+    for path_to_task in paths_to_tasks:
+        items, _ = prepare_task_items(path_to_task, settings)
+        items, _ = skip_journaled_items(path_to_task, items)
+        task_wall_times = [predicted_wall_time(data, calibration, threads) for _, data in items]
+        print("%s: %i molecules, %.2f CPU-hours" % (os.path.basename(os.path.normpath(path_to_task)), len(items),
+                                                     sum(task_wall_times) * threads / 3600))
+        wall_times.extend(task_wall_times)
+
+    cpu_hours = sum(wall_times) * threads / 3600
+    makespan_hours = cost_model.simulate_makespan(sorted(wall_times, reverse=True), number_of_workers) / 3600
+    print("Predicted for %i jobs on %i workers with %i threads each: %.2f CPU-hours, makespan %.2f hours, longest job %.2f hours"
+          % (len(wall_times), number_of_workers, threads, cpu_hours, makespan_hours, max(wall_times, default=0) / 3600))
+    return cpu_hours, makespan_hours
+
+
+def predicted_wall_time(data, calibration, threads=1):
+    """
+    Predicted wall time of the calculation of one item
+    """
+    coords, elements, task_settings = data
+    return cost_model.predict_wall_time(task_settings["turbomole_functional"], task_settings["turbomole_basis"], elements,
+                                        method=task_settings["turbomole_method"], threads=threads, calibration=calibration)
+
+
+def assign_job_timeouts(items, settings, calibration):
+    """
+    Gives every item a wall-clock limit of timeout_factor times its predicted wall time, but at least
+    min_timeout seconds. The prediction is for threads_per_calc threads (1 if not set), so the limit
+    errs on the long side.
+    """
+    if settings.get("timeout_factor") is None:
+        return
+    threads = settings.get("threads_per_calc") or 1
+    for identifier, data in items:
+        limit = max(settings.get("min_timeout", 0), settings["timeout_factor"] * predicted_wall_time(data, calibration, threads))
+        data[2] = dict(data[2], job_timeout=limit)
+
+
+def record_job_timing(data, results, energy):
+    """
+    Appends the wall time of a finished calculation to the timings file that calibrates the cost model.
+    Failed calculations and results from the result cache say nothing about the cost and are left out.
+    """
+    coords, elements, task_settings = data
+    if task_settings.get("timings_file") is None or task_settings["qm_method"] != "dft":
+        return
+    if energy is None or results.get("from_cache") or "wall_time" not in results:
+        return
+    cost_model.record_timing(task_settings["timings_file"], task_settings["turbomole_functional"],
+                             task_settings["turbomole_basis"], task_settings["turbomole_method"], elements,
+                             results["threads"], results["wall_time"])
+
+
+def skip_journaled_items(path_to_task, items):
+    """
+    Removes the items whose energy is already in the checkpoint journal of the task
+    :param path_to_task: path to placeholder category
+    :param items: Items of the task
+    :return: the items still to calculate and the list of energies known from the journal
+    """
+    energies_journaled = journal.read_journal(path_to_task)
+    energies_done = [None] * len(items)
+    items_todo = []
+    for identifier, data in items:
+        if energies_journaled.get(identifier) is not None:
+            energies_done[identifier] = energies_journaled[identifier]
+        else:
+            items_todo.append((identifier, data))
+    if len(items_todo) < len(items):
+        logger.info("Found %i finished molecules in the journal of %s", len(items) - len(items_todo), path_to_task)
+    return items_todo, energies_done
+
+
+def checked_energy(molidx, coords, results):
+    """
+    Returns the energy of a result, or None if its coordinates do not agree with the input coordinates
+    """
+    diff = np.array(results["coords"]) - np.array(coords)
+    if np.max(np.abs(diff)) > 1e-5:
+        logger.warning("the coordinates of molecule %i do not agree with results", molidx)
+        results["energy"] = None
+        results["gradient"] = None
+    return results["energy"]
+
+
+def store_result(store, path_to_task, data, energy):
+    """
+    Appends the result of one molecule to the result store
+    """
+    coords, elements, task_settings = data
+    store.append(coords, elements, energy, functional=task_settings["turbomole_functional"],
+                 basis=task_settings["turbomole_basis"], task=os.path.basename(os.path.normpath(path_to_task)))
+
+
+def qm_item(item):
+    """
+    Runs one (identifier, data) item and returns it with its results
+    """
+    identifier, data = item
+    return identifier, qm_task(identifier, data)
+
+
+def qm_job(job):
+    """
+    Runs one (path_to_task, identifier, data) job of the global queue
+    """
+    path_to_task, identifier, data = job
+    return path_to_task, identifier, qm_task(identifier, data)
+
+
 def qm_task(identifier, data):
-    print("Calculating task number: ", identifier)
+    logger.debug("Calculating task number: %i", identifier)
     coords = data[0]
-    print("Provided coordinates for task number", identifier, " are:", coords)
+    logger.debug("Provided coordinates for task number %i are: %s", identifier, coords)
     elements = data[1]
-    print("Provided elements for task number", identifier, " are:", elements)
-    settings = data[2]
-    print("Provided settings for task number", identifier, " are:", settings)
+    logger.debug("Provided elements for task number %i are: %s", identifier, elements)
+    settings = dict(data[2], calculation_name="molecule_%i" % (identifier))
+    logger.debug("Provided settings for task number %i are: %s", identifier, settings)
     
-    if settings["qm_method"] == "xtb":
-        results = xtb.xtb_calc(settings, coords, elements, opt=False, grad=False, hess=False, charge=0, freeze=[])
-    elif settings["qm_method"] == "dft":
-        results = dft.dft_calc(settings, coords, elements, opt=False, grad=False, hess=False, charge=0, freeze=[], partial_chrg=False, unp_el=1, dispersion=dft_settings['use_dispersions'], h20=False)
+    start = time.time()
+    engine.set_deadline(None if settings.get("job_timeout") is None else start + settings["job_timeout"])
+    metrics.start_record(settings.get("metrics_dir"), task=settings.get("task_name"), molidx=identifier,
+                         qm_method=settings["qm_method"], functional=settings.get("turbomole_functional"),
+                         basis=settings.get("turbomole_basis"), method=settings.get("turbomole_method"),
+                         natoms=len(elements), threads=cores.threads_per_calc())
+    try:
+        if settings["qm_method"] == "xtb":
+            # already a job of the pool of the task, one molecule per job like the DFT calculations (no xtb_batch,
+            # whose chunks would need a pool of their own inside this worker)
+            results = xtb.xtb_calc(coords, elements, opt=False, grad=False, hess=False, charge=0, freeze=[],
+                                   scratch_dir=settings.get("scratch_dir"), result_cache_dir=settings.get("result_cache_dir"))
+        elif settings["qm_method"] == "dft":
+            results = dft.dft_calc(settings, coords, elements, opt=False, grad=False, hess=False, charge=0, freeze=[], partial_chrg=False, unp_el=1, dispersion=dft_settings['use_dispersions'], h20=False)
+        else:
+            results = {}
+    except BaseException:
+        metrics.finish_record("error")
+        raise
+    finally:
+        engine.set_deadline(None)
+    results["wall_time"] = time.time() - start
+    results["threads"] = cores.threads_per_calc()
+    if results.get("from_cache"):
+        outcome = "cached"
+    elif results.get("aborted") is not None:
+        # "timeout", or "cancelled" for the slower copy of a job run speculatively
+        outcome = results["aborted"]
     else:
-        results = {}
+        outcome = "ok" if results.get("energy") is not None else "failed"
+    metrics.finish_record(outcome)
     
-    print("Qm task number ", identifier, " finished with results: ", results)
+    # the one line per job at the default level, the full results only at debug level
+    logger.info("%s molecule %i (%s/%s, %i atoms): %s, energy %s, %.1f s", settings.get("task_name"), identifier,
+                settings.get("turbomole_functional"), settings.get("turbomole_basis"), len(elements), outcome,
+                results.get("energy"), results["wall_time"])
+    logger.debug("Qm task number %i finished with results: %s", identifier, results)
     
     return (results)
 
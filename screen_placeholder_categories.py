@@ -0,0 +1,165 @@
+import argparse
+import collections
+import json
+import logging
+import os
+import numpy as np
+
+import utils.cores as cores
+import utils.journal as journal
+import utils.log as log
+import utils.xtb_utils as xtb
+import utils.xyz_utils as xyz
+import utils.xyz_index as xyz_index
+from parallel_qm import find_all_task_dirs
+
+logger = logging.getLogger(__name__)
+
+# Optional stage between create_placeholder_categories.py and calculate_energies_for_categories.py: every sampled
+# geometry is calculated with xtb first, and geometries whose xtb calculation fails or whose energy lies outside
+# a window around the median energy of their composition (overlapping atoms, broken bonds, ...) are replaced by
+# geometries drawn from the rest of the pool that pass the same test. A rejected geometry is replaced by the
+# same geometry in all categories that sampled it, so the shared molecules stay shared.
+
+screening_name = "screening.npz"
+
+
+def formula(elements):
+    counts = collections.Counter(e.capitalize() for e in elements)
+    return "".join("%s%i" % (element, counts[element]) for element in sorted(counts))
+
+
+def xtb_energies(frames, indices, pool, number_of_workers):
+    """
+    xtb energies of the given frames, the frames of the same elements are run as one batch
+    :param frames: dictionary from frame index to (coords, elements)
+    :param pool: pool made by cores.make_pool that runs all batches, with number_of_workers its number of workers
+    :return: dictionary from frame index to energy in eV, NaN for failed calculations
+    """
+    batches = collections.defaultdict(list)
+    for i in indices:
+        batches[tuple(frames[i][1])].append(i)
+    energies = {}
+    for elements, batch in batches.items():
+        energies_batch, _ = xtb.xtb_batch(np.array([frames[i][0] for i in batch]), list(elements),
+                                          number_of_workers=number_of_workers, pool=pool)
+        energies.update(zip(batch, energies_batch))
+    return energies
+
+
+def screen_placeholder_categories(temp_dir, window_above=3.0, window_below=3.0, num_workers=None, threads_per_calc=1,
+                                  pool=None):
+    """
+    Screens the geometries of the placeholder categories with xtb and refills the rejected ones from the pool
+    :param temp_dir: Path to the directory storing the temporary placeholder categories
+    :param window_above: Geometries more than this many eV above the median xtb energy of their composition are rejected
+    :param window_below: Geometries more than this many eV below the median xtb energy of their composition are rejected
+    :param num_workers: The number of parallel xtb runs, None for one per CPU with threads_per_calc threads each
+    :param threads_per_calc: Threads of each xtb run
+    :param pool: pool made by cores.make_pool that runs all xtb batches, with num_workers its number of workers.
+                 None for one pool for the screening and all refill rounds, made here
+    """
+    if pool is None:
+        pool, num_workers = cores.make_pool(num_workers, threads_per_calc)
+        with pool:
+            replacements = screen_placeholder_categories(temp_dir, window_above=window_above,
+                                                         window_below=window_below, num_workers=num_workers,
+                                                         threads_per_calc=threads_per_calc, pool=pool)
+            pool.close()
+            pool.join()
+        return replacements
+    path_to_tasks = os.path.join(temp_dir, "tasks")
+    task_dirs = find_all_task_dirs(path_to_tasks)
+    infos = {}
+    for task_dir in task_dirs:
+        if len(journal.read_journal(os.path.join(path_to_tasks, task_dir))) > 0:
+            raise ValueError("task %s has been started already, screening would change its molecules" % (task_dir))
+        with open(os.path.join(path_to_tasks, task_dir, "info.json"), "r") as fp:
+            infos[task_dir] = json.load(fp)
+    pool_files = set(info["sampling"]["pool"] for info in infos.values())
+    if len(pool_files) != 1:
+        raise ValueError("the categories were sampled from different pools: %s" % (sorted(pool_files)))
+    pool_file = pool_files.pop()
+    sampling = infos[task_dirs[0]]["sampling"]
+
+    sampled = np.unique(np.concatenate([info["sample_indices"] for info in infos.values()]))
+    logger.info("Screening %i sampled geometries of %i categories with xtb", len(sampled), len(task_dirs))
+    frames = xyz_index.read_pool_frames(pool_file, sampled)
+    energies = xtb_energies(frames, sampled, pool, num_workers)
+
+    # the window is centred on the median of the sampled geometries, replacements are judged by the same reference
+    by_formula = collections.defaultdict(list)
+    for i in sampled:
+        if np.isfinite(energies[i]):
+            by_formula[formula(frames[i][1])].append(energies[i])
+    reference = {key: float(np.median(values)) for key, values in by_formula.items()}
+
+    def accepted(i):
+        if not np.isfinite(energies[i]) or formula(frames[i][1]) not in reference:
+            return False
+        return -window_below <= energies[i] - reference[formula(frames[i][1])] <= window_above
+
+    rejected = [int(i) for i in sampled if not accepted(i)]
+    logger.info("Rejected %i of %i geometries, %i failed in xtb", len(rejected), len(sampled),
+                sum(not np.isfinite(energies[i]) for i in sampled))
+
+    # the replacements are drawn reproducibly from the seed of the sampling
+    rng = np.random.default_rng([sampling["seed"], 1])
+    candidates = rng.permutation(np.setdiff1d(np.arange(sampling["num_pool"]), sampled))
+    replacements = {}
+    position = 0
+    while len(replacements) < len(rejected) and position < len(candidates):
+        # a few more than needed, some of them will be rejected as well
+        batch = candidates[position:position + 2 * (len(rejected) - len(replacements)) + 1]
+        position += len(batch)
+        frames.update(xyz_index.read_pool_frames(pool_file, batch))
+        energies.update(xtb_energies(frames, batch, pool, num_workers))
+        for i in batch:
+            if accepted(i) and len(replacements) < len(rejected):
+                replacements[rejected[len(replacements)]] = int(i)
+    if len(replacements) < len(rejected):
+        raise RuntimeError("the pool has only %i geometries left that pass the screening, %i are needed"
+                           % (len(replacements), len(rejected)))
+
+    for task_dir in task_dirs:
+        path_to_task = os.path.join(path_to_tasks, task_dir)
+        info = infos[task_dir]
+        replaced = {str(i): replacements[i] for i in info["sample_indices"] if i in replacements}
+        indices = [replacements.get(i, i) for i in info["sample_indices"]]
+        xyz_files = [x for x in os.listdir(path_to_task) if x.endswith(".xyz")]
+        if len(xyz_files) != 1:
+            raise NotImplementedError
+        xyz.exportXYZs([frames[i][0] for i in indices], [frames[i][1] for i in indices],
+                       os.path.join(path_to_task, xyz_files[0]))
+        info["sample_indices"] = indices
+        info["screening"] = {"method": "xtb",
+                             "window_above": window_above,
+                             "window_below": window_below,
+                             "reference_energies": reference,
+                             "replaced": replaced}
+        with open(os.path.join(path_to_task, "info.json"), "w") as fp:
+            json.dump(info, fp)
+
+    # the xtb energies of all screened geometries, e.g. as cheap labels
+    screened = np.array(sorted(energies), dtype=np.int64)
+    np.savez(os.path.join(temp_dir, screening_name), indices=screened,
+             energies=np.array([energies[i] for i in screened], dtype=np.float64))
+    logger.info("Replaced %i geometries, %i xtb calculations in total", len(replacements), len(screened))
+    return replacements
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('temp_dir')
+    parser.add_argument('--window_above', type=float, default=3.0,
+                        help="reject geometries more than this many eV above the median xtb energy of their composition")
+    parser.add_argument('--window_below', type=float, default=3.0,
+                        help="reject geometries more than this many eV below the median xtb energy of their composition")
+    parser.add_argument('--num_workers', type=int, default=None,
+                        help="parallel xtb runs (default: one per CPU)")
+    parser.add_argument('--threads_per_calc', type=int, default=1, help="threads of each xtb run")
+    parser.add_argument('--log_level', default="INFO", choices=["DEBUG", "INFO", "WARNING", "ERROR"])
+    args = parser.parse_args()
+    log.setup_logging(args.log_level)
+    screen_placeholder_categories(args.temp_dir, window_above=args.window_above, window_below=args.window_below,
+                                  num_workers=args.num_workers, threads_per_calc=args.threads_per_calc)
@@ -0,0 +1,60 @@
+import json
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# the scripts and utils/ are imported from the repository root, as when the scripts are run from there
+sys.path.insert(0, repo_dir)
+
+import utils.xyz_utils as xyz
+from create_placeholder_categories import create_placeholder_categories
+
+
+@pytest.fixture
+def stand_ins(monkeypatch, tmp_path):
+    """
+    Puts the stand-in QM programs of benchmarks/bin first in PATH, without sleeping
+    :return: the environment, e.g. for subprocesses
+    """
+    monkeypatch.setenv("PATH", os.path.join(repo_dir, "benchmarks", "bin") + os.pathsep + os.environ["PATH"])
+    monkeypatch.setenv("FAKE_QM_SCALE", "0")
+    monkeypatch.setenv("FAKE_QM_LOG", str(tmp_path / "programs.jsonl"))
+    return dict(os.environ)
+
+
+@pytest.fixture
+def make_placeholder(tmp_path):
+    """
+    :return: function writing placeholder categories of the given flavours into tmp_path/placeholder, sampled from
+             a pool of displaced copies of input_files/alathr_valval_alaala.xyz
+    """
+    def make(functionals, basissets, num_molecules, overlap=0.0, seed=0):
+        coords, elements = xyz.readXYZs(os.path.join(repo_dir, "input_files", "alathr_valval_alaala.xyz"))
+        rng = np.random.default_rng(seed)
+        num_pool = 2 * num_molecules * len(functionals) * len(basissets)
+        pool = [np.array(coords[i % len(coords)]) + rng.normal(scale=0.05, size=np.shape(coords[i % len(coords)]))
+                for i in range(num_pool)]
+        xyz.exportXYZs(pool, [elements[i % len(coords)] for i in range(num_pool)], str(tmp_path / "pool.xyz"))
+        with open(tmp_path / "flavours.json", "w") as fp:
+            json.dump({"functionals": functionals, "basissets": basissets}, fp)
+        create_placeholder_categories(str(tmp_path / "flavours.json"), str(tmp_path / "pool.xyz"), num_molecules,
+                                      str(tmp_path / "placeholder"), overlap=overlap, seed=seed)
+        return str(tmp_path / "placeholder")
+    return make
+
+
+@pytest.fixture
+def run_categories(tmp_path):
+    """
+    :return: function running calculate_energies_for_categories.py on tmp_path/placeholder, with the output
+             in tmp_path/output and further arguments of the script
+    """
+    def run(env, *args, num_workers=1):
+        subprocess.run([sys.executable, os.path.join(repo_dir, "calculate_energies_for_categories.py"), "placeholder",
+                        "output", str(num_workers), "--log_level", "WARNING"] + list(args),
+                       cwd=str(tmp_path), env=env, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return run
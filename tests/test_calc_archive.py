@@ -0,0 +1,86 @@
+import fcntl
+import multiprocessing
+import os
+import threading
+import time
+
+import pytest
+
+import utils.calc_archive as calc_archive
+
+
+def make_calculation(path, name, files=("TM.out", "control", "mos")):
+    os.makedirs(path, exist_ok=True)
+    for filename in files:
+        with open(os.path.join(path, filename), "w") as fp:
+            fp.write("%s of %s\n" % (filename, name) * 50)
+    return path
+
+
+def test_round_trip(tmp_path):
+    archive = str(tmp_path / "archives" / "T_0.pack")
+    for i in range(3):
+        calc_archive.archive_calculation(archive, "molecule_%i" % (i),
+                                         make_calculation(str(tmp_path / ("calc_%i" % (i))), "molecule_%i" % (i)),
+                                         keep_files=["TM.out", "control"])
+    entries = calc_archive.read_index(archive)
+    assert sorted(entries) == ["molecule_0", "molecule_1", "molecule_2"]
+    assert entries["molecule_1"]["files"] == ["TM.out", "control"]
+    assert calc_archive.read_file(archive, "molecule_1", "control") == "control of molecule_1\n" * 50
+    calc_archive.extract_calculation(archive, "molecule_2", str(tmp_path / "extracted"))
+    assert sorted(os.listdir(tmp_path / "extracted")) == ["TM.out", "control"]
+    assert (tmp_path / "extracted" / "TM.out").read_text() == (tmp_path / "calc_2" / "TM.out").read_text()
+    with pytest.raises(KeyError):
+        calc_archive.read_file(archive, "molecule_3", "control")
+
+
+def test_index_line_cut_short_by_a_crash(tmp_path):
+    archive = str(tmp_path / "T_0.pack")
+    calc_archive.archive_calculation(archive, "molecule_0", make_calculation(str(tmp_path / "calc_0"), "molecule_0"))
+    # a writer died half-way through its blob and index line
+    with open(archive, "ab") as fp:
+        fp.write(b"\x1f\x8b partial blob")
+    with open(calc_archive.index_path(archive), "a") as fp:
+        fp.write('{"name": "molecule_1", "offs')
+    assert sorted(calc_archive.read_index(archive)) == ["molecule_0"]
+
+    calc_archive.archive_calculation(archive, "molecule_2", make_calculation(str(tmp_path / "calc_2"), "molecule_2"))
+    assert sorted(calc_archive.read_index(archive)) == ["molecule_0", "molecule_2"]
+    assert calc_archive.read_file(archive, "molecule_2", "mos") == "mos of molecule_2\n" * 50
+    assert calc_archive.read_file(archive, "molecule_0", "mos") == "mos of molecule_0\n" * 50
+
+
+def test_append_waits_for_the_lock(tmp_path):
+    archive = str(tmp_path / "T_0.pack")
+    calc_dir = make_calculation(str(tmp_path / "calc_0"), "molecule_0")
+    with open(archive, "ab") as pack:
+        fcntl.flock(pack, fcntl.LOCK_EX)
+        writer = threading.Thread(target=calc_archive.archive_calculation, args=(archive, "molecule_0", calc_dir))
+        writer.start()
+        time.sleep(0.3)
+        assert writer.is_alive() and os.path.getsize(archive) == 0
+        fcntl.flock(pack, fcntl.LOCK_UN)
+    writer.join(10)
+    assert not writer.is_alive()
+    assert calc_archive.read_file(archive, "molecule_0", "TM.out") == "TM.out of molecule_0\n" * 50
+
+
+def archive_many(args):
+    archive, calc_root, writer = args
+    for i in range(20):
+        name = "molecule_%i_%i" % (writer, i)
+        calc_archive.archive_calculation(archive, name, make_calculation(os.path.join(calc_root, name), name))
+
+
+def test_writers_append_at_the_same_time(tmp_path):
+    archive = str(tmp_path / "T_0.pack")
+    with multiprocessing.Pool(4) as pool:
+        pool.map(archive_many, [(archive, str(tmp_path / "calcs"), writer) for writer in range(4)])
+    entries = calc_archive.read_index(archive)
+    assert len(entries) == 80
+    # the blobs do not overlap and every one of them reads back
+    spans = sorted((entry["offset"], entry["offset"] + entry["length"]) for entry in entries.values())
+    assert all(end <= next_start for (_, end), (next_start, _) in zip(spans, spans[1:]))
+    assert spans[-1][1] == os.path.getsize(archive)
+    for name in entries:
+        assert calc_archive.read_file(archive, name, "control") == "control of %s\n" % (name) * 50
@@ -0,0 +1,155 @@
+import json
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+from multiprocessing.pool import ThreadPool
+
+import numpy as np
+import utils.claims as claims
+import utils.dispatch as dispatch
+import utils.engine as engine
+import utils.metrics as metrics
+import utils.xyz_utils as xyz
+from create_placeholder_categories import create_placeholder_categories
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def make_tasks(path, names):
+    tasks, running = os.path.join(path, "tasks"), os.path.join(path, "running")
+    for name in names:
+        os.makedirs(os.path.join(tasks, name))
+    return tasks, running
+
+
+def age(path, seconds):
+    past = time.time() - seconds
+    os.utime(path, (past, past))
+
+
+def test_every_task_is_claimed_once(tmp_path):
+    tasks, running = make_tasks(tmp_path, ["T_1", "T_2"])
+    first = claims.claim_task(tasks, running, ["T_1", "T_2"], "a")
+    second = claims.claim_task(tasks, running, ["T_1", "T_2"], "b")
+    assert (os.path.basename(first), os.path.basename(second)) == ("T_1", "T_2")
+    assert claims.claim_task(tasks, running, ["T_1", "T_2"], "c") is None
+    assert claims.lease_owner(first) == "a" and claims.lease_owner(second) == "b"
+    assert sorted(os.listdir(first)) == [claims.lease_name]
+
+
+def test_claim_in_progress_is_not_reclaimed(tmp_path):
+    tasks, running = make_tasks(tmp_path, ["T_1"])
+    # a claimer that has renamed the task but not yet turned its pending lease into lease.json
+    with open(os.path.join(tasks, "T_1", claims.pending_lease_name("a")), "w") as fp:
+        json.dump({"owner": "a"}, fp)
+    age(os.path.join(tasks, "T_1"), 1000)
+    os.makedirs(running)
+    os.rename(os.path.join(tasks, "T_1"), os.path.join(running, "T_1"))
+    assert claims.reclaim_expired(running, tasks, 100, "b") == 0
+
+
+def test_expired_lease_is_reclaimed_and_the_owner_notices(tmp_path):
+    tasks, running = make_tasks(tmp_path, ["T_1"])
+    path_to_task = claims.claim_task(tasks, running, ["T_1"], "a")
+    heartbeat = claims.Heartbeat(path_to_task, "a", 100)
+    try:
+        assert claims.reclaim_expired(running, tasks, 100, "b") == 0
+        assert heartbeat.held()
+        age(os.path.join(path_to_task, claims.lease_name), 1000)
+        assert claims.reclaim_expired(running, tasks, 100, "b") == 1
+        assert os.listdir(running) == []
+        assert not heartbeat.held()
+        assert heartbeat.lost_event.is_set()
+        # the next claimer starts with a lease of its own and is not reclaimed right away
+        path_to_task = claims.claim_task(tasks, running, ["T_1"], "c")
+        assert claims.lease_owner(path_to_task) == "c"
+        assert claims.reclaim_expired(running, tasks, 100, "b") == 0
+        assert claims.release_task(path_to_task, "c")
+    finally:
+        heartbeat.stop()
+
+
+# several launches of calculate_energies_for_categories.py sharing one temp_dir, with the stand-in xtb
+
+def prepare_run(tmp_path, num_flavours=3, num_molecules=4):
+    flavour_file = str(tmp_path / "flavours.json")
+    with open(flavour_file, "w") as fp:
+        json.dump({"functionals": ["f%i" % (i) for i in range(num_flavours)], "basissets": ["def-SVP"]}, fp)
+    coords, elements = xyz.readXYZs(os.path.join(repo_dir, "input_files", "alathr_valval_alaala.xyz"))
+    rng = np.random.default_rng(0)
+    pool = [coords[i % len(coords)] + rng.normal(scale=0.05, size=np.shape(coords[i % len(coords)]))
+            for i in range(2 * num_molecules * num_flavours)]
+    xyz.exportXYZs(pool, [elements[i % len(coords)] for i in range(len(pool))], str(tmp_path / "pool.xyz"))
+    create_placeholder_categories(flavour_file, str(tmp_path / "pool.xyz"), num_molecules,
+                                  str(tmp_path / "placeholder"), seed=0)
+    return dict(os.environ, PATH=os.path.join(repo_dir, "benchmarks", "bin") + os.pathsep + os.environ["PATH"],
+                FAKE_QM_SCALE="1.0", FAKE_QM_COSTS=json.dumps({"xtb": [0.3, 0.0, 1]}))
+
+
+def launch(tmp_path, env, lease_timeout=10):
+    return subprocess.Popen([sys.executable, os.path.join(repo_dir, "calculate_energies_for_categories.py"),
+                             "placeholder", "output", "1", "--distributed", "--qm_method", "xtb",
+                             "--lease_timeout", str(lease_timeout), "--log_level", "WARNING"],
+                            cwd=str(tmp_path), env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                            start_new_session=True)
+
+
+def finished_energies(tmp_path):
+    path_to_done = tmp_path / "output" / "tasks"
+    return {task: np.load(path_to_done / task / "labels_01_energies.npy") for task in os.listdir(path_to_done)}
+
+
+def test_launches_compute_every_molecule_once(tmp_path):
+    env = prepare_run(tmp_path)
+    launches = [launch(tmp_path, env) for _ in range(3)]
+    assert all(process.wait(timeout=240) == 0 for process in launches)
+
+    energies = finished_energies(tmp_path)
+    assert len(energies) == 3
+    assert all(len(e) == 4 and np.all(np.isfinite(e)) for e in energies.values())
+    records = metrics.read_metrics(str(tmp_path / "output" / "metrics"))
+    calculated = sorted((r["task"], r["molidx"]) for r in records)
+    assert len(calculated) == 12 and len(set(calculated)) == 12
+    assert os.listdir(tmp_path / "placeholder" / "tasks") == []
+    assert os.listdir(tmp_path / "placeholder" / "running") == []
+
+
+def test_task_of_a_dead_launch_is_taken_over(tmp_path):
+    env = prepare_run(tmp_path, num_flavours=2)
+    dead = launch(tmp_path, env, lease_timeout=3)
+    running = tmp_path / "placeholder" / "running"
+    deadline = time.time() + 60
+    # killed once it has journaled a molecule of the task it claimed
+    while not any(os.path.exists(running / task / "journal.jsonl") for task in
+                  (os.listdir(running) if os.path.exists(running) else [])):
+        assert time.time() < deadline
+        time.sleep(0.05)
+    os.killpg(dead.pid, signal.SIGKILL)
+    dead.wait()
+
+    launches = [launch(tmp_path, env, lease_timeout=3) for _ in range(2)]
+    assert all(process.wait(timeout=240) == 0 for process in launches)
+    energies = finished_energies(tmp_path)
+    assert len(energies) == 2
+    assert all(len(e) == 4 and np.all(np.isfinite(e)) for e in energies.values())
+
+
+def sleep_job(cwd):
+    try:
+        engine.run(["sleep", "30"], cwd)
+    except engine.CalculationAborted as error:
+        return error.reason
+    return "finished"
+
+
+def test_stop_cancels_the_running_jobs(tmp_path):
+    stop = threading.Event()
+    threading.Timer(0.5, stop.set).start()
+    start = time.time()
+    with ThreadPool(2) as pool:
+        results = list(dispatch.imap_unordered(pool, 2, sleep_job, [str(tmp_path)] * 4, stop=stop))
+    assert results == []
+    assert time.time() - start < 10
@@ -0,0 +1,157 @@
+import shutil
+
+import pytest
+
+import utils.control_file as control_file
+import utils.dft_utils as dft
+
+water = [[0.0, 0.0, 0.0], [0.76, 0.59, 0.0], [-0.76, 0.59, 0.0]]
+elements = ["O", "H", "H"]
+
+
+# the string edits of control before ControlFile, the edited files have to stay the same
+
+def baseline_add_functional(file_path, func):
+    with open(file_path, 'r') as file:
+        lines = file.readlines()
+    with open(file_path, 'w') as file:
+        for line in lines:
+            if 'functional' in line and 'b-p' in line:
+                line = line.replace('b-p', func)
+            file.write(line)
+
+
+def baseline_add_statement(controlfilename, statement):
+    inf = open(controlfilename, 'r')
+    lines = inf.readlines()
+    inf.close()
+    already_in = False
+    outf = open(controlfilename, 'w')
+    for line in lines:
+        if statement.split()[0] in line:
+            already_in = True
+        if len(line.split()) > 0:
+            if line.split()[0] == "$end" and not already_in:
+                outf.write("%s\n" % (statement))
+        outf.write(line)
+    outf.close()
+
+
+def baseline_remove_statement(controlfilename, statement):
+    inf = open(controlfilename, 'r')
+    lines = inf.readlines()
+    inf.close()
+    outf = open(controlfilename, 'w')
+    writeOutput = True
+    for line in lines:
+        if len(line.split()) > 0:
+            if line.split()[0] == statement.split()[0]:
+                writeOutput = False
+            else:
+                writeOutput = True
+        if writeOutput:
+            outf.write(line)
+    outf.close()
+
+
+@pytest.fixture
+def define_control(tmp_path, stand_ins):
+    """
+    :return: function running the stand-in define for a flavour, returns the path of its control file
+    """
+    def run(functional="b-p", basis="def-SVP", method="ridft"):
+        moldir = tmp_path / ("define_%s_%s_%s" % (functional, basis, method))
+        moldir.mkdir()
+        dft.PrepTMInputNormal(str(moldir), water, elements)
+        settings = {"turbomole_functional": functional, "turbomole_basis": basis, "turbomole_method": method}
+        assert dft.ExecuteDefineString(dft.prep_define_file_uhf_1(settings, 0), str(moldir))
+        return str(moldir / "control")
+    return run
+
+
+@pytest.mark.parametrize("functional", ["pbe", "b3-lyp", "HF"])
+@pytest.mark.parametrize("disp, water_model, pop", [(False, False, False), (True, False, False), (True, True, True)])
+def test_same_control_file_as_the_string_edits(tmp_path, define_control, functional, disp, water_model, pop):
+    path = define_control(functional)
+    baseline = str(tmp_path / "control.baseline")
+    shutil.copy(path, baseline)
+
+    baseline_add_functional(baseline, functional)
+    if disp:
+        baseline_add_statement(baseline, "$disp3")
+    if water_model:
+        baseline_add_statement(baseline, "$cosmo")
+        baseline_add_statement(baseline, "   epsilon=78.3")
+    if pop:
+        baseline_add_statement(baseline, "$pop")
+
+    control = control_file.ControlFile.read(path)
+    control.set_functional(functional)
+    if disp:
+        control.add("$disp3")
+    if water_model:
+        control.add("$cosmo")
+        control.add("   epsilon=78.3")
+    if pop:
+        control.add("$pop")
+    control.write(path)
+    with open(path) as fp, open(baseline) as baseline_fp:
+        assert fp.read() == baseline_fp.read()
+    assert control.functional() == (None if functional == "HF" else functional)
+    assert control.basis() == "def-SVP"
+
+
+def test_remove_and_replace_match_the_string_edits_for_single_line_groups(tmp_path, define_control):
+    path = define_control()
+    baseline = str(tmp_path / "control.baseline")
+    shutil.copy(path, baseline)
+    baseline_remove_statement(baseline, "$rij")
+    baseline_remove_statement(baseline, "$last")
+    control = control_file.ControlFile.read(path)
+    control.remove("$rij")
+    control.remove("$last step")
+    assert control.text() == open(baseline).read()
+
+
+def test_remove_takes_the_continuation_lines_along(define_control):
+    # the string edit left "functional b-p" and "gridsize m3" behind, appended to the group before $dft
+    control = control_file.ControlFile.read(define_control())
+    control.remove("$dft")
+    assert control.find("$dft") is None
+    assert "functional" not in control.text() and "gridsize" not in control.text()
+    assert control.text().endswith("$end\n") and control.text().count("$end") == 1
+
+
+def test_end_and_what_follows_it():
+    control = control_file.ControlFile(["$title", "$dft", "   functional b-p", "$end", "$ignored after end"])
+    assert control.text() == "$title\n$dft\n   functional b-p\n$end\n"
+    control.add("$pop")
+    assert control.text() == "$title\n$dft\n   functional b-p\n$pop\n$end\n"
+    # a file without $end gets one
+    assert control_file.ControlFile(["$title"]).text() == "$title\n$end\n"
+
+
+def test_repeated_groups():
+    control = control_file.ControlFile(["$cosmo", "   epsilon=2.0", "$pop", "$cosmo", "   epsilon=78.3"])
+    # add does not repeat a group, find and replace take the first one, remove takes all of them
+    control.add("$cosmo")
+    assert control.text().count("$cosmo") == 2
+    assert control.find("$cosmo") == ["$cosmo", "   epsilon=2.0"]
+    control.replace("$cosmo", ["   epsilon=10.0"])
+    assert control.text() == "$cosmo\n   epsilon=10.0\n$pop\n$cosmo\n   epsilon=78.3\n$end\n"
+    control.remove("$cosmo")
+    assert control.text() == "$pop\n$end\n"
+
+
+def test_missing_group():
+    control = control_file.ControlFile(["$title", "$atoms", "o  1", "   basis =o def-SVP"])
+    assert control.find("$dft") is None and control.functional() is None
+    control.set_functional("pbe")
+    control.remove("$dft")
+    assert control.text() == "$title\n$atoms\no  1\n   basis =o def-SVP\n$end\n"
+    control.replace("$dft", ["   functional pbe"])
+    assert control.functional() == "pbe"
+    # a line without keyword goes to the last group, once
+    control.add("   gridsize m4")
+    control.add("   gridsize m4")
+    assert control.find("$dft") == ["$dft", "   functional pbe", "   gridsize m4"]
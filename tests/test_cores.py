@@ -0,0 +1,34 @@
+import os
+
+import utils.cores as cores
+
+
+def fake_cpus(monkeypatch, num_cpus):
+    monkeypatch.setattr(cores, "available_cpus", lambda: list(range(num_cpus)))
+
+
+def test_core_budget_splits_the_cpus(monkeypatch):
+    fake_cpus(monkeypatch, 8)
+    assert cores.plan_core_budget(4) == (4, 2, [[0, 1], [2, 3], [4, 5], [6, 7]])
+    assert cores.plan_core_budget(None, 4) == (2, 4, [[0, 1, 2, 3], [4, 5, 6, 7]])
+    # no more workers than CPUs, no oversubscription
+    workers, threads, _ = cores.plan_core_budget(16)
+    assert (workers, threads) == (8, 1)
+    workers, threads, _ = cores.plan_core_budget(4, 4)
+    assert (workers, threads) == (4, 2)
+
+
+def cpu_set_of_worker(_):
+    return os.getpid(), sorted(os.sched_getaffinity(0))
+
+
+def test_every_worker_gets_its_own_cpu_set(monkeypatch):
+    cpus = sorted(os.sched_getaffinity(0))
+    monkeypatch.setattr(cores, "available_cpus", lambda: cpus)
+    pool, workers = cores.make_pool(len(cpus), 1)
+    with pool:
+        # each worker reports its pid and the CPUs it is pinned to
+        results = dict(pool.map(cpu_set_of_worker, range(4 * workers), chunksize=1))
+    assert workers == len(cpus)
+    assert sorted(sum(results.values(), [])) == sorted(set(sum(results.values(), [])))
+    assert all(len(cpu_set) == 1 for cpu_set in results.values())
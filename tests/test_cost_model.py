@@ -0,0 +1,90 @@
+import json
+
+import numpy as np
+import pytest
+
+import utils.cost_model as cost_model
+
+
+def molecule(num_carbons):
+    return ["c"] * num_carbons + ["h"] * (2 * num_carbons + 2)
+
+
+def record_synthetic_timings(timings_file, exponent, prefactor=2e-7, functional="b-p", method="ridft"):
+    # wall times exactly following the model, with varying sizes and thread counts
+    for num_carbons in (2, 4, 8, 16, 32):
+        for threads in (1, 4):
+            elements = molecule(num_carbons)
+            nbf = cost_model.count_basis_functions(elements, "def-SVP")
+            cost_model.record_timing(timings_file, functional, "def-SVP", method, elements, threads,
+                                     prefactor * nbf ** exponent / threads)
+
+
+def test_record_timing_appends_one_line_per_calculation(tmp_path):
+    timings_file = str(tmp_path / "timings.jsonl")
+    cost_model.record_timing(timings_file, "pbe", "def-SVP", "ridft", ["c", "h", "h", "h", "h"], 2, 1.5)
+    cost_model.record_timing(timings_file, "pbe0", "def2-TZVP", "dscf", ["o", "h", "h"], 1, 3.0)
+    records = cost_model.read_timings(timings_file)
+    assert records[0] == {"functional": "pbe", "basis": "def-SVP", "method": "ridft", "composition": {"C": 1, "H": 4},
+                          "threads": 2, "wall_time": 1.5}
+    assert records[1]["composition"] == {"H": 2, "O": 1} and len(records) == 2
+
+
+@pytest.mark.parametrize("exponent", [2.2, 2.8, 3.5])
+def test_calibration_recovers_the_exponent(tmp_path, exponent):
+    timings_file = str(tmp_path / "timings.jsonl")
+    record_synthetic_timings(timings_file, exponent)
+    calibration = cost_model.calibrate_cost_model(timings_file)
+    assert calibration["exponent"] == pytest.approx(exponent)
+    assert calibration["prefactor"] == pytest.approx(2e-7)
+    assert calibration["num_records"] == 10
+    assert calibration["class_factors"] == pytest.approx(cost_model.class_factors)
+    elements = molecule(10)
+    nbf = cost_model.count_basis_functions(elements, "def-SVP")
+    assert cost_model.predict_wall_time("b-p", "def-SVP", elements, threads=2, calibration=calibration) \
+        == pytest.approx(2e-7 * nbf ** exponent / 2)
+
+
+@pytest.mark.parametrize("exponent, clipped", [(1.0, 1.5), (5.0, 4.0)])
+def test_calibration_clips_the_exponent(tmp_path, exponent, clipped):
+    timings_file = str(tmp_path / "timings.jsonl")
+    record_synthetic_timings(timings_file, exponent)
+    assert cost_model.calibrate_cost_model(timings_file)["exponent"] == clipped
+
+
+def test_calibration_corrects_the_factor_of_a_functional_class(tmp_path):
+    timings_file = str(tmp_path / "timings.jsonl")
+    record_synthetic_timings(timings_file, 3.0)
+    # the hybrids take 4 times as long as the gga, not class_factors["hybrid"] = 2.5 times
+    record_synthetic_timings(timings_file, 3.0, prefactor=8e-7, functional="pbe0")
+    calibration = cost_model.calibrate_cost_model(timings_file)
+    assert calibration["class_factors"]["hybrid"] / calibration["class_factors"]["gga"] == pytest.approx(4.0)
+
+
+def test_too_few_timings_leave_the_defaults(tmp_path):
+    timings_file = tmp_path / "timings.jsonl"
+    assert cost_model.calibrate_cost_model(None) == cost_model.default_calibration()
+    assert cost_model.calibrate_cost_model(str(timings_file)) == cost_model.default_calibration()
+    timings_file.write_text("")
+    assert cost_model.calibrate_cost_model(str(timings_file)) == cost_model.default_calibration()
+    # a line cut short by a crash is skipped, four records are not enough
+    for num_carbons in (2, 4, 8, 16):
+        cost_model.record_timing(str(timings_file), "b-p", "def-SVP", "ridft", molecule(num_carbons), 1, 1.0)
+    with open(timings_file, "a") as fp:
+        fp.write(json.dumps({"functional": "b-p"})[:10])
+    assert len(cost_model.read_timings(str(timings_file))) == 4
+    assert cost_model.calibrate_cost_model(str(timings_file)) == cost_model.default_calibration()
+
+
+@pytest.mark.parametrize("wall_times, num_workers, makespan", [
+    ([3, 2, 2, 1], 2, 4),
+    # the long job last waits for a free worker, first it runs next to the others
+    ([1, 1, 1, 1, 4], 2, 6),
+    ([4, 1, 1, 1, 1], 2, 4),
+    ([1, 2, 3], 1, 6),
+    ([1, 2, 3], 0, 6),
+    ([2, 5], 4, 5),
+    ([], 2, 0),
+])
+def test_simulate_makespan(wall_times, num_workers, makespan):
+    assert cost_model.simulate_makespan(wall_times, num_workers) == makespan
@@ -0,0 +1,57 @@
+import os
+import warnings
+
+import utils.control_file as control_file
+import utils.define_cache as define_cache
+
+settings = {"turbomole_functional": "pbe", "turbomole_basis": "def-SVP", "turbomole_method": "ridft"}
+
+control_lines = ["$title", "$coord    file=coord", "$atoms", "c  1", "   basis =c def-SVP", "$scfiterlimit 100"]
+dft_lines = ["$dft", "   functional pbe", "   gridsize   m3"]
+
+
+def key(**changes):
+    arguments = dict(dft_settings=settings, charge=0, uhf=None, disp=True, pop=False, water=False,
+                     elements=["C", "H", "H"])
+    arguments.update(changes)
+    return define_cache.template_key(**arguments)
+
+
+def test_template_key_depends_on_the_definition():
+    assert key() == key(elements=["c", "h", "H"])
+    assert key() != key(elements=["H", "C", "H"])
+    assert key() != key(charge=1)
+    assert key() != key(disp=False)
+    assert key() != key(dft_settings=dict(settings, turbomole_functional="b-p"))
+
+
+def test_store_and_copy_template(tmp_path):
+    moldir, cache_dir, other = tmp_path / "mol", tmp_path / "cache", tmp_path / "other"
+    moldir.mkdir()
+    other.mkdir()
+    (moldir / "control").write_text("$end\n")
+    (moldir / "coord").write_text("$coord\n$end\n")
+    assert not define_cache.copy_template(str(cache_dir), key(), str(other))
+    define_cache.store_template(str(cache_dir), key(), str(moldir), valid=True)
+    assert define_cache.copy_template(str(cache_dir), key(), str(other))
+    # the coordinates belong to the molecule, not to the template
+    assert sorted(os.listdir(other)) == ["control"]
+
+
+def test_invalid_template_is_marked_unsupported(tmp_path):
+    define_cache.store_template(str(tmp_path), key(), str(tmp_path), valid=False)
+    assert define_cache.is_unsupported(str(tmp_path), key())
+
+
+def test_check_basis_and_func():
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        dft = control_file.ControlFile(control_lines + dft_lines)
+        assert control_file.check_basis_and_func(dft, "def-SVP", "pbe", "control")
+        assert not control_file.check_basis_and_func(dft, "def-SVP", "b-p", "control")
+        assert not control_file.check_basis_and_func(dft, "def2-TZVP", "pbe", "control")
+        # Hartree-Fock has no $dft group
+        hf = control_file.ControlFile(control_lines)
+        assert control_file.check_basis_and_func(hf, "def-SVP", "HF", "control")
+        assert not control_file.check_basis_and_func(dft, "def-SVP", "HF", "control")
+        assert not control_file.check_basis_and_func(hf, "def-SVP", "pbe", "control")
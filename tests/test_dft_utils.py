@@ -0,0 +1,64 @@
+import json
+import os
+import stat
+
+import pytest
+
+import parallel_qm
+
+parallel_qm_dir = os.path.dirname(os.path.abspath(parallel_qm.__file__))
+
+water = [[0.0, 0.0, 0.0], [0.76, 0.59, 0.0], [-0.76, 0.59, 0.0]]
+elements = ["O", "H", "H"]
+
+
+def failing_define(tmp_path, monkeypatch):
+    """
+    Puts a define that fails like a real one (no "define ended normally") first in PATH
+    """
+    bin_dir = tmp_path / "failing_bin"
+    bin_dir.mkdir()
+    define = bin_dir / "define"
+    define.write_text("#!/bin/sh\ncat > /dev/null\necho ' define ended abnormally' >&2\nexit 1\n")
+    define.chmod(define.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setenv("PATH", str(bin_dir) + os.pathsep + os.environ["PATH"])
+
+
+def task_settings(tmp_path, **settings):
+    return dict({"qm_method": "dft", "delete_calculation_dirs": False, "copy_mos": False, "turbomole_method": "ridft",
+                 "turbomole_functional": "b-p", "turbomole_basis": "def-SVP", "task_name": "T_0",
+                 "metrics_dir": str(tmp_path / "metrics")}, **settings)
+
+
+@pytest.mark.parametrize("backend", ["thread", "process"])
+@pytest.mark.parametrize("define_cache", [False, True])
+def test_define_failure_is_a_failed_calculation(tmp_path, monkeypatch, stand_ins, backend, define_cache):
+    failing_define(tmp_path, monkeypatch)
+    monkeypatch.chdir(tmp_path)
+    settings = task_settings(tmp_path, define_cache_dir=str(tmp_path / "define_cache") if define_cache else None)
+    items = [(i, [[[x + i, y, z] for x, y, z in water], elements, settings]) for i in range(2)]
+    # returns instead of waiting forever for the results of workers that called exit()
+    energies = parallel_qm.calc_energies_for_items(items, 1, [data[0] for _, data in items], backend=backend)
+    assert energies == [None, None]
+    assert not os.path.exists(str(tmp_path / "programs.jsonl"))
+
+
+@pytest.mark.parametrize("define_cache", [False, True])
+def test_control_file_with_the_wrong_basis_is_rejected(tmp_path, monkeypatch, stand_ins, define_cache):
+    # define ends normally, but its control file has another basis than the requested one
+    bin_dir = tmp_path / "wrong_basis_bin"
+    bin_dir.mkdir()
+    define = bin_dir / "define"
+    define.write_text("#!/bin/sh\n%s || exit 1\nsed -i 's/def-SVP/def2-TZVP/' control\n"
+                      % (os.path.join(parallel_qm_dir, "benchmarks", "bin", "define")))
+    define.chmod(define.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setenv("PATH", str(bin_dir) + os.pathsep + os.environ["PATH"])
+    monkeypatch.chdir(tmp_path)
+    settings = task_settings(tmp_path, define_cache_dir=str(tmp_path / "define_cache") if define_cache else None)
+    items = [(0, [water, elements, settings])]
+    with pytest.warns(UserWarning, match="Wrong basis"):
+        energies = parallel_qm.calc_energies_for_items(items, 1, [water], backend="thread")
+    assert energies == [None]
+    with open(str(tmp_path / "programs.jsonl")) as fp:
+        programs = [json.loads(line)["program"] for line in fp]
+    assert programs == ["define"]
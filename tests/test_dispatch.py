@@ -0,0 +1,62 @@
+import threading
+import time
+from multiprocessing.pool import ThreadPool
+
+import pytest
+
+import utils.dispatch as dispatch
+import utils.engine as engine
+
+from test_engine import alive
+
+copies = {}
+copies_lock = threading.Lock()
+
+
+def straggler_job(job):
+    """
+    The first copy of the slow job hangs in a program, a second copy of it finishes right away
+    """
+    name, cwd = job
+    with copies_lock:
+        copy = copies[name] = copies.get(name, 0) + 1
+    if name == "slow" and copy == 1:
+        try:
+            engine.run(["sh", "-c", "echo $$ > slow.pid; exec sleep 30"], cwd)
+        except engine.CalculationAborted as error:
+            return name, copy, error.reason
+    return name, copy, "ok"
+
+
+def test_speculative_copy_replaces_the_straggler(tmp_path, monkeypatch):
+    monkeypatch.setattr(engine, "poll_interval", 0.05)
+    copies.clear()
+    start = time.time()
+    jobs = [("slow", str(tmp_path)), ("fast", str(tmp_path))]
+    with ThreadPool(2) as pool:
+        results = list(dispatch.imap_unordered(pool, 2, straggler_job, jobs, speculative=True))
+    # one result per job, the slow job from its second copy
+    assert sorted(results) == [("fast", 1, "ok"), ("slow", 2, "ok")]
+    assert copies == {"slow": 2, "fast": 1}
+    # the first copy was cancelled through its cancel file and its program killed
+    assert time.time() - start < 10
+    with open(tmp_path / "slow.pid") as fp:
+        assert not alive(int(fp.read()))
+
+
+def test_without_speculation_every_job_runs_once(tmp_path):
+    copies.clear()
+    jobs = [("job_%i" % (i), str(tmp_path)) for i in range(6)]
+    with ThreadPool(2) as pool:
+        results = list(dispatch.imap_unordered(pool, 2, straggler_job, jobs))
+    assert sorted(results) == sorted((name, 1, "ok") for name, _ in jobs)
+
+
+def failing_job(job):
+    raise ValueError("job %i failed" % (job))
+
+
+def test_error_of_a_job_reaches_the_caller():
+    with ThreadPool(2) as pool:
+        with pytest.raises(ValueError, match="failed"):
+            list(dispatch.imap_unordered(pool, 2, failing_job, [0, 1]))
@@ -0,0 +1,78 @@
+import numpy as np
+
+import utils.diversity as diversity
+import utils.xyz_utils as xyz
+
+
+def random_molecule(rng, num_atoms=12):
+    return rng.normal(scale=1.5, size=(num_atoms, 3))
+
+
+def random_rotation(rng):
+    q, r = np.linalg.qr(rng.normal(size=(3, 3)))
+    q *= np.sign(np.diag(r))
+    if np.linalg.det(q) < 0:
+        q[:, 0] *= -1
+    return q
+
+
+def test_alignment_undoes_rotations(rng=np.random.default_rng(0)):
+    reference = random_molecule(rng)
+    reference -= reference.mean(axis=0)
+    frames = np.array([reference @ random_rotation(rng) for _ in range(5)])
+    aligned = frames @ diversity.kabsch_rotations(reference, frames)
+    assert np.allclose(aligned, reference)
+
+
+def test_drifting_trajectory_keeps_a_frame_per_threshold_of_drift(rng=np.random.default_rng(1)):
+    start = random_molecule(rng)
+    direction = rng.normal(size=start.shape)
+    # 1000 frames, each one RMSD 0.001 further along, 1.0 of total drift
+    direction /= np.sqrt(np.mean(np.sum(direction ** 2, axis=1)))
+    frames = np.array([start + 0.001 * i * direction for i in range(1000)])
+    keep = diversity.deduplicate(frames, 0.05)
+    assert 18 <= np.sum(keep) <= 22
+    assert keep[0]
+
+
+def test_repeated_frames_are_dropped(rng=np.random.default_rng(2)):
+    molecules = [random_molecule(rng) for _ in range(3)]
+    frames = np.array([molecules[i % 3] + rng.normal(scale=0.001, size=molecules[0].shape) for i in range(30)])
+    keep = diversity.deduplicate(frames, 0.05)
+    assert np.flatnonzero(keep).tolist() == [0, 1, 2]
+
+
+def write_pool(path, rng, num_frames=200, num_atoms=40):
+    start = random_molecule(rng, num_atoms)
+    coords = [(start + rng.normal(scale=0.3, size=start.shape)) @ random_rotation(rng) for _ in range(num_frames)]
+    xyz.exportXYZs(coords, [["C"] * num_atoms] * num_frames, path)
+    return np.array(coords)
+
+
+def test_projected_descriptors_keep_the_distances(tmp_path, rng=np.random.default_rng(3)):
+    write_pool(str(tmp_path / "pool.xyz"), rng)
+    full, num_atoms, _ = diversity.pool_descriptors(str(tmp_path / "pool.xyz"), max_dims=10000)
+    projected, _, _ = diversity.pool_descriptors(str(tmp_path / "pool.xyz"), max_dims=48)
+    assert projected.shape == (200, 48) and num_atoms == 40
+    ratio = np.linalg.norm(projected[1:] - projected[0], axis=1) / np.linalg.norm(full[1:] - full[0], axis=1)
+    assert 0.8 < np.median(ratio) < 1.2
+
+
+def test_farthest_point_sampling_picks_distinct_candidates(rng=np.random.default_rng(4)):
+    descriptors = rng.normal(size=(100, 6)).astype(np.float32)
+    candidates = np.zeros(100, dtype=bool)
+    candidates[::3] = True
+    picked = diversity.farthest_point_sampling(descriptors, 20, candidates=candidates, first=0, chunk_size=16)
+    assert len(set(picked.tolist())) == 20
+    assert np.all(candidates[picked])
+
+
+def test_plan_diverse_samples(tmp_path, rng=np.random.default_rng(5)):
+    write_pool(str(tmp_path / "pool.xyz"), rng)
+    plan = diversity.plan_diverse_samples(str(tmp_path / "pool.xyz"), 3, 10, overlap=0.2, seed=7, chunk_size=64)
+    assert plan["num_pool"] == 200 and plan["num_unique"] == 200
+    shared = plan["shared_indices"].tolist()
+    assert len(shared) == 2
+    indices = [set(indices.tolist()) for indices in plan["flavour_indices"]]
+    assert all(len(i) == 10 and set(shared) <= i for i in indices)
+    assert len(indices[0] | indices[1] | indices[2]) == 2 + 3 * 8
@@ -0,0 +1,86 @@
+import json
+import os
+import time
+
+import pytest
+
+import parallel_qm
+import utils.engine as engine
+import utils.metrics as metrics
+
+
+def alive(pid):
+    """
+    True if the process runs, zombies left for a parent that does not reap them count as dead
+    """
+    try:
+        with open("/proc/%i/stat" % (pid), "r") as fp:
+            return fp.read().rsplit(")", 1)[1].split()[0] != "Z"
+    except FileNotFoundError:
+        return False
+
+
+def read_pids(path):
+    with open(path, "r") as fp:
+        return [int(pid) for pid in fp.read().split()]
+
+
+@pytest.fixture
+def fast_watch(monkeypatch):
+    monkeypatch.setattr(engine, "poll_interval", 0.05)
+    monkeypatch.setattr(engine, "kill_grace", 0.5)
+
+
+def run_until(tmp_path, script, deadline):
+    engine.set_deadline(deadline)
+    start = time.time()
+    try:
+        with pytest.raises(engine.CalculationAborted) as aborted:
+            engine.run(["sh", "-c", script], str(tmp_path))
+    finally:
+        engine.set_deadline(None)
+    return aborted.value.reason, time.time() - start
+
+
+def test_deadline_kills_the_process_group(tmp_path, fast_watch):
+    # the program leaves a child of its own running
+    reason, seconds = run_until(tmp_path, "sleep 30 & echo $! > pids; wait", time.time() + 0.3)
+    assert reason == "timeout" and seconds < 5
+    time.sleep(0.2)
+    assert not any(alive(pid) for pid in read_pids(tmp_path / "pids"))
+
+
+def test_sigkill_follows_an_ignored_sigterm(tmp_path, fast_watch):
+    # ignored signals are inherited, neither the shell nor its child stop on SIGTERM
+    reason, seconds = run_until(tmp_path, "trap '' TERM; sleep 30 & echo $$ $! > pids; wait", time.time() + 0.3)
+    assert reason == "timeout"
+    assert 0.3 + engine.kill_grace <= seconds < 5
+    time.sleep(0.2)
+    assert not any(alive(pid) for pid in read_pids(tmp_path / "pids"))
+
+
+def test_cancel_file_aborts_the_program(tmp_path, fast_watch):
+    engine.set_cancel_file(str(tmp_path / "cancel"))
+    try:
+        (tmp_path / "cancel").touch()
+        with pytest.raises(engine.CalculationAborted) as aborted:
+            engine.run(["sleep", "30"], str(tmp_path))
+    finally:
+        engine.set_cancel_file(None)
+    assert aborted.value.reason == "cancelled"
+
+
+def test_timeout_is_recorded_as_the_outcome(tmp_path, monkeypatch, stand_ins, fast_watch):
+    monkeypatch.setenv("FAKE_QM_SCALE", "1")
+    monkeypatch.setenv("FAKE_QM_COSTS", json.dumps({"define": [0.0, 0.0, 1], "ridft": [30.0, 0.0, 1]}))
+    monkeypatch.chdir(tmp_path)
+    water = [[0.0, 0.0, 0.0], [0.76, 0.59, 0.0], [-0.76, 0.59, 0.0]]
+    settings = {"qm_method": "dft", "delete_calculation_dirs": False, "copy_mos": False, "turbomole_method": "ridft",
+                "turbomole_functional": "b-p", "turbomole_basis": "def-SVP", "task_name": "T_0",
+                "metrics_dir": str(tmp_path / "metrics"), "job_timeout": 1.0}
+    start = time.time()
+    energies = parallel_qm.calc_energies_for_items([(0, [water, ["O", "H", "H"], settings])], 1, [water],
+                                                   backend="thread")
+    assert energies == [None] and time.time() - start < 10
+    records = metrics.read_metrics(str(tmp_path / "metrics"))
+    assert [(r["outcome"], r["abort_reason"]) for r in records] == [("timeout", "timeout")]
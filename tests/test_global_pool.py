@@ -0,0 +1,73 @@
+import os
+
+import parallel_qm
+import utils.journal as journal
+
+
+def settings_for(tmp_path):
+    return {"qm_method": "dft", "delete_calculation_dirs": False, "copy_mos": False, "use_dispersions": True,
+            "turbomole_method": "ridft", "backend": "thread", "metrics_dir": str(tmp_path / "metrics")}
+
+
+def run_global_pool(tmp_path, paths_to_tasks, monkeypatch):
+    """
+    Runs the tasks on one global pool and returns the events in their order: ("result", task, molidx) for every
+    result of the pool and ("finish", task, energies) for every finished task
+    """
+    events = []
+    append_to_journal = journal.append_to_journal
+
+    def record_result(path_to_task, molidx, energy):
+        events.append(("result", os.path.basename(path_to_task), molidx))
+        append_to_journal(path_to_task, molidx, energy)
+
+    def finish_task(path_to_task, energies):
+        events.append(("finish", os.path.basename(path_to_task), list(energies)))
+
+    with monkeypatch.context() as m:
+        m.setattr(journal, "append_to_journal", record_result)
+        parallel_qm.calculate_energies_for_tasks(paths_to_tasks, settings_for(tmp_path), 1, finish_task)
+    return events
+
+
+def test_every_task_is_finished_once_right_after_its_last_result(tmp_path, monkeypatch, stand_ins, make_placeholder):
+    monkeypatch.chdir(tmp_path)
+    # with seed 1 the molecules left in the first two tasks are of both sizes of the pool (22 and 61 atoms)
+    path_to_tasks = os.path.join(make_placeholder(["b3-lyp", "b-p", "pbe"], ["def-SVP"], 4, seed=1), "tasks")
+    task_dirs = parallel_qm.find_all_task_dirs(path_to_tasks)
+    paths = [os.path.join(path_to_tasks, task_dir) for task_dir in task_dirs]
+    # two molecules of the first task and all of the last one are in the journals already
+    journal.append_to_journal(paths[0], 0, -1.0)
+    journal.append_to_journal(paths[0], 2, -2.0)
+    for molidx in range(4):
+        journal.append_to_journal(paths[2], molidx, -3.0 - molidx)
+
+    events = run_global_pool(tmp_path, paths, monkeypatch)
+
+    finished = [event for event in events if event[0] == "finish"]
+    assert sorted(event[1] for event in finished) == sorted(task_dirs)
+    # the task without anything left is finished before the first job, with the energies of its journal
+    assert events[0] == ("finish", task_dirs[2], [-3.0, -4.0, -5.0, -6.0])
+    results = [(event[1], event[2]) for event in events if event[0] == "result"]
+    assert sorted(results) == sorted([(task_dirs[0], 1), (task_dirs[0], 3)] + [(task_dirs[1], i) for i in range(4)])
+    for task_dir in task_dirs[:2]:
+        last_result = max(i for i, event in enumerate(events) if event[0] == "result" and event[1] == task_dir)
+        assert events[last_result + 1][:2] == ("finish", task_dir)
+    # the jobs run longest first, not task by task: the results of the tasks are interleaved
+    order = [task_dir for task_dir, _ in results]
+    assert order != sorted(order, key=order.index)
+
+    energies = {event[1]: event[2] for event in finished}
+    assert energies[task_dirs[0]][0] == -1.0 and energies[task_dirs[0]][2] == -2.0
+    assert all(e is not None for task_dir in task_dirs for e in energies[task_dir])
+    # the first task keeps its journaled energies, the others were journaled when their results came in
+    for task_dir, path in zip(task_dirs, paths):
+        assert journal.read_journal(path) == dict(enumerate(energies[task_dir]))
+
+    # a second run finds everything in the journals and runs nothing
+    with open(os.path.join(tmp_path, "programs.jsonl")) as fp:
+        num_programs = len(fp.readlines())
+    events = run_global_pool(tmp_path, paths, monkeypatch)
+    assert events == [("finish", task_dir, energies[task_dir]) for task_dir in task_dirs]
+    with open(os.path.join(tmp_path, "programs.jsonl")) as fp:
+        assert len(fp.readlines()) == num_programs
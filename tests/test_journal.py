@@ -0,0 +1,30 @@
+import os
+
+import utils.journal as journal
+
+
+def test_last_entry_of_a_molecule_wins(tmp_path):
+    journal.append_to_journal(tmp_path, 0, None)
+    journal.append_to_journal(tmp_path, 1, -1.5)
+    journal.append_to_journal(tmp_path, 0, -2.5)
+    assert journal.read_journal(tmp_path) == {0: -2.5, 1: -1.5}
+
+
+def test_missing_journal_is_empty(tmp_path):
+    assert journal.read_journal(tmp_path) == {}
+
+
+def test_truncated_last_line_is_cut_off(tmp_path):
+    journal.append_to_journal(tmp_path, 0, -1.0)
+    with open(os.path.join(tmp_path, journal.journal_name), "a") as fp:
+        fp.write('{"molidx": 1, "ener')
+    assert journal.read_journal(tmp_path) == {0: -1.0}
+    # the next append starts on a fresh line
+    journal.append_to_journal(tmp_path, 1, -2.0)
+    assert journal.read_journal(tmp_path) == {0: -1.0, 1: -2.0}
+
+
+def test_damaged_line_is_skipped(tmp_path):
+    with open(os.path.join(tmp_path, journal.journal_name), "w") as fp:
+        fp.write('{"molidx": 0, "energy": -1.0}\nnot json\n{"molidx": 2, "energy": -3.0}\n')
+    assert journal.read_journal(tmp_path) == {0: -1.0, 2: -3.0}
@@ -0,0 +1,24 @@
+import logging
+import time
+
+import utils.log as log
+
+
+def test_buffered_records_are_written_without_further_logging(tmp_path):
+    filename = str(tmp_path / "worker.log")
+    handler = log.BufferedFileHandler(filename, flush_interval=0.1)
+    logger = logging.getLogger("test_buffered_records")
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    logger.addHandler(handler)
+    try:
+        logger.info("first record")
+        assert "first record" not in open(filename).read()
+        time.sleep(0.5)
+        assert "first record" in open(filename).read()
+        # warnings are written right away
+        logger.warning("a warning")
+        assert "a warning" in open(filename).read()
+    finally:
+        logger.removeHandler(handler)
+        handler.close()
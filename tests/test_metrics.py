@@ -0,0 +1,88 @@
+import json
+import os
+
+import pytest
+
+import parallel_qm
+import utils.metrics as metrics
+from metrics_report import metrics_report
+
+water = [[0.0, 0.0, 0.0], [0.76, 0.59, 0.0], [-0.76, 0.59, 0.0]]
+elements = ["O", "H", "H"]
+
+
+def test_qm_task_writes_one_record_per_calculation(tmp_path, monkeypatch, stand_ins):
+    # only the SCF takes measurable time
+    monkeypatch.setenv("FAKE_QM_SCALE", "1")
+    monkeypatch.setenv("FAKE_QM_COSTS", json.dumps({"define": [0, 0, 1], "ridft": [0.2, 0, 1], "eiger": [0, 0, 1]}))
+    monkeypatch.chdir(tmp_path)
+    metrics_dir = str(tmp_path / "metrics")
+    settings = {"qm_method": "dft", "delete_calculation_dirs": False, "copy_mos": False, "turbomole_method": "ridft",
+                "turbomole_functional": "pbe", "turbomole_basis": "def-SVP", "task_name": "T_7",
+                "metrics_dir": metrics_dir}
+    for molidx in range(2):
+        results = parallel_qm.qm_task(molidx, [[[x + molidx, y, z] for x, y, z in water], elements, settings])
+        assert results["energy"] is not None
+
+    records = metrics.read_metrics(metrics_dir)
+    assert os.listdir(metrics_dir) == [os.path.basename(metrics.metrics_file(metrics_dir))]
+    assert [r["molidx"] for r in records] == [0, 1]
+    for r in records:
+        assert {key: r[key] for key in ("task", "qm_method", "functional", "basis", "method", "natoms", "outcome")} \
+            == {"task": "T_7", "qm_method": "dft", "functional": "pbe", "basis": "def-SVP", "method": "ridft",
+                "natoms": 3, "outcome": "ok"}
+        assert r["worker"] == metrics.worker_id() and r["threads"] >= 1
+        assert {"setup", "define", "scf", "eiger", "parse", "finish"} <= set(r["phases"])
+        assert r["phases"]["scf"] >= 0.2 and r["phases"]["define"] < 0.2
+        assert sum(r["phases"].values()) <= r["wall_time"]
+        # define, ridft and eiger, each a python process of its own
+        assert r["child_cpu_seconds"] > 0 and r["child_max_rss_kb"] > 1000
+        assert r["scf_iterations"] is not None and "abort_reason" not in r
+    assert 0 <= records[1]["between_jobs"] < records[0]["wall_time"]
+    assert records[1]["start"] >= records[0]["start"] + records[0]["wall_time"]
+
+
+def write_records(metrics_dir, records):
+    os.makedirs(metrics_dir)
+    with open(os.path.join(metrics_dir, "metrics_host_1.jsonl"), "w") as fp:
+        for r in records[:2]:
+            fp.write(json.dumps(r) + "\n")
+    with open(os.path.join(metrics_dir, "metrics_host_2.jsonl"), "w") as fp:
+        for r in records[2:]:
+            fp.write(json.dumps(r) + "\n")
+        # a line cut short by a crash
+        fp.write('{"functional": "pb')
+
+
+def record(functional, natoms, wall_time, threads, outcome="ok", scf=0.0):
+    return {"functional": functional, "basis": "def-SVP", "natoms": natoms, "wall_time": wall_time,
+            "threads": threads, "outcome": outcome, "phases": {"scf": scf}, "scf_iterations": 10,
+            "child_max_rss_kb": 2048, "between_jobs": None}
+
+
+def test_metrics_report_sums_the_cpu_hours_of_the_groups(tmp_path):
+    metrics_dir = str(tmp_path / "metrics")
+    write_records(metrics_dir, [record("pbe", 12, 3600.0, 2, scf=1800.0),
+                                record("pbe", 25, 1800.0, 4, outcome="timeout", scf=1800.0),
+                                record("b3-lyp", 12, 7200.0, 4, scf=3600.0),
+                                record("b3-lyp", 15, 3600.0, 1, outcome="cancelled")])
+
+    rows = metrics_report(metrics_dir, ["functional"])
+    # sorted by CPU-hours: b3-lyp 8 + 1, pbe 2 + 2
+    assert [row["group"] for row in rows] == [("b3-lyp",), ("pbe",)]
+    assert [row["cpu_hours"] for row in rows] == [pytest.approx(9.0), pytest.approx(4.0)]
+    assert [row["calculations"] for row in rows] == [2, 2]
+    # a timeout is a failure, the cancelled copy of a speculative job is not
+    assert [row["failed"] for row in rows] == [0, 1]
+    assert rows[0]["phase_shares"]["scf"] == pytest.approx(3600.0 / 10800.0)
+    assert rows[1]["other_share"] == pytest.approx(1800.0 / 5400.0)
+    assert rows[0]["mean_wall_time"] == pytest.approx(5400.0) and rows[0]["max_rss_mb"] == 2.0
+
+    rows = metrics_report(metrics_dir, ["functional", "size"])
+    assert {row["group"]: row["cpu_hours"] for row in rows} == {("b3-lyp", "10-19 atoms"): pytest.approx(9.0),
+                                                                ("pbe", "10-19 atoms"): pytest.approx(2.0),
+                                                                ("pbe", "20-29 atoms"): pytest.approx(2.0)}
+
+
+def test_metrics_report_of_an_empty_run(tmp_path):
+    assert metrics_report(str(tmp_path), ["functional"]) == []
@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+import utils.qm_parsers as qm_parsers
+
+
+def write(path, text):
+    with open(path, "w") as fp:
+        fp.write(text)
+
+
+def test_to_array_reads_fortran_exponents():
+    values = qm_parsers._to_array("1.0D-01 -2.5E+00\n 3 4.0d0".replace("d", "D"), columns=2)
+    assert np.allclose(values, [[0.1, -2.5], [3.0, 4.0]])
+
+
+def test_to_array_rejects_malformed_text():
+    with pytest.raises(ValueError):
+        qm_parsers._to_array("1.0 2.0 ******** 4.0")
+
+
+def test_read_tm_energy(tmp_path):
+    assert qm_parsers.read_tm_energy(str(tmp_path)) is None
+    write(tmp_path / "energy", "$energy      SCF               SCFKIN            SCFPOT\n"
+                               "     1  -76.40000000000  76.0  -152.0\n"
+                               "     2  -76.41234567890D+00  76.0  -152.0\n$end\n")
+    assert qm_parsers.read_tm_energy(str(tmp_path)) == pytest.approx(-76.4123456789)
+
+
+def test_read_tm_energy_without_cycles(tmp_path):
+    write(tmp_path / "energy", "$energy      SCF               SCFKIN            SCFPOT\n$end\n")
+    assert qm_parsers.read_tm_energy(str(tmp_path)) is None
+
+
+def test_read_tm_output(tmp_path):
+    write(tmp_path / "TM.out", " convergence criteria satisfied after    12 iterations\n"
+                               "                 |  total energy      =    -76.41234567890  |\n"
+                               "     atom      charge    n(s)      n(p)      n(d)\n"
+                               "    1  o  -0.80000   0.00000   0.00000   0.00000\n"
+                               "    2  h   0.40000   0.00000   0.00000   0.00000\n"
+                               "    3  h   0.40000   0.00000   0.00000   0.00000\n"
+                               " ridft : all done\n")
+    results = qm_parsers.read_tm_output(str(tmp_path / "TM.out"), natoms=3)
+    assert results["finished"] and results["scf_iterations"] == 12
+    assert results["energy"] == pytest.approx(-76.4123456789)
+    assert np.allclose(results["partial_charges"], [-0.8, 0.4, 0.4])
+
+
+def test_read_gradient_keeps_the_last_cycle(tmp_path):
+    write(tmp_path / "gradient", "$grad\n  cycle =      1    SCF energy =   -1.0   |dE/dxyz| =  0.1\n"
+                                 "   0.0 0.0 0.0      h\n   1.0D+00 2.0D+00 3.0D+00\n"
+                                 "  cycle =      2    SCF energy =   -1.1   |dE/dxyz| =  0.1\n"
+                                 "   0.0 0.0 0.0      h\n   4.0D-01 5.0D-01 6.0D-01\n$end\n")
+    assert np.allclose(qm_parsers.read_gradient(str(tmp_path)), [[0.4, 0.5, 0.6]])
+
+
+def test_read_hessian_rejects_a_damaged_file(tmp_path):
+    write(tmp_path / "hessian", "$hessian\n  1  1  0.1 0.2 0.3\n  1  2  0.4 NaN-ish\n$end\n")
+    with pytest.raises(ValueError):
+        qm_parsers.read_hessian(str(tmp_path))
+
+
+def test_read_reduced_masses_skips_fields_that_are_no_numbers(tmp_path):
+    assert qm_parsers.read_reduced_masses(str(tmp_path)) is None
+    write(tmp_path / "g98.out", " Frequencies --   100.0   200.0   300.0\n"
+                                " Red. masses --   1.0800   ********   2.5000\n"
+                                " Frequencies --   400.0\n"
+                                " Red. masses --   12.0000\n")
+    assert np.allclose(qm_parsers.read_reduced_masses(str(tmp_path)), [1.08, 2.5, 12.0])
+    write(tmp_path / "g98.out", " Red. masses --   ********\n")
+    assert qm_parsers.read_reduced_masses(str(tmp_path)) is None
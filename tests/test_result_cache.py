@@ -0,0 +1,36 @@
+import os
+import time
+
+import utils.result_cache as result_cache
+
+water = [[0.0, 0.0, 0.0], [0.76, 0.59, 0.0], [-0.76, 0.59, 0.0]]
+elements = ["O", "H", "H"]
+
+
+def test_key_depends_on_geometry_and_settings():
+    key = result_cache.cache_key("dft", water, elements, functional="b-p", basis="def-SVP")
+    assert key == result_cache.cache_key("dft", water, elements, basis="def-SVP", functional="b-p")
+    assert key != result_cache.cache_key("dft", water, elements, functional="pbe", basis="def-SVP")
+    assert key != result_cache.cache_key("xtb", water, elements, functional="b-p", basis="def-SVP")
+    moved = [[x + 0.1, y, z] for x, y, z in water]
+    assert key != result_cache.cache_key("dft", moved, elements, functional="b-p", basis="def-SVP")
+
+
+def test_store_and_lookup(tmp_path):
+    key = result_cache.cache_key("xtb", water, elements)
+    assert result_cache.lookup(str(tmp_path), key) is None
+    result_cache.store(str(tmp_path), key, {"energy": -5.0})
+    assert result_cache.lookup(str(tmp_path), key) == {"energy": -5.0, "from_cache": True}
+
+
+def test_evict_removes_the_least_recently_used(tmp_path):
+    keys = [result_cache.cache_key("xtb", water, elements, charge=charge) for charge in range(3)]
+    for age, key in zip([300, 200, 100], keys):
+        result_cache.store(str(tmp_path), key, {"energy": -5.0})
+        past = time.time() - age
+        os.utime(result_cache.entry_path(str(tmp_path), key), (past, past))
+    size = os.path.getsize(result_cache.entry_path(str(tmp_path), keys[0]))
+    result_cache.evict(str(tmp_path), max_bytes=2 * size)
+    assert [os.path.exists(result_cache.entry_path(str(tmp_path), key)) for key in keys] == [False, True, True]
+    result_cache.evict(str(tmp_path), max_age_days=150 / 86400)
+    assert [os.path.exists(result_cache.entry_path(str(tmp_path), key)) for key in keys] == [False, False, True]
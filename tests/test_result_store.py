@@ -0,0 +1,57 @@
+import os
+
+import numpy as np
+
+import utils.result_store as result_store
+
+water = [[0.0, 0.0, 0.0], [0.76, 0.59, 0.0], [-0.76, 0.59, 0.0]]
+elements = ["O", "H", "H"]
+
+
+def shifted(dx):
+    return [[x + dx, y, z] for x, y, z in water]
+
+
+def test_rows_and_geometries_are_read_back(tmp_path):
+    store_dir = str(tmp_path / "store")
+    writer = result_store.ResultStoreWriter(store_dir, segment="segment_a")
+    writer.append(water, elements, -2000.0, "b-p", "def-SVP", "T_1")
+    writer.append(water, elements, None, "pbe", "def-SVP", "T_2")
+    writer.append(shifted(1.0), elements, -2001.0, "b-p", "def-SVP", "T_1")
+    writer.close()
+
+    results = result_store.load_results(store_dir, functional="b-p")
+    assert results["energy"].tolist() == [-2000.0, -2001.0]
+    assert results["task"].tolist() == ["T_1", "T_1"]
+    failed = result_store.load_results(store_dir, functional="pbe")
+    assert failed["status"].tolist() == [result_store.STATUS_FAILED] and np.isnan(failed["energy"][0])
+    # the same geometry is stored once
+    assert os.path.getsize(os.path.join(store_dir, "segment_a", "numbers.bin")) == 6
+    coords, numbers = result_store.load_geometry(store_dir, "segment_a", results["geom_offset"][1], results["natoms"][1])
+    assert np.allclose(coords, shifted(1.0)) and numbers.tolist() == [8, 1, 1]
+
+
+def test_row_cut_short_by_a_crash_is_dropped(tmp_path):
+    store_dir = str(tmp_path / "store")
+    writer = result_store.ResultStoreWriter(store_dir, segment="segment_a")
+    writer.append(water, elements, -2000.0, "b-p", "def-SVP", "T_1")
+    writer.append(shifted(1.0), elements, -2001.0, "b-p", "def-SVP", "T_1")
+    writer.close()
+    segment_dir = os.path.join(store_dir, "segment_a")
+    # the crash hit after the first columns of the second row, and half-way into a third geometry
+    for column in ("status", "flavour", "geom_offset", "natoms"):
+        path = os.path.join(segment_dir, "%s.bin" % (column))
+        with open(path, "ab") as fp:
+            fp.truncate(os.path.getsize(path) // 2)
+    with open(os.path.join(segment_dir, "coords.bin"), "ab") as fp:
+        fp.write(b"\0" * 30)
+    assert result_store.segment_rows(segment_dir) == 1
+
+    writer = result_store.ResultStoreWriter(store_dir, segment="segment_a")
+    assert os.path.getsize(os.path.join(segment_dir, "energy.bin")) == 8
+    writer.append(shifted(2.0), elements, -2002.0, "b-p", "def-SVP", "T_1")
+    writer.close()
+    results = result_store.load_results(store_dir)
+    assert results["energy"].tolist() == [-2000.0, -2002.0]
+    coords, _ = result_store.load_geometry(store_dir, "segment_a", results["geom_offset"][1], results["natoms"][1])
+    assert np.allclose(coords, shifted(2.0))
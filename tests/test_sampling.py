@@ -0,0 +1,27 @@
+import numpy as np
+import pytest
+
+import utils.sampling as sampling
+
+
+def test_overlap_is_shared_by_every_flavour():
+    plan = sampling.plan_samples(100, 4, 10, overlap=0.3, seed=1)
+    shared = plan["shared_indices"].tolist()
+    assert len(shared) == 3
+    for indices in plan["flavour_indices"]:
+        assert len(set(indices.tolist())) == 10 and indices[:3].tolist() == shared
+    matrix = sampling.assignment_matrix(plan)
+    assert matrix.shape == (100, 4) and np.all(matrix[shared])
+
+
+def test_plan_is_reproduced_from_its_seed():
+    plan = sampling.plan_samples(50, 3, 5, overlap=0.4)
+    again = sampling.plan_samples(50, 3, 5, overlap=0.4, seed=plan["seed"])
+    assert all(np.array_equal(a, b) for a, b in zip(plan["flavour_indices"], again["flavour_indices"]))
+
+
+def test_invalid_plans_are_rejected():
+    with pytest.raises(ValueError):
+        sampling.plan_samples(10, 2, 5, overlap=1.5)
+    with pytest.raises(ValueError):
+        sampling.plan_samples(4, 2, 5)
@@ -0,0 +1,69 @@
+import pytest
+
+import utils.scf_monitor as scf_monitor
+
+
+def iteration_line(iteration, energy, density_change):
+    line = "  %3i  %.10f    %.10f     %.10f    %.3E %.3E" % (iteration, energy, 2.5 * energy, -1.5 * energy,
+                                                              density_change, 1e-10)
+    return line.replace("E", "D")
+
+
+def monitor_of(tmp_path, iterations, thresholds=None, partial=""):
+    path = tmp_path / "TM.out"
+    with open(path, "w") as fp:
+        fp.write(" ITERATION  ENERGY          1e-ENERGY        2e-ENERGY     NORM[dD(SAO)]  TOL\n")
+        for i, (energy, density_change) in enumerate(iterations):
+            fp.write(iteration_line(i + 1, energy, density_change) + "\n")
+        fp.write(partial)
+    return scf_monitor.ScfMonitor(str(path), thresholds)
+
+
+def converging(num_iterations):
+    return [(-76.0 + 0.5 ** i, 0.0 if i == 0 else 0.5 ** i) for i in range(num_iterations)]
+
+
+def test_converging_scf_goes_on(tmp_path):
+    monitor = monitor_of(tmp_path, converging(60))
+    assert monitor() is None
+    assert len(monitor.energies) == 60 and len(monitor.density_changes) == 59
+
+
+def test_no_verdict_before_min_iterations(tmp_path):
+    iterations = converging(5) + [(-60.0, 1.0)]
+    assert monitor_of(tmp_path, iterations)() is None
+    assert monitor_of(tmp_path, iterations, {"min_iterations": 4})() == "scf_diverged"
+
+
+def test_density_divergence(tmp_path):
+    iterations = converging(12) + [(-76.0, 1.0)]
+    assert monitor_of(tmp_path, iterations)() == "scf_diverged"
+
+
+def test_stall(tmp_path):
+    iterations = converging(10) + [(-76.0 + 1e-3, 1e-3)] * 45
+    assert monitor_of(tmp_path, iterations)() == "scf_stalled"
+    assert monitor_of(tmp_path, iterations, {"stall_iterations": 50})() is None
+
+
+def test_oscillation(tmp_path):
+    iterations = converging(10) + [(-76.0 + (1e-2 if i % 2 else 0.0), 1e-2) for i in range(20)]
+    assert monitor_of(tmp_path, iterations, {"stall_iterations": 1000})() == "scf_oscillating"
+    assert monitor_of(tmp_path, iterations, {"stall_iterations": 1000, "oscillation_energy": 1.0})() is None
+
+
+def test_incomplete_line_is_read_once_complete(tmp_path):
+    line = iteration_line(3, -76.0, 0.1)
+    monitor = monitor_of(tmp_path, converging(2), partial=line[:20])
+    monitor.read()
+    assert len(monitor.energies) == 2
+    with open(monitor.path, "a") as fp:
+        fp.write(line[20:] + "\n")
+    monitor.read()
+    assert len(monitor.energies) == 3
+
+
+def test_parse_thresholds():
+    assert scf_monitor.parse_thresholds(["stall_iterations=60"]) == {"stall_iterations": 60.0}
+    with pytest.raises(ValueError):
+        scf_monitor.parse_thresholds(["no_such_threshold=1"])
@@ -0,0 +1,70 @@
+import multiprocessing
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import utils.scratch as scratch
+from conftest import repo_dir
+
+
+def test_reused_worker_rundir_is_cleared(tmp_path):
+    rundir = scratch.worker_rundir(str(tmp_path), "dft")
+    (tmp_path / rundir / "mos").write_text("orbitals of the last job")
+    os.makedirs(os.path.join(rundir, "subdir", "deeper"))
+    # the next job of the same worker gets the same directory, empty
+    assert scratch.worker_rundir(str(tmp_path), "dft") == rundir
+    assert os.listdir(rundir) == []
+    # other workers, here threads, get directories of their own
+    other = []
+    thread = threading.Thread(target=lambda: other.append(scratch.worker_rundir(str(tmp_path), "dft")))
+    thread.start()
+    thread.join()
+    assert other[0] != rundir and os.path.isdir(other[0])
+
+
+def test_copy_back_leaves_a_fresh_rundir(tmp_path):
+    rundir = scratch.worker_rundir(str(tmp_path / "scratch"), "dft")
+    for filename in ("energy", "mos", "TM.out"):
+        (tmp_path / rundir / filename).write_text(filename)
+    scratch.copy_back(rundir, str(tmp_path / "done"), keep_files=["energy", "TM.out"])
+    assert os.listdir(rundir) == []
+    scratch.wait_for_copy_back()
+    assert sorted(os.listdir(str(tmp_path / "done"))) == ["TM.out", "energy"]
+    # the renamed copy of the run directory is gone once it is copied
+    assert os.listdir(str(tmp_path / "scratch")) == [os.path.basename(rundir)]
+
+
+def slow_copy_back(scratch_dir, destination):
+    """
+    Hands a calculation to the copy thread of this process, whose copying takes a while
+    """
+    copy_files = scratch._copy_files
+
+    def slow_copy_files(*args):
+        time.sleep(0.5)
+        copy_files(*args)
+
+    scratch._copy_files = slow_copy_files
+    rundir = scratch.worker_rundir(scratch_dir, "dft")
+    with open(os.path.join(rundir, "energy"), "w") as fp:
+        fp.write("-76.4")
+    scratch.copy_back(rundir, destination)
+
+
+def test_pool_worker_waits_for_its_copy_back_before_it_exits(tmp_path):
+    with multiprocessing.get_context("fork").Pool(1) as pool:
+        pool.apply(slow_copy_back, (str(tmp_path / "scratch"), str(tmp_path / "done")))
+        assert not os.path.exists(str(tmp_path / "done"))
+        pool.close()
+        pool.join()
+    assert (tmp_path / "done" / "energy").read_text() == "-76.4"
+
+
+def test_script_waits_for_its_copy_back_before_it_exits(tmp_path):
+    subprocess.run([sys.executable, "-c", "import sys; sys.path[:0] = [%r, %r]; import test_scratch; "
+                    "test_scratch.slow_copy_back(%r, %r)" % (repo_dir, os.path.join(repo_dir, "tests"),
+                                                             str(tmp_path / "scratch"), str(tmp_path / "done"))],
+                   check=True)
+    assert (tmp_path / "done" / "energy").read_text() == "-76.4"
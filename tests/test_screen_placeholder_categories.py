@@ -0,0 +1,57 @@
+import json
+import os
+
+import numpy as np
+
+import screen_placeholder_categories as screening
+import utils.cores as cores
+import utils.xtb_utils as xtb
+import utils.xyz_utils as xyz
+from conftest import repo_dir
+from create_placeholder_categories import create_placeholder_categories
+from parallel_qm import find_all_task_dirs
+
+
+def test_rejected_geometries_are_refilled_on_one_pool(tmp_path, stand_ins, monkeypatch):
+    # every third geometry of the pool is compressed, which lowers its xtb energy by about 1.3 eV
+    coords, elements = xyz.readXYZs(os.path.join(repo_dir, "input_files", "alathr_valval_alaala.xyz"))
+    rng = np.random.default_rng(0)
+    pool = [np.array(coords[0]) * (0.6 if i % 3 == 0 else 1.0) + rng.normal(scale=0.05, size=np.shape(coords[0]))
+            for i in range(40)]
+    xyz.exportXYZs(pool, [elements[0]] * len(pool), str(tmp_path / "pool.xyz"))
+    with open(tmp_path / "flavours.json", "w") as fp:
+        json.dump({"functionals": ["b-p", "pbe"], "basissets": ["def-SVP"]}, fp)
+    temp_dir = str(tmp_path / "placeholder")
+    create_placeholder_categories(str(tmp_path / "flavours.json"), str(tmp_path / "pool.xyz"), 5, temp_dir,
+                                  overlap=0.4, seed=0)
+
+    pools, batches = [], []
+    make_pool, xtb_batch = cores.make_pool, xtb.xtb_batch
+    monkeypatch.setattr(cores, "make_pool", lambda *args, **kwargs: pools.append(args) or make_pool(*args, **kwargs))
+    monkeypatch.setattr(xtb, "xtb_batch", lambda coords, *args, **kwargs: batches.append(len(coords)) or
+                        xtb_batch(coords, *args, **kwargs))
+    replacements = screening.screen_placeholder_categories(temp_dir, window_above=0.5, window_below=0.5, num_workers=1)
+
+    assert len(replacements) > 0 and all(i % 3 == 0 and j % 3 != 0 for i, j in replacements.items())
+    # the first screening and the refill rounds all ran on the one pool
+    assert len(pools) == 1 and len(batches) >= 2
+    with np.load(os.path.join(temp_dir, screening.screening_name)) as data:
+        energies = dict(zip(data["indices"].tolist(), data["energies"].tolist()))
+    assert len(energies) == sum(batches)
+
+    path_to_tasks = os.path.join(temp_dir, "tasks")
+    replaced = {}
+    for task_dir in find_all_task_dirs(path_to_tasks):
+        with open(os.path.join(path_to_tasks, task_dir, "info.json")) as fp:
+            info = json.load(fp)
+        indices = info["sample_indices"]
+        assert len(indices) == 5 and all(i % 3 != 0 for i in indices)
+        # one composition in the pool
+        [reference] = info["screening"]["reference_energies"].values()
+        assert all(abs(energies[i] - reference) <= 0.5 for i in indices)
+        for old, new in info["screening"]["replaced"].items():
+            assert replaced.setdefault(old, new) == new and indices.count(new) == 1
+        xyz_file = [x for x in os.listdir(os.path.join(path_to_tasks, task_dir)) if x.endswith(".xyz")][0]
+        task_coords, _ = xyz.readXYZs(os.path.join(path_to_tasks, task_dir, xyz_file))
+        assert np.allclose(task_coords, [pool[i] for i in indices], atol=1e-6)
+    assert replaced == {str(i): j for i, j in replacements.items()}
@@ -0,0 +1,73 @@
+import os
+import time
+from multiprocessing.pool import ThreadPool
+
+import numpy as np
+import pytest
+
+import parallel_qm
+import utils.dispatch as dispatch
+import utils.metrics as metrics
+import utils.warm_start as warm_start
+
+settings = {"turbomole_functional": "pbe", "turbomole_basis": "def-SVP", "turbomole_method": "ridft"}
+coords = np.array([[0.0, 0.0, 0.0], [1.1, 0.0, 0.0]])
+elements = ["C", "O"]
+
+
+def test_key_ignores_the_functional_but_not_the_basis():
+    key = warm_start.warm_start_key(coords, elements, settings, 0, None)
+    assert key == warm_start.warm_start_key(coords, elements, dict(settings, turbomole_functional="b-p"), 0, None)
+    assert key != warm_start.warm_start_key(coords, elements, dict(settings, turbomole_basis="def2-TZVP"), 0, None)
+    assert key != warm_start.warm_start_key(coords + 0.1, elements, settings, 0, None)
+    assert key != warm_start.warm_start_key(coords, elements, settings, 1, None)
+
+
+def test_first_orbitals_win(tmp_path):
+    store, first, second, target = (tmp_path / name for name in ("store", "first", "second", "target"))
+    for directory in (first, second, target):
+        directory.mkdir()
+    (first / "mos").write_text("first")
+    (second / "mos").write_text("second")
+    assert not warm_start.seed_orbitals(str(store), "key", str(target))
+    warm_start.keep_orbitals(str(store), "key", str(first))
+    warm_start.keep_orbitals(str(store), "key", str(second))
+    assert warm_start.seed_orbitals(str(store), "key", str(target))
+    assert (target / "mos").read_text() == "first"
+
+
+def test_flavours_of_a_geometry_wait_for_the_first_one():
+    cheap = dict(settings, turbomole_functional="b-p")
+    expensive = dict(settings, turbomole_functional="b3-lyp")
+    other_basis = dict(settings, turbomole_basis="def2-TZVP")
+    datas = [[coords, elements, cheap], [coords + 0.1, elements, cheap], [coords, elements, expensive],
+             [coords + 0.1, elements, expensive], [coords, elements, other_basis]]
+    assert parallel_qm.warm_start_dependencies(datas) == [None, None, 0, 1, None]
+
+
+def timed_sleep(job):
+    index, seconds = job
+    start = time.time()
+    time.sleep(seconds)
+    return index, start, time.time()
+
+
+def test_dispatch_holds_back_jobs_until_the_job_they_wait_for_finished():
+    jobs = [(0, 0.3), (1, 0.0), (2, 0.0)]
+    with ThreadPool(3) as pool:
+        times = {index: (start, end) for index, start, end in
+                 dispatch.imap_unordered(pool, 3, timed_sleep, jobs, after=[None, 0, None])}
+    assert times[1][0] >= times[0][1]
+    # the job that waits for nothing does not wait behind it
+    assert times[2][1] < times[0][1]
+
+
+@pytest.mark.parametrize("mode", [[], ["--global_pool"]])
+def test_cheap_flavour_seeds_the_expensive_one(tmp_path, stand_ins, make_placeholder, run_categories, mode):
+    # the expensive flavour comes first in the task order of the placeholder categories
+    make_placeholder(["b3-lyp", "b-p"], ["def-SVP"], 3, overlap=1.0)
+    run_categories(stand_ins, "--warm_start", *mode)
+    records = metrics.read_metrics(str(tmp_path / "output" / "metrics"))
+    seeded = {(r["functional"], r["molidx"]): r["warm_start"] for r in records}
+    assert seeded == {("b-p", i): False for i in range(3)} | {("b3-lyp", i): True for i in range(3)}
+    assert len(os.listdir(tmp_path / "placeholder" / "warm_start")) == 3
@@ -0,0 +1,27 @@
+import os
+
+import numpy as np
+
+import utils.cores as cores
+import utils.xtb_utils as xtb
+import utils.xyz_utils as xyz
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_xtb_batch_runs_on_the_pool_of_the_caller(tmp_path, monkeypatch):
+    monkeypatch.setenv("PATH", os.path.join(repo_dir, "benchmarks", "bin") + os.pathsep + os.environ["PATH"])
+    monkeypatch.setenv("FAKE_QM_SCALE", "0")
+    coords, elements = xyz.readXYZs(os.path.join(repo_dir, "input_files", "alathr_valval_alaala.xyz"))
+    batch = np.array([np.array(coords[0]) + 0.01 * i for i in range(5)])
+    pool, num_workers = cores.make_pool(2, 1, backend="thread")
+    with pool:
+        energies, gradients = xtb.xtb_batch(batch, elements[0], number_of_workers=num_workers, grad=True, chunk_size=2,
+                                            scratch_dir=str(tmp_path), pool=pool)
+        # the pool stays open for the next batch
+        again, _ = xtb.xtb_batch(batch[:1], elements[0], number_of_workers=num_workers, scratch_dir=str(tmp_path),
+                                 pool=pool)
+    assert np.all(np.isfinite(energies)) and gradients.shape == batch.shape
+    # translated copies of one geometry
+    assert np.allclose(energies, energies[0])
+    assert again[0] == energies[0]
@@ -0,0 +1,34 @@
+import os
+
+import numpy as np
+
+import utils.xyz_index as xyz_index
+import utils.xyz_utils as xyz
+
+
+def write_pool(filename):
+    coords = [np.arange(3 * n, dtype=float).reshape(n, 3) + i for i, n in enumerate((2, 3, 2))]
+    elements = [["C", "O"], ["H", "H", "O"], ["N", "N"]]
+    xyz.exportXYZs(coords, elements, filename)
+    return coords, elements
+
+
+def test_read_frames_through_the_index(tmp_path):
+    filename = str(tmp_path / "pool.xyz")
+    coords, elements = write_pool(filename)
+    index = xyz_index.load_index(filename)
+    assert index["natoms"].tolist() == [2, 3, 2]
+    assert os.path.exists(xyz_index.index_path(filename))
+    frames = xyz_index.read_pool_frames(filename, [2, 0])
+    assert sorted(frames) == [0, 2]
+    np.testing.assert_allclose(frames[2][0], coords[2])
+    assert [e.capitalize() for e in frames[0][1]] == elements[0]
+
+
+def test_outdated_index_is_rebuilt(tmp_path):
+    filename = str(tmp_path / "pool.xyz")
+    write_pool(filename)
+    xyz_index.load_index(filename)
+    xyz.exportXYZs([np.zeros((1, 3))], [["H"]], filename)
+    os.utime(filename, ns=(1, 1))
+    assert xyz_index.load_index(filename)["natoms"].tolist() == [1]
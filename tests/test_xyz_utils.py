@@ -0,0 +1,99 @@
+import glob
+import os
+
+import numpy as np
+import pytest
+
+import utils.xyz_utils as xyz
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+input_files = sorted(glob.glob(os.path.join(repo_dir, "input_files", "*.xyz")))
+
+
+def baseline_exportXYZs(coords, elements, filename):
+    # the writer before the packed arrays, the output has to stay the same byte for byte
+    outfile = open(filename, "w")
+    for idx in range(len(coords)):
+        outfile.write("%i\n\n" % (len(elements[idx])))
+        for atomidx, atom in enumerate(coords[idx]):
+            outfile.write("%s %f %f %f\n" % (elements[idx][atomidx].capitalize(), atom[0], atom[1], atom[2]))
+    outfile.close()
+
+
+def baseline_readXYZs(filename):
+    infile = open(filename, "r")
+    coords = [[]]
+    elements = [[]]
+    for line in infile.readlines():
+        if len(line.split()) == 1 and len(coords[-1]) != 0:
+            coords.append([])
+            elements.append([])
+        elif len(line.split()) == 4:
+            elements[-1].append(line.split()[0].capitalize())
+            coords[-1].append([float(line.split()[1]), float(line.split()[2]), float(line.split()[3])])
+    infile.close()
+    return coords, elements
+
+
+@pytest.mark.parametrize("filename", input_files, ids=os.path.basename)
+def test_same_frames_and_bytes_as_the_baseline(tmp_path, filename):
+    coords, elements = xyz.readXYZs(filename)
+    baseline_coords, baseline_elements = baseline_readXYZs(filename)
+    assert elements == baseline_elements
+    assert all(np.array_equal(a, b) for a, b in zip(coords, baseline_coords)) and len(coords) == len(baseline_coords)
+
+    xyz.exportXYZs(coords, elements, str(tmp_path / "packed.xyz"))
+    baseline_exportXYZs(coords, elements, str(tmp_path / "baseline.xyz"))
+    assert (tmp_path / "packed.xyz").read_bytes() == (tmp_path / "baseline.xyz").read_bytes()
+
+
+def mixed_frames(rng, sizes):
+    symbols = ["C", "H", "N", "O", "Cl"]
+    coords = [np.round(rng.normal(scale=3.0, size=(n, 3)), 6).tolist() for n in sizes]
+    elements = [[symbols[i] for i in rng.integers(len(symbols), size=n)] for n in sizes]
+    return coords, elements
+
+
+@pytest.mark.parametrize("block_size", [1, 4, 7, 1000000])
+def test_blocks_and_mixed_atom_counts(tmp_path, monkeypatch, block_size):
+    monkeypatch.setattr(xyz, "read_block_size", block_size)
+    sizes = [3, 5, 1, 8, 2, 6]
+    coords, elements = mixed_frames(np.random.default_rng(0), sizes)
+    xyz.exportXYZs(coords, elements, str(tmp_path / "mixed.xyz"))
+    coords_packed, numbers, offsets = xyz.read_xyz_packed(str(tmp_path / "mixed.xyz"))
+    assert np.diff(offsets).tolist() == sizes and coords_packed.shape == (sum(sizes), 3)
+    assert xyz.unpack_frames(coords_packed, numbers, offsets) == (coords, elements)
+    # the packed writer with smaller frame blocks writes the same file
+    xyz.export_xyz_packed(coords_packed, numbers, offsets, str(tmp_path / "blocks.xyz"), block_size=2)
+    assert (tmp_path / "blocks.xyz").read_bytes() == (tmp_path / "mixed.xyz").read_bytes()
+
+
+def test_trailing_blank_lines_comments_and_extra_columns(tmp_path):
+    (tmp_path / "odd.xyz").write_text("2\nenergy: -1.5\nc 0.0 0.0 0.0 0.1 0.2 0.3\nO 1.2 0.0 0.0 0.0 0.0 0.0\n"
+                                      "1\n\nH 0.5 0.5 0.5\n\n\n")
+    coords, elements = xyz.readXYZs(str(tmp_path / "odd.xyz"))
+    assert elements == [["C", "O"], ["H"]]
+    assert coords == [[[0.0, 0.0, 0.0], [1.2, 0.0, 0.0]], [[0.5, 0.5, 0.5]]]
+
+
+def test_empty_file(tmp_path):
+    (tmp_path / "empty.xyz").write_text("")
+    coords_packed, numbers, offsets = xyz.read_xyz_packed(str(tmp_path / "empty.xyz"))
+    assert coords_packed.shape == (0, 3) and len(numbers) == 0 and offsets.tolist() == [0]
+
+
+@pytest.mark.parametrize("suffix", [".gz", ".xz"])
+def test_compressed_round_trip(tmp_path, suffix):
+    coords, elements = mixed_frames(np.random.default_rng(1), [4, 2, 7])
+    xyz.exportXYZs(coords, elements, str(tmp_path / ("frames.xyz" + suffix)))
+    xyz.exportXYZs(coords, elements, str(tmp_path / "frames.xyz"))
+    with xyz.open_xyz(str(tmp_path / ("frames.xyz" + suffix))) as fp:
+        assert fp.read() == (tmp_path / "frames.xyz").read_text()
+    assert xyz.readXYZs(str(tmp_path / ("frames.xyz" + suffix))) == (coords, elements)
+
+
+def test_pack_and_unpack_are_inverse():
+    coords, elements = mixed_frames(np.random.default_rng(2), [3, 0, 2])
+    packed = xyz.pack_frames(coords, elements)
+    assert packed[2].tolist() == [0, 3, 3, 5]
+    assert xyz.unpack_frames(*packed) == (coords, elements)
@@ -0,0 +1,108 @@
+import fcntl
+import io
+import json
+import os
+import tarfile
+
+# An archive is a pair of files: <name>.pack holds one gzip compressed tar blob per calculation,
+# appended one after the other, and <name>.index.jsonl holds one line per blob with its offset and length.
+# Both are append-only, so a single calculation can be read back with one seek.
+
+
+def index_path(archive_path):
+    return "%s.index.jsonl" % (os.path.splitext(archive_path)[0])
+
+
+def archive_calculation(archive_path, name, calc_dir, keep_files=None):
+    """
+    Appends the files of a calculation directory to an archive
+    :param archive_path: path to the .pack file
+    :param name: name of the calculation in the archive
+    :param calc_dir: calculation directory
+    :param keep_files: names of the files to archive, None to archive all files
+    """
+    filenames = sorted([f for f in os.listdir(calc_dir)
+                        if os.path.isfile(os.path.join(calc_dir, f)) and (keep_files is None or f in keep_files)])
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w:gz") as tar:
+        for filename in filenames:
+            tar.add(os.path.join(calc_dir, filename), arcname=filename)
+    blob = buffer.getvalue()
+
+    archive_dir = os.path.dirname(os.path.abspath(archive_path))
+    if not os.path.exists(archive_dir):
+        os.makedirs(archive_dir, exist_ok=True)
+
+    # several workers append to the same archive, the lock on the pack file also protects the index
+    with open(archive_path, "ab") as pack:
+        fcntl.flock(pack, fcntl.LOCK_EX)
+        try:
+            pack.seek(0, os.SEEK_END)
+            offset = pack.tell()
+            pack.write(blob)
+            pack.flush()
+            os.fsync(pack.fileno())
+            entry = {"name": name, "offset": offset, "length": len(blob), "files": filenames}
+            with open(index_path(archive_path), "a+") as index:
+                # a line cut short by a crash is ended first, the new entry would be lost in it otherwise
+                index.seek(0, os.SEEK_END)
+                if index.tell() > 0:
+                    index.seek(index.tell() - 1)
+                    if index.read(1) != "\n":
+                        index.write("\n")
+                index.write(json.dumps(entry) + "\n")
+                index.flush()
+                os.fsync(index.fileno())
+        finally:
+            fcntl.flock(pack, fcntl.LOCK_UN)
+
+
+def read_index(archive_path):
+    """
+    Reads the index of an archive
+    :return: dictionary from calculation name to its index entry (the last one, if a name was archived twice)
+    """
+    entries = {}
+    if not os.path.exists(index_path(archive_path)):
+        return entries
+    for line in open(index_path(archive_path), "r"):
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            continue
+        entries[entry["name"]] = entry
+    return entries
+
+
+def _open_calculation(archive_path, entry):
+    with open(archive_path, "rb") as pack:
+        pack.seek(entry["offset"])
+        blob = pack.read(entry["length"])
+    return tarfile.open(fileobj=io.BytesIO(blob), mode="r:gz")
+
+
+def read_file(archive_path, name, filename):
+    """
+    Reads one file of one calculation without extracting the archive
+    :return: content of the file as string
+    """
+    entries = read_index(archive_path)
+    if name not in entries:
+        raise KeyError("calculation %s not found in %s" % (name, archive_path))
+    with _open_calculation(archive_path, entries[name]) as tar:
+        return tar.extractfile(filename).read().decode("utf8")
+
+
+def extract_calculation(archive_path, name, outdir):
+    """
+    Extracts one calculation of an archive into outdir
+    """
+    entries = read_index(archive_path)
+    if name not in entries:
+        raise KeyError("calculation %s not found in %s" % (name, archive_path))
+    if not os.path.exists(outdir):
+        os.makedirs(outdir)
+    with _open_calculation(archive_path, entries[name]) as tar:
+        for filename in entries[name]["files"]:
+            with open(os.path.join(outdir, filename), "wb") as fp:
+                fp.write(tar.extractfile(filename).read())
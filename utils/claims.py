@@ -0,0 +1,184 @@
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# Several launches (e.g. the elements of a SLURM array) share one temp_dir. A launch claims a task by renaming
+# its directory from tasks/ to running/, a rename succeeds for exactly one of the launches trying it.
+# The claimer writes its lease into the task before the rename (as a pending lease, named after the claimer,
+# so launches racing for the same task do not overwrite each other's), turns it into running/<task>/lease.json
+# after the rename and renews it (its mtime) in a background thread. A claimed task therefore always has a lease.
+# A lease not renewed for lease_timeout seconds belongs to a dead launch: any launch renames the lease away,
+# which tells a launch that merely stalled that it lost the task, and renames the task back to tasks/,
+# where it is claimed again and resumes from its checkpoint journal.
+# Lease ages are measured against the clock of the shared filesystem, not the clock of the node.
+
+lease_name = "lease.json"
+expired_lease_name = "lease.expired"
+
+
+def pending_lease_name(owner):
+    return "lease_%s.pending" % (owner.replace(":", "_"))
+
+
+def owner_id():
+    return "%s:%i:%s" % (socket.gethostname(), os.getpid(), uuid.uuid4().hex[:8])
+
+
+def filesystem_time(directory, owner):
+    """
+    Current time of the filesystem that holds directory, read from the mtime of a freshly written file
+    """
+    path = os.path.join(directory, ".clock_%s" % (owner.replace(":", "_")))
+    with open(path, "w") as fp:
+        fp.write(owner)
+    mtime = os.stat(path).st_mtime
+    os.remove(path)
+    return mtime
+
+
+def claim_task(path_to_tasks, path_to_running, task_dirs, owner):
+    """
+    Claims the first task of task_dirs that no other launch has claimed
+    :return: path of the claimed task in path_to_running, None if all tasks are taken
+    """
+    os.makedirs(path_to_running, exist_ok=True)
+    pending_name = pending_lease_name(owner)
+    for task_dir in task_dirs:
+        path_to_task = os.path.join(path_to_running, task_dir)
+        try:
+            with open(os.path.join(path_to_tasks, task_dir, pending_name), "w") as fp:
+                json.dump({"owner": owner, "claimed": time.time()}, fp)
+            os.rename(os.path.join(path_to_tasks, task_dir), path_to_task)
+        except FileNotFoundError:
+            # claimed by another launch in the meantime, the pending lease may have moved along with the task
+            try:
+                os.remove(os.path.join(path_to_task, pending_name))
+            except OSError:
+                pass
+            continue
+        os.replace(os.path.join(path_to_task, pending_name), os.path.join(path_to_task, lease_name))
+        # leases of earlier owners and of launches that lost the race
+        for name in os.listdir(path_to_task):
+            if name.startswith("lease") and name != lease_name:
+                try:
+                    os.remove(os.path.join(path_to_task, name))
+                except OSError:
+                    pass
+        logger.info("Claimed task %s", task_dir)
+        return path_to_task
+    return None
+
+
+def lease_owner(path_to_task):
+    try:
+        with open(os.path.join(path_to_task, lease_name), "r") as fp:
+            return json.load(fp)["owner"]
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def release_task(path_to_task, owner):
+    """
+    Gives up the lease of a task before it is moved to done
+    :return: False if the lease had been taken away in the meantime
+    """
+    if lease_owner(path_to_task) != owner:
+        return False
+    os.remove(os.path.join(path_to_task, lease_name))
+    return True
+
+
+def reclaim_expired(path_to_running, path_to_tasks, lease_timeout, owner):
+    """
+    Puts the tasks whose lease has expired back into path_to_tasks
+    :return: number of reclaimed tasks
+    """
+    if not os.path.exists(path_to_running):
+        return 0
+    now = filesystem_time(path_to_running, owner)
+    reclaimed = 0
+    for task_dir in sorted(os.listdir(path_to_running)):
+        path_to_task = os.path.join(path_to_running, task_dir)
+        if not os.path.isdir(path_to_task):
+            continue
+        try:
+            # lease.json, the pending lease of a claim in progress or the lease of an interrupted reclaim
+            leases = [(os.stat(os.path.join(path_to_task, name)).st_mtime, name)
+                      for name in os.listdir(path_to_task) if name.startswith("lease")]
+            if len(leases) == 0:
+                logger.warning("Task %s is running without a lease, leaving it alone", task_dir)
+                continue
+            renewed, newest = max(leases)
+            if now - renewed < lease_timeout:
+                continue
+            # only one of the launches reclaiming at the same time gets to rename the lease
+            if newest != expired_lease_name:
+                os.rename(os.path.join(path_to_task, newest), os.path.join(path_to_task, expired_lease_name))
+            os.rename(path_to_task, os.path.join(path_to_tasks, task_dir))
+        except FileNotFoundError:
+            # finished or reclaimed by another launch in the meantime
+            continue
+        logger.warning("Reclaimed task %s, its lease was not renewed for %.0f s", task_dir, now - renewed)
+        reclaimed += 1
+    return reclaimed
+
+
+def running_tasks(path_to_running):
+    if not os.path.exists(path_to_running):
+        return []
+    return [d for d in os.listdir(path_to_running) if os.path.isdir(os.path.join(path_to_running, d))]
+
+
+class Heartbeat:
+    """
+    Renews the lease of a claimed task every interval seconds until stopped. If the lease is lost,
+    because this launch stalled for longer than the lease timeout and the task was reclaimed,
+    lost_event is set: the running calculations of the task have to be stopped and its results discarded.
+    """
+
+    def __init__(self, path_to_task, owner, interval):
+        self.path_to_task = path_to_task
+        self.owner = owner
+        self.interval = interval
+        self.lost_event = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    @property
+    def lost(self):
+        return self.lost_event.is_set()
+
+    def held(self):
+        """
+        Checks the lease right now, e.g. before a result is written into the task
+        :return: True if this launch still holds the lease
+        """
+        if not self.lost and lease_owner(self.path_to_task) != self.owner:
+            self._lose()
+        return not self.lost
+
+    def _lose(self):
+        if not self.lost:
+            logger.warning("Lost the lease of task %s", self.path_to_task)
+        self.lost_event.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            if not self.held():
+                return
+            try:
+                os.utime(os.path.join(self.path_to_task, lease_name))
+            except OSError:
+                self._lose()
+                return
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
@@ -0,0 +1,142 @@
+import logging
+import warnings
+
+logger = logging.getLogger(__name__)
+
+# A Turbomole control file is a sequence of data groups: a keyword line ($dft, $disp3, $atoms, ...) followed by
+# its continuation lines, closed by $end. ControlFile holds the groups in memory, so that the functional,
+# dispersion, solvent and population statements of a calculation are all applied to what define wrote
+# and control is written back once, instead of being read and rewritten for every statement.
+
+
+def keyword(line):
+    fields = line.split()
+    if len(fields) == 0:
+        return None
+    return fields[0]
+
+
+class ControlFile:
+    """
+    Data groups of a control file
+    :param lines: lines of the file, without line breaks
+    """
+
+    def __init__(self, lines):
+        # lines before the first data group, if any, are kept as a group without keyword
+        self.groups = [[]]
+        for line in lines:
+            if keyword(line) == "$end":
+                break
+            if line.startswith("$"):
+                self.groups.append([line])
+            else:
+                self.groups[-1].append(line)
+        if len(self.groups[0]) == 0:
+            self.groups.pop(0)
+
+    @classmethod
+    def read(cls, path):
+        with open(path, "r") as fp:
+            return cls(fp.read().splitlines())
+
+    def text(self):
+        return "".join("%s\n" % (line) for group in self.groups for line in group) + "$end\n"
+
+    def write(self, path):
+        with open(path, "w") as fp:
+            fp.write(self.text())
+
+    def find(self, statement):
+        """
+        :return: the data group of the keyword of statement (e.g. "$cosmo" for "$cosmo"), None if there is none
+        """
+        for group in self.groups:
+            if keyword(group[0]) == keyword(statement):
+                return group
+        return None
+
+    def add(self, statement):
+        """
+        Adds a data group, or a line to the last data group if statement is no keyword line (e.g. "   epsilon=78.3"
+        after "$cosmo"). Nothing is added if the keyword of statement is there already.
+        """
+        if statement.startswith("$"):
+            if self.find(statement) is None:
+                self.groups.append([statement])
+        elif not any(keyword(line) == keyword(statement) for line in self.groups[-1][1:]):
+            self.groups[-1].append(statement)
+
+    def remove(self, statement):
+        """
+        Removes the data group of the keyword of statement with all its lines
+        """
+        self.groups = [group for group in self.groups if keyword(group[0]) != keyword(statement)]
+
+    def replace(self, statement, lines=()):
+        """
+        Replaces the data group of the keyword of statement by statement and lines, or adds it
+        """
+        group = self.find(statement)
+        if group is None:
+            self.groups.append([statement] + list(lines))
+        else:
+            group[:] = [statement] + list(lines)
+
+    def set_functional(self, functional):
+        """
+        Sets the functional of the $dft group, define always writes b-p. Without $dft (Hartree-Fock) nothing changes.
+        """
+        group = self.find("$dft")
+        if group is None:
+            return
+        for i, line in enumerate(group):
+            if "functional" in line:
+                group[i] = line.replace(line.split()[1], functional, 1) if len(line.split()) > 1 else line
+
+    def functional(self):
+        group = self.find("$dft")
+        if group is not None:
+            for line in group:
+                if "functional" in line:
+                    return line.split()[1]
+        return None
+
+    def basis(self):
+        """
+        Basis of the first atom in $atoms
+        """
+        for group in self.groups:
+            for line in group:
+                if "basis =" in line:
+                    return line.split()[2]
+        return None
+
+
+def check_basis_and_func(control, basis_todo, func_todo, name):
+    """
+    Checks that define applied the requested basis and functional
+    :param control: ControlFile
+    :param func_todo: functional, "HF" for Hartree-Fock, which has no $dft group
+    :param name: path of the control file, for the warnings
+    :return: True if both are the requested ones
+    """
+    basis = control.basis()
+    func = control.functional()
+    func_expected = None if func_todo.upper() == "HF" else func_todo
+    if basis is None:
+        warnings.warn(f"Warning: No basis found in control file! (Path to control: {name})")
+    if func is None and func_expected is not None:
+        warnings.warn(f"Warning: No functional found in control file! (Path to control: {name})")
+    if basis != basis_todo:
+        warnings.warn(f"Warning: Wrong basis in control file: Expected {basis_todo} but found {basis}!"
+                      f" (Path to control: {name})")
+    if func != func_expected:
+        warnings.warn(f"Warning: Wrong functional in control file: Expected {func_todo} but found {func}! "
+                      f"(Path to control: {name})")
+
+    if basis != basis_todo or func != func_expected:
+        return False
+
+    logger.debug("basis and functional seems to be correct for %s", name)
+    return True
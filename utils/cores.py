@@ -0,0 +1,135 @@
+import logging
+import math
+import multiprocessing
+import os
+from multiprocessing.pool import Pool, ThreadPool
+
+import utils.log as log
+
+logger = logging.getLogger(__name__)
+
+# environment variables that control the number of threads of the external QM programs
+# (PARNODES is only used by the SMP binaries of Turbomole, i.e. with PARA_ARCH=SMP)
+thread_variables = ["OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS", "PARNODES"]
+
+
+def cgroup_cpu_limit():
+    """
+    Returns the number of CPUs allowed by the cgroup CPU quota, or None if there is no quota
+    """
+    try:
+        # cgroup v2
+        with open("/sys/fs/cgroup/cpu.max", "r") as fp:
+            quota, period = fp.read().split()[:2]
+        if quota != "max":
+            return max(1, math.ceil(int(quota) / int(period)))
+        return None
+    except (OSError, ValueError):
+        pass
+    try:
+        # cgroup v1
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us", "r") as fp:
+            quota = int(fp.read())
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us", "r") as fp:
+            period = int(fp.read())
+        if quota > 0 and period > 0:
+            return max(1, math.ceil(quota / period))
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def available_cpus():
+    """
+    Returns the ids of the CPUs this process may use, limited by the affinity mask,
+    SLURM_CPUS_PER_TASK and the cgroup CPU quota
+    """
+    if hasattr(os, "sched_getaffinity"):
+        cpus = sorted(os.sched_getaffinity(0))
+    else:
+        cpus = list(range(os.cpu_count()))
+
+    limit = len(cpus)
+    if os.environ.get("SLURM_CPUS_PER_TASK", "").isdigit():
+        limit = min(limit, int(os.environ["SLURM_CPUS_PER_TASK"]))
+    cgroup_limit = cgroup_cpu_limit()
+    if cgroup_limit is not None:
+        limit = min(limit, cgroup_limit)
+    return cpus[:max(1, limit)]
+
+
+def plan_core_budget(num_workers=None, threads_per_calc=None):
+    """
+    Splits the available CPUs between the pool size and the threads of each calculation
+    :param num_workers: requested number of workers, None to derive it from threads_per_calc
+    :param threads_per_calc: requested threads per calculation, None to give each worker an equal share
+    :return: number of workers, threads per calculation and one CPU set per worker
+    """
+    cpus = available_cpus()
+    num_cpus = len(cpus)
+
+    if num_workers is None:
+        threads = max(1, min(threads_per_calc or 1, num_cpus))
+        workers = max(1, num_cpus // threads)
+    else:
+        workers = max(1, min(num_workers, num_cpus))
+        if num_workers > num_cpus:
+            logger.warning("reducing the number of workers from %i to the %i available CPUs", num_workers, num_cpus)
+        threads = threads_per_calc or num_cpus // workers
+        if workers * threads > num_cpus:
+            logger.warning("%i workers with %i threads each would oversubscribe %i CPUs", workers, threads, num_cpus)
+            threads = max(1, num_cpus // workers)
+
+    cpu_sets = [cpus[i * threads:(i + 1) * threads] for i in range(workers)]
+    logger.info("Core budget: %i CPUs, %i workers with %i threads per calculation", num_cpus, workers, threads)
+    return workers, threads, cpu_sets
+
+
+def set_thread_environment(threads):
+    for variable in thread_variables:
+        os.environ[variable] = "%i" % (threads)
+
+
+def threads_per_calc():
+    """
+    Threads for an external calculation started by this process: the value set by the governor
+    if there is one, otherwise all available CPUs
+    """
+    if os.environ.get("OMP_NUM_THREADS", "").isdigit():
+        return int(os.environ["OMP_NUM_THREADS"])
+    return len(available_cpus())
+
+
+def init_worker(cpu_sets, next_cpu_set, threads, log_config):
+    """
+    Pool initializer: pins the worker to its own CPU set, which the external programs it starts inherit,
+    and sets up its logging
+    :param cpu_sets: the CPU sets of all workers
+    :param next_cpu_set: shared counter, each worker takes the CPU set of the value it finds
+    """
+    with next_cpu_set.get_lock():
+        index = next_cpu_set.value
+        next_cpu_set.value += 1
+    # a replacement worker finds the CPU sets all taken
+    cpu_set = cpu_sets[index] if index < len(cpu_sets) else None
+    if cpu_set is not None and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cpu_set)
+    set_thread_environment(threads)
+    log.setup_worker_logging(log_config)
+
+
+def make_pool(num_workers, threads_per_calc=None, backend="process"):
+    """
+    Creates a pool whose workers split the CPU allocation between them
+    :return: the pool and its number of workers
+    :param backend: "process" for forked workers pinned to their CPU sets, "thread" for threads of this process
+                    that only start and wait for the external programs (the calculations do not chdir, see engine.py)
+    """
+    workers, threads, cpu_sets = plan_core_budget(num_workers, threads_per_calc)
+    if backend == "thread":
+        # the programs of all threads inherit the thread count of this process, CPU pinning needs separate processes
+        set_thread_environment(threads)
+        return ThreadPool(workers), workers
+    next_cpu_set = multiprocessing.Value("i", 0)
+    return Pool(workers, initializer=init_worker,
+                initargs=(cpu_sets, next_cpu_set, threads, log.worker_config())), workers
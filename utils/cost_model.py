@@ -0,0 +1,206 @@
+import heapq
+import json
+import os
+import numpy as np
+
+# approximate number of (spherical) basis functions per atom: (hydrogen/helium, first row, heavier elements)
+basis_functions = {"def-SV(P)": (2, 14, 18),
+                   "def-SVP": (5, 14, 18),
+                   "def2-SV(P)": (2, 14, 18),
+                   "def2-SVP": (5, 14, 18),
+                   "def2-TZVP": (6, 31, 37),
+                   "def2-TZVPP": (14, 31, 37),
+                   "def2-QZVP": (30, 57, 62),
+                   "cc-pVDZ": (5, 14, 18),
+                   "aug-cc-pVDZ": (9, 23, 27),
+                   "cc-pVTZ": (14, 30, 34),
+                   "aug-cc-pVTZ": (23, 46, 50),
+                   "6-31G": (2, 9, 13),
+                   "6-31G*": (2, 14, 18),
+                   "6-31G**": (5, 14, 18),
+                   "6-311G": (3, 13, 21),
+                   "6-311G**": (6, 18, 26),
+                   "6-311++G**": (7, 22, 30),
+                   }
+default_basis_functions = (6, 25, 31)
+
+# functional classes of the Turbomole functionals in input_files/flavours.json
+functional_classes = {"HF": "hybrid",
+                      "s-vwn": "gga",
+                      "b-p": "gga",
+                      "pbe": "gga",
+                      "b97-d": "gga",
+                      "b97-3c": "gga",
+                      "tpss": "meta-gga",
+                      "m06-l": "meta-gga",
+                      "b3-lyp": "hybrid",
+                      "bh-lyp": "hybrid",
+                      "pbe0": "hybrid",
+                      "tpssh": "meta-hybrid",
+                      "m06": "meta-hybrid",
+                      "m06-2x": "meta-hybrid",
+                      "bmk": "meta-hybrid",
+                      }
+default_functional_class = "hybrid"
+
+# relative cost of the functional classes, exact exchange is not accelerated by RI-J
+class_factors = {"gga": 1.0,
+                 "meta-gga": 1.3,
+                 "hybrid": 2.5,
+                 "meta-hybrid": 3.0}
+
+
+def count_basis_functions(elements, basis):
+    per_atom = basis_functions.get(basis, default_basis_functions)
+    nbf = 0
+    for e in elements:
+        e = e.capitalize()
+        if e in ("H", "He"):
+            nbf += per_atom[0]
+        elif e in ("Li", "Be", "B", "C", "N", "O", "F", "Ne"):
+            nbf += per_atom[1]
+        else:
+            nbf += per_atom[2]
+    return nbf
+
+
+def functional_class(functional):
+    return functional_classes.get(functional, default_functional_class)
+
+
+def relative_cost(functional, basis, elements):
+    """
+    Relative cost of one SCF, used to order flavours from cheap to expensive
+    """
+    return class_factors[functional_class(functional)] * np.power(count_basis_functions(elements, basis), 3.0)
+
+
+# Wall time model: seconds = prefactor * class factor * method factor * nbf^exponent / threads.
+# The defaults are rough numbers for a small workstation, calibrate_cost_model replaces them with a fit
+# to the timings recorded by past runs (see record_timing).
+default_prefactor = 1e-6
+default_exponent = 3.0
+
+# relative cost of the Turbomole SCF programs, dscf computes the Coulomb part without RI
+method_factors = {"ridft": 1.0,
+                  "dscf": 3.0}
+
+# fewer records leave the defaults in place
+min_calibration_records = 5
+
+
+def default_calibration():
+    return {"prefactor": default_prefactor,
+            "exponent": default_exponent,
+            "class_factors": dict(class_factors),
+            "method_factors": dict(method_factors),
+            "num_records": 0}
+
+
+def predict_wall_time(functional, basis, elements, method="ridft", threads=1, calibration=None):
+    """
+    Predicts the wall time of one calculation
+    :param elements: element symbols of the molecule
+    :param method: turbomole_method, ridft or dscf
+    :param threads: threads of the calculation, assumed to scale perfectly
+    :param calibration: model parameters from calibrate_cost_model, None for the defaults
+    :return: wall time in seconds
+    """
+    if calibration is None:
+        calibration = default_calibration()
+    cpu_seconds = calibration["prefactor"] \
+        * calibration["class_factors"][functional_class(functional)] \
+        * calibration["method_factors"].get(method, 1.0) \
+        * np.power(count_basis_functions(elements, basis), calibration["exponent"])
+    return cpu_seconds / max(1, threads)
+
+
+def record_timing(timings_file, functional, basis, method, elements, threads, wall_time):
+    """
+    Appends the measured wall time of one calculation to a timings file (one JSON line per calculation),
+    with a single write on a file opened in append mode, so several runs can share the file
+    """
+    symbols, counts = np.unique([e.capitalize() for e in elements], return_counts=True)
+    line = json.dumps({"functional": functional,
+                       "basis": basis,
+                       "method": method,
+                       "composition": {s: int(c) for s, c in zip(symbols, counts)},
+                       "threads": int(threads),
+                       "wall_time": float(wall_time)}) + "\n"
+    fd = os.open(timings_file, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, line.encode("utf8"))
+    finally:
+        os.close(fd)
+
+
+def read_timings(timings_file):
+    records = []
+    if timings_file is None or not os.path.exists(timings_file):
+        return records
+    for line in open(timings_file, "r"):
+        try:
+            records.append(json.loads(line))
+        except ValueError:
+            continue
+    return records
+
+
+def calibrate_cost_model(timings_file):
+    """
+    Fits the wall time model to recorded timings: prefactor and exponent by least squares in log space,
+    then the factor of every functional class and method with enough records from its mean residual
+    :return: model parameters for predict_wall_time
+    """
+    calibration = default_calibration()
+    records = [r for r in read_timings(timings_file) if r["wall_time"] > 0]
+    if len(records) < min_calibration_records:
+        return calibration
+
+    nbf = []
+    log_cpu_seconds = []
+    for r in records:
+        elements = [s for s, c in r["composition"].items() for _ in range(c)]
+        nbf.append(count_basis_functions(elements, r["basis"]))
+        log_cpu_seconds.append(np.log(r["wall_time"] * r["threads"])
+                               - np.log(class_factors[functional_class(r["functional"])])
+                               - np.log(method_factors.get(r["method"], 1.0)))
+    log_nbf = np.log(np.array(nbf, dtype=np.float64))
+    log_cpu_seconds = np.array(log_cpu_seconds)
+
+    if np.ptp(log_nbf) > np.log(1.5):
+        A = np.stack([np.ones_like(log_nbf), log_nbf], axis=1)
+        (log_prefactor, exponent), _, _, _ = np.linalg.lstsq(A, log_cpu_seconds, rcond=None)
+        # keep the exponent physical, a narrow range of sizes can produce anything
+        exponent = float(np.clip(exponent, 1.5, 4.0))
+    else:
+        exponent = default_exponent
+    log_prefactor = float(np.mean(log_cpu_seconds - exponent * log_nbf))
+    residuals = log_cpu_seconds - exponent * log_nbf - log_prefactor
+
+    for key, factors, name_of in (("class_factors", class_factors, lambda r: functional_class(r["functional"])),
+                                  ("method_factors", method_factors, lambda r: r["method"])):
+        names = np.array([name_of(r) for r in records])
+        for name in set(names):
+            selected = names == name
+            if np.sum(selected) >= min_calibration_records:
+                correction = float(np.mean(residuals[selected]))
+                calibration[key][name] = factors.get(name, 1.0) * float(np.exp(correction))
+                # the method factors are fitted to what the class factors leave unexplained
+                residuals[selected] -= correction
+
+    calibration["prefactor"] = float(np.exp(log_prefactor))
+    calibration["exponent"] = exponent
+    calibration["num_records"] = len(records)
+    return calibration
+
+
+def simulate_makespan(wall_times, num_workers):
+    """
+    Simulates a pool that hands the jobs to whichever worker becomes free first, in the given order
+    :return: time until the last job finishes
+    """
+    finish_times = [0.0] * max(1, num_workers)
+    for wall_time in wall_times:
+        heapq.heapreplace(finish_times, finish_times[0] + wall_time)
+    return max(finish_times)
@@ -0,0 +1,69 @@
+import hashlib
+import json
+import os
+import shutil
+import uuid
+
+# files written by define (and the control patches) that are shared by all molecules of a flavour
+template_files = ["control", "basis", "auxbasis", "mos", "alpha", "beta"]
+
+
+def template_key(dft_settings, charge, uhf, disp, pop, water, elements):
+    """
+    Key of a define template. The elements are taken in atom order, because the $atoms group
+    of the control file refers to atom indices.
+    """
+    definition = {"functional": dft_settings["turbomole_functional"],
+                  "basis": dft_settings["turbomole_basis"],
+                  "method": dft_settings["turbomole_method"],
+                  "charge": int(charge),
+                  "uhf": uhf,
+                  "disp": bool(disp),
+                  "pop": bool(pop),
+                  "water": bool(water),
+                  "elements": [e.capitalize() for e in elements]}
+    return hashlib.sha1(json.dumps(definition, sort_keys=True).encode("utf8")).hexdigest()
+
+
+def is_unsupported(cache_dir, key):
+    return os.path.exists(os.path.join(cache_dir, "%s.unsupported" % (key)))
+
+
+def copy_template(cache_dir, key, moldir):
+    """
+    Copies the cached define output into moldir
+    :return: True if a template was found, False otherwise
+    """
+    template_dir = os.path.join(cache_dir, key)
+    if not os.path.isdir(template_dir):
+        return False
+    for filename in os.listdir(template_dir):
+        shutil.copy(os.path.join(template_dir, filename), os.path.join(moldir, filename))
+    return True
+
+
+def store_template(cache_dir, key, moldir, valid):
+    """
+    Stores the define output of moldir as template. If the requested basis or functional was not
+    applied by define, the combination is marked as unsupported instead.
+    Templates are built in a private directory and renamed into place, so concurrent workers
+    building the same template never see a half written one.
+    """
+    if not os.path.exists(cache_dir):
+        os.makedirs(cache_dir, exist_ok=True)
+
+    if not valid:
+        with open(os.path.join(cache_dir, "%s.unsupported" % (key)), "w") as fp:
+            fp.write("basis or functional was not applied by define in %s\n" % (os.path.abspath(moldir)))
+        return
+
+    build_dir = os.path.join(cache_dir, "build_%s" % (uuid.uuid4()))
+    os.makedirs(build_dir)
+    for filename in template_files:
+        if os.path.exists(os.path.join(moldir, filename)):
+            shutil.copy(os.path.join(moldir, filename), os.path.join(build_dir, filename))
+    try:
+        os.rename(build_dir, os.path.join(cache_dir, key))
+    except OSError:
+        # another worker stored the same template first
+        shutil.rmtree(build_dir)
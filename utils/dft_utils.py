@@ -1,15 +1,27 @@
 #!/usr/bin/env python
+import logging
 import os
 import numpy as np
 from io import StringIO
 import resource
 import subprocess
 import datetime
+import shutil
+import time
 import uuid
 
 import utils.xyz_utils as xyz
 import utils.xtb_utils as xtb
-import utils.miscall as misc
+import utils.define_cache as define_cache
+import utils.warm_start as warm_start
+import utils.scratch as scratch
+import utils.calc_archive as calc_archive
+import utils.result_cache as result_cache
+import utils.metrics as metrics
+import utils.engine as engine
+import utils.scf_monitor as scf_monitor
+import utils.qm_parsers as qm_parsers
+import utils.control_file as control_file
 
 kcal_to_eV = 0.0433641153
 kB = 8.6173303e-5  # eV/K
@@ -18,147 +30,220 @@ kBT = kB * T
 AToBohr = 1.889725989
 HToeV = 27.211399
 
+logger = logging.getLogger(__name__)
+
 def dft_calc(dft_settings, coords, elements, charge, opt=False, grad=False, hess=False, freeze=[], dirname = None, partial_chrg = False, unp_el = 1, dispersion= False, h20=False):
-    print("The dft settings in dft_calc are:", dft_settings)
+    logger.debug("The dft settings in dft_calc are: %s", dft_settings)
 
     if opt and grad:
-        exit("opt and grad are exclusive")
+        raise ValueError("opt and grad are exclusive")
     if hess and grad:
-        exit("hess and grad are exclusive")
+        raise ValueError("hess and grad are exclusive")
 
     if hess or grad:
         if len(freeze)!=0:
-            print("WARNING: please test the combination of hess/grad and freeze carefully")
-
+            logger.warning("please test the combination of hess/grad and freeze carefully")
+
+    # an identical calculation (same rounded geometry and level of theory) done before is not repeated
+    result_cache_dir = dft_settings.get("result_cache_dir")
+    if result_cache_dir is not None:
+        cache_key = result_cache.cache_key("dft", coords, elements, functional=dft_settings["turbomole_functional"],
+                                           basis=dft_settings["turbomole_basis"], turbomole_method=dft_settings["turbomole_method"],
+                                           charge=charge, unp_el=unp_el, dispersion=dispersion, h20=h20,
+                                           opt=opt, grad=grad, hess=hess, freeze=list(freeze), partial_chrg=partial_chrg)
+        cached = result_cache.lookup(result_cache_dir, cache_key)
+        if cached is not None:
+            logger.debug("Found the results in the result cache")
+            return(cached)
+
+    setup_start = time.time()
     if dirname is None:
         rundir="dft_tmpdir_%s"%(uuid.uuid4()) #creates a new temporary directory
     else:
         rundir = dirname
+
+    # in scratch mode the calculation runs in the worker's directory on the node-local disk and rundir is only the copy-back destination
+    if dft_settings.get("scratch_dir") is not None:
+        destination = os.path.abspath(rundir)
+        rundir = scratch.worker_rundir(dft_settings["scratch_dir"], "dft")
+    else:
+        destination = None
     
     if not os.path.exists(rundir):
         os.makedirs(rundir)
     else:
         if len(os.listdir(rundir))>0:
-            os.system("rm %s/*"%(rundir)) #removes all files in rundir
+            scratch.clear_rundir(rundir) #removes all files in rundir
 
-    startdir = os.getcwd() #stores current directory
-    os.chdir(rundir) #goes to the rundir
-    
-    print("Starting to prepare input")
-    PrepTMInputNormal(".", coords, elements)
+    # no chdir: the working directory is shared by all threads of the process, every path below includes rundir
+    logger.debug("Starting to prepare input")
+    PrepTMInputNormal(rundir, coords, elements)
+    metrics.add_phase("setup", time.time() - setup_start)
     
     #if unp_el != None and unp_el != 0:
     # run calculation
-    print("Starting to run TM calculation")
-    RunTMCalculation(".", dft_settings, charge, uhf = unp_el, disp = dispersion, pop = partial_chrg, water = h20)
+    logger.debug("Starting to run TM calculation")
+    aborted = None
+    try:
+        finished = RunTMCalculation(rundir, dft_settings, charge, uhf = unp_el, disp = dispersion, pop = partial_chrg, water = h20, elements = elements, coords = coords)
+    except engine.CalculationAborted as error:
+        finished, aborted = False, error.reason
+        metrics.note(abort_reason=aborted)
     #else:
     #    RunTMCalculation(".", dft_settings, disp = dispersion, pop = partial_chrg)
+
+    if not finished:
+        logger.warning("TM calculation did not finish in %s%s", rundir, "" if aborted is None else " (%s)" % (aborted))
+        with metrics.phase("finish"):
+            # a cancelled calculation is a speculative copy of a job whose other copy finished first and is kept
+            finish_rundir(rundir, destination, dft_settings, discard=(aborted == "cancelled"))
+        results = {"energy": None, "coords": coords, "elements": elements, "gradient": None, "hessian": None, "vibspectrum": None, "reduced_masses": None, 'partial_charges': None}
+        if aborted is not None:
+            results["aborted"] = aborted
+        return results
     
     # read out results  
-    print("TM calculation converged, reading out the results")  
+    parse_start = time.time()
+    logger.debug("TM calculation converged, reading out the results")  
     if opt:
-        os.system("t2x coord > opt.xyz")
-        coords_new, elements_new = xtb.readXYZ("opt.xyz")
+        engine.run(["t2x", "coord"], rundir, stdout="opt.xyz")
+        coords_new, elements_new = xyz.readXYZ(os.path.join(rundir, "opt.xyz"))
     else:
         coords_new, elements_new = coords, elements
 
     if grad:
-        grad = read_dft_grad()
+        grad = read_dft_grad(rundir)
     else:
         grad = None
 
     if hess:
-        hess, vibspectrum, reduced_masses = read_dft_hess()
+        hess, vibspectrum, reduced_masses = read_dft_hess(rundir)
     else:
         hess, vibspectrum, reduced_masses = None, None, None
 
-    e = getTMEnergies(".")[2]
+    # eiger is optional, without it the energy comes from the energy file (converted with HToeV, not eiger's factor)
+    if os.path.exists(os.path.join(rundir, "eiger.out")):
+        e = getTMEnergies(rundir)[2]
+    else:
+        e = qm_parsers.read_tm_energy(rundir)
+        if e is not None:
+            e *= HToeV
+    if e is None:
+        logger.warning("TM calculation in %s finished without an energy", rundir)
+        metrics.add_phase("parse", time.time() - parse_start)
+        with metrics.phase("finish"):
+            finish_rundir(rundir, destination, dft_settings)
+        return {"energy": None, "coords": coords, "elements": elements, "gradient": None, "hessian": None, "vibspectrum": None, "reduced_masses": None, 'partial_charges': None}
 
     if partial_chrg:
-        partialcharges = getMullikans(outfilename = 'TM.out', noOfAtoms=len(coords))
+        partialcharges = getMullikans(outfilename = os.path.join(rundir, 'TM.out'), noOfAtoms=len(coords))
     else:
         partialcharges = None
     # read mull
-    
-    os.chdir(startdir)
-
-    path_to_control = os.path.join(rundir, "control")
-    misc.check_basis_and_func(path_to_control=path_to_control, basis_todo=dft_settings["turbomole_basis"],
-                         func_todo=dft_settings["turbomole_functional"])
+    # basis and functional were checked on the control file before the SCF (see PrepTMControl)
+    metrics.add_phase("parse", time.time() - parse_start)
 
     #os.system("rm -r %s"%(rundir))
 
-    if dft_settings["delete_calculation_dirs"]:
-        os.system("rm -r %s" % (rundir))
+    with metrics.phase("finish"):
+        finish_rundir(rundir, destination, dft_settings)
 
     results = {"energy": e, "coords": coords_new, "elements": elements_new, "gradient": grad, "hessian": hess, "vibspectrum": vibspectrum, "reduced_masses": reduced_masses, 'partial_charges': partialcharges}
-    print("dft_calc results are: ", results)
+    if result_cache_dir is not None:
+        result_cache.store(result_cache_dir, cache_key, results)
+    logger.debug("dft_calc results are: %s", results)
 
     return(results)
 
 
-def RunTMCalculation(moldir, dft_settings, charge, uhf = None, disp=False, pop = False, water = False):
-    startdir = os.getcwd()
-    os.chdir(moldir)
-    
-    #create define string
-    if uhf == None or uhf == 1:
-        instring = prep_define_file_uhf_1(dft_settings, charge)
-        
-    if uhf == 3:
-        instring = prep_define_file_uhf_3(dft_settings, charge)
-    
-    print("Starting to execute define string")
-    ExecuteDefineString(instring)
-    
-    # add functional to control file
-    func = dft_settings['turbomole_functional']
-    add_functional_to_control('control', func)
-    
-    # add other options to control file like dispersion, solution in water
-    if disp:
-        AddStatementToControl("control", "$disp3")
-    if water:
-        AddStatementToControl('control', '$cosmo')
-        AddStatementToControl('control', '   epsilon=78.3')  ## adapt?
-    if pop:
-        AddStatementToControl('control', '$pop')
+def finish_rundir(rundir, destination, dft_settings, discard=False):
+    # destination is None unless the calculation ran on the scratch disk, discard deletes the files in any case
+    keep_files = dft_settings.get("keep_files")
+    archive_path = dft_settings.get("archive_path")
+    name = dft_settings.get("calculation_name", os.path.basename(destination if destination is not None else rundir))
+    if dft_settings["delete_calculation_dirs"] or discard:
+        if destination is None:
+            shutil.rmtree(rundir)
+        else:
+            scratch.clear_rundir(rundir)
+    elif destination is not None:
+        scratch.copy_back(rundir, destination, keep_files, archive_path=archive_path, name=name)
+    elif archive_path is not None:
+        calc_archive.archive_calculation(archive_path, name, rundir, keep_files)
+        shutil.rmtree(rundir)
+    elif keep_files is not None:
+        for filename in os.listdir(rundir):
+            if filename not in keep_files:
+                os.remove(os.path.join(rundir, filename))
+
+
+def RunTMCalculation(moldir, dft_settings, charge, uhf = None, disp=False, pop = False, water = False, elements = None, coords = None):
+    # with a define cache, define runs once per flavour and element composition, later molecules only bring their coord file
+    define_start = time.time()
+    cache_dir = dft_settings.get("define_cache_dir")
+    if cache_dir is not None and elements is not None:
+        key = define_cache.template_key(dft_settings, charge, uhf, disp, pop, water, elements)
+        if define_cache.is_unsupported(cache_dir, key):
+            logger.warning("skipping unsupported combination of basis %s and functional %s", dft_settings["turbomole_basis"], dft_settings["turbomole_functional"])
+            return(False)
+        if not define_cache.copy_template(cache_dir, key, moldir):
+            valid = PrepTMControl(moldir, dft_settings, charge, uhf = uhf, disp = disp, pop = pop, water = water)
+            define_cache.store_template(cache_dir, key, moldir, valid)
+            if not valid:
+                return(False)
+    else:
+        valid = PrepTMControl(moldir, dft_settings, charge, uhf = uhf, disp = disp, pop = pop, water = water)
+        if not valid:
+            return(False)
+    metrics.add_phase("define", time.time() - define_start)
+
+    # with a warm start, the converged orbitals of a cheaper flavour of the same geometry and basis are the SCF guess
+    warm_start_dir = dft_settings.get("warm_start_dir")
+    if warm_start_dir is not None and coords is not None:
+        orbitals_key = warm_start.warm_start_key(coords, elements, dft_settings, charge, uhf)
+        seeded = warm_start.seed_orbitals(warm_start_dir, orbitals_key, moldir)
+        metrics.note(warm_start=seeded)
+        if seeded:
+            logger.debug("   ---   Seeded the SCF with converged orbitals of an earlier flavour")
     
     if dft_settings["copy_mos"]:
         if os.path.exists("%s/pre_optimization/mos"%(dft_settings["main_directory"])):
-            print("   ---   Copy the old mos file from precalculation")
-            os.system("cp %s/pre_optimization/mos ."%(dft_settings["main_directory"]))
+            logger.debug("   ---   Copy the old mos file from precalculation")
+            shutil.copy("%s/pre_optimization/mos"%(dft_settings["main_directory"]), moldir)
         else:
-            print("WARNING: Did not find old mos file in %s/pre_optimization"%(dft_settings["main_directory"]))
+            logger.warning("Did not find old mos file in %s/pre_optimization", dft_settings["main_directory"])
     
     # do calculation  
-    print("Got to the terminal interaction part of TM!")   
+    logger.debug("Got to the terminal interaction part of TM!")   
+    # with an SCF monitor, calculations that diverge, stall or oscillate are killed instead of using all their iterations
+    if dft_settings.get("scf_monitor") is not None:
+        monitor = scf_monitor.ScfMonitor(os.path.join(moldir, "TM.out"), dft_settings["scf_monitor"])
+    else:
+        monitor = None
     if dft_settings["turbomole_method"]=="ridft":
-        os.system("ridft > TM.out")
+        engine.run(["ridft"], moldir, stdout="TM.out", phase="scf", monitor=monitor)
         #os.system("rdgrad > rdgrad.out")    ###removed grad
     elif dft_settings["turbomole_method"]=="dscf":
-        os.system("dscf > TM.out")
+        engine.run(["dscf"], moldir, stdout="TM.out", phase="scf", monitor=monitor)
         #os.system("rdgrad > rdgrad.out")
     else:
-        exit("ERROR in turbomole_method: %s"%(dft_settings["turbomole_method"]))
-
-    finished=False   
-    number_of_iterations=None
-    for line in open("TM.out","r"):
-        if "convergence criteria satisfied after" in line:
-            number_of_iterations=int(line.split()[4])
-        if "all done" in line:
-            finished=True
-            break
+        raise ValueError("ERROR in turbomole_method: %s"%(dft_settings["turbomole_method"]))
+
+    output = qm_parsers.read_tm_output(os.path.join(moldir, "TM.out"))
+    finished = output["finished"]
+    number_of_iterations = output["scf_iterations"]
+    metrics.note(scf_iterations=number_of_iterations)
     if number_of_iterations!=None:
-        print("   ---   converged after %i iterations" %(number_of_iterations))
+        logger.debug("   ---   converged after %i iterations", number_of_iterations)
     else:
         pass
 
+    if finished and dft_settings.get("run_eiger", True):
+        engine.run(["eiger"], moldir, stdout="eiger.out", phase="eiger")
     if finished:
-        os.system("eiger > eiger.out")
+        if warm_start_dir is not None and coords is not None:
+            warm_start.keep_orbitals(warm_start_dir, orbitals_key, moldir)
 
-    os.chdir(startdir)
     return(finished)
 
 #------------------------------------------------------------------preparation functions
@@ -172,6 +257,40 @@ def PrepTMInputNormal(moldir, coords, elements):
     coordfile.close()
     return ()
 
+def PrepTMControl(moldir, dft_settings, charge, uhf = None, disp=False, pop = False, water = False):
+    # runs define, completes its control file in memory and writes it once
+    # returns whether define ran and applied the requested basis and functional
+    #create define string
+    if uhf == None or uhf == 1:
+        instring = prep_define_file_uhf_1(dft_settings, charge)
+        
+    if uhf == 3:
+        instring = prep_define_file_uhf_3(dft_settings, charge)
+    
+    logger.debug("Starting to execute define string")
+    if not ExecuteDefineString(instring, moldir):
+        return(False)
+    
+    # add functional to control file
+    func = dft_settings['turbomole_functional']
+    path_to_control = os.path.join(moldir, 'control')
+    control = control_file.ControlFile.read(path_to_control)
+    control.set_functional(func)
+    
+    # add other options to control file like dispersion, solution in water
+    if disp:
+        control.add("$disp3")
+    if water:
+        control.add('$cosmo')
+        control.add('   epsilon=78.3')  ## adapt?
+    if pop:
+        control.add('$pop')
+    control.write(path_to_control)
+
+    return control_file.check_basis_and_func(control, basis_todo=dft_settings["turbomole_basis"], func_todo=func,
+                                             name=path_to_control)
+
+
 # define file preperation
 def prep_define_file_uhf_1(dft_settings, charge):
 
@@ -210,7 +329,7 @@ def prep_define_file_uhf_1(dft_settings, charge):
     returnstring = outfile.getvalue()
     outfile.close()
 
-    print("Define file is: ", returnstring)
+    logger.debug("Define file is: %s", returnstring)
     return returnstring
 
 def prep_define_file_uhf_3(dft_settings, charge):
@@ -250,196 +369,73 @@ def prep_define_file_uhf_3(dft_settings, charge):
 
 def add_functional_to_control(file_path, func):
     try:
-        with open(file_path, 'r') as file:
-            lines = file.readlines()
-
-        with open(file_path, 'w') as file:
-            for line in lines:
-                if 'functional' in line and 'b-p' in line:
-                    # Replace 'b-p' with the value of 'func'
-                    line = line.replace('b-p', func)
-                file.write(line)
-
-        #print(f"Text 'b-p' replaced with '{func}' in '{file_path}'")
-
+        control = control_file.ControlFile.read(file_path)
     except FileNotFoundError:
-        print(f"File '{file_path}' not found.")
-    except Exception as e:
-        print(f"An error occurred: {e}")
+        logger.error("File '%s' not found.", file_path)
+        return
+    control.set_functional(func)
+    control.write(file_path)
 
 def AddStatementToControl(controlfilename, statement):
-    inf = open(controlfilename, 'r')
-    lines = inf.readlines()
-    inf.close()
-    already_in=False
-    outf = open(controlfilename, 'w')
-    for line in lines:
-        if statement.split()[0] in line:
-            already_in=True
-        if len(line.split()) > 0:
-            if line.split()[0] == "$end" and not already_in:
-                outf.write("%s\n" % (statement))
-        outf.write(line)
-    outf.close()
+    control = control_file.ControlFile.read(controlfilename)
+    control.add(statement)
+    control.write(controlfilename)
 
 def RemoveStatementFromControl(controlfilename, statement):
-    inf = open(controlfilename, 'r')
-    lines = inf.readlines()
-    inf.close()
-    outf = open(controlfilename, 'w')
-    writeOutput = True
-    for line in lines:
-        if len(line.split()) > 0:
-            if line.split()[0] == statement.split()[0]:
-                writeOutput = False
-            else:
-                writeOutput = True
-        if writeOutput:
-            outf.write(line)
-    outf.close()
-
-def ExecuteDefineString(instring):
+    control = control_file.ControlFile.read(controlfilename)
+    control.remove(statement)
+    control.write(controlfilename)
+
+def ExecuteDefineString(instring, moldir="."):
     instring = instring + "\n\n\n\n"
     out = ""
     err = ""
 
-    process = subprocess.Popen(["define"], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE, preexec_fn=setulimit, encoding='utf8')
-    out, err = process.communicate(input = instring)
+    # define reads its answers from a file, the engine gives it the large stack it needs
+    with open(os.path.join(moldir, "define.input"), 'w') as defineinput:
+        defineinput.write(instring)
+    engine.run(["define"], moldir, stdin="define.input", stdout="define.out", stderr="define.err")
+    with open(os.path.join(moldir, "define.out"), 'r') as fp:
+        out = fp.read()
+    with open(os.path.join(moldir, "define.err"), 'r') as fp:
+        err = fp.read()
 
     if "normally" in err.split():
-        return
-    if "normally" not in err.split():
-        print("ERROR in define")
-        print("STDOUT was: %s"%(out))
-        print("STDERR was: %s"%(err))
-        print("Now printing define input:")
-        print("--------------------------")
-        print(instring)
-        print("--------------------------")
-        with open("define.input",'w') as defineinput:
-            defineinput.write(instring)
-        exit()
-
-def setulimit():
-    resource.setrlimit(resource.RLIMIT_STACK,(-1,resource.RLIM_INFINITY))
+        return(True)
+    # no exit() here: in a pool worker SystemExit would leave the result of the job pending forever
+    logger.error("ERROR in define\nSTDOUT was: %s\nSTDERR was: %s\nDefine input was:\n"
+                 "--------------------------\n%s\n--------------------------", out, err, instring)
+    return(False)
 
 #----------------------------------------------------read out calculation results
     
 def getTMEnergies(moldir):
+    logger.debug("moldir is defined as: %s", moldir)
+    return(qm_parsers.read_eiger_energies(moldir))
 
-    print("current directory at the start of getTMEnergies function is ", os.getcwd())
-    print("moldir is defined as: ", moldir)
-    try:
-        eigerfile=open("%s/eiger.out"%(moldir),"r")
-    except FileNotFoundError as err:
-        raise FileNotFoundError("the eiger.out file is not found, was searching in directory", moldir)
-
-    eigerlines=eigerfile.readlines()
-    eigerfile.close()
-    total_energy=0.0
-    energy_homo=0.0
-    energy_lumo=0.0
-    for eigerline in eigerlines:
-        if len(eigerline.split())!=0:
-            if eigerline.split()[0]=="Total":
-                total_energy=eigerline.split()[6]
-            elif eigerline.split()[0]=="HOMO:":
-                energy_homo=eigerline.split()[8]
-            elif eigerline.split()[0]=="LUMO:":
-                energy_lumo=eigerline.split()[8]
-                break
-    return([float(energy_homo),float(energy_lumo),float(total_energy)])
-
-def read_dft_grad():
-    if not os.path.exists("gradient"):
-        return(None)
-    grad = []
-    for line in open("gradient","r"):
-        if len(line.split())==3 and "grad" not in line:
-            line = line.replace("D","E")
-            grad.append([float(line.split()[0]), float(line.split()[1]), float(line.split()[2])])
-    if len(grad)==0:
-        grad=None
-    else:
-        grad = np.array(grad)*HToeV*AToBohr
+def read_dft_grad(moldir="."):
+    grad = qm_parsers.read_gradient(moldir)
+    if grad is not None:
+        grad = grad*HToeV*AToBohr
     return(grad)
 
-def read_dft_hess():
-    hess = None
-    if not os.path.exists("hessian"):
+def read_dft_hess(moldir="."):
+    if not os.path.exists(os.path.join(moldir, "hessian")):
         return(None, None, None)
-    hess = []
-    for line in open("hessian","r"):
-        if "hess" not in line:
-            for x in line.split():
-                hess.append(float(x))
-    if len(hess)==0:
-        hess=None
-    else:
-        hess = np.array(hess)
-
-    vibspectrum = None
-    if not os.path.exists("vibspectrum"):
+    hess = qm_parsers.read_hessian(moldir)
+    if not os.path.exists(os.path.join(moldir, "vibspectrum")):
         return(None, None, None)
-    vibspectrum = []
-    read=False
-    for line in open("vibspectrum","r"):
-        if "end" in line:
-            read=False
-
-        if read:
-            if len(line.split())==5:
-                vibspectrum.append(float(line.split()[1]))
-            elif len(line.split())==6:
-                vibspectrum.append(float(line.split()[2]))
-            else:
-                print("WARNING: weird line length: %s"%(line))
-        if "RAMAN" in line:
-            read=True
-    
-    reduced_masses = None
-    if not os.path.exists("g98.out"):
-        print("g98.out not found")
+    if not os.path.exists(os.path.join(moldir, "g98.out")):
+        logger.warning("g98.out not found")
         return(None, None, None)
-    reduced_masses = []
-    read=False
-    for line in open("g98.out","r"):
-        if "Red. masses" in line:
-            for x in line.split()[3:]:
-                try:
-                    reduced_masses.append(float(x))
-                except:
-                    pass
-
-    if len(vibspectrum)==0:
-        vibspectrum=None
-        print("no vibspectrum found")
-    else:
-        vibspectrum = np.array(vibspectrum)
-
-    if len(reduced_masses)==0:
-        reduced_masses = None
-        print("no reduced masses found")
-    else:
-        reduced_masses = np.array(reduced_masses)
-
+    vibspectrum = qm_parsers.read_vibspectrum(moldir)
+    if vibspectrum is None:
+        logger.warning("no vibspectrum found")
+    reduced_masses = qm_parsers.read_reduced_masses(moldir)
+    if reduced_masses is None:
+        logger.warning("no reduced masses found")
     return(hess, vibspectrum, reduced_masses)
 
 
 def getMullikans(outfilename="ridft.log", noOfAtoms=0):
-    TMfile=open(outfilename,"r")
-    lines=TMfile.readlines()
-    TMfile.close()
-    # finding position of mullikan partial charges in file
-    idx=0
-    for line in lines:
-        spl=line.split()
-        if len(spl)!=0 and len(spl)!=1:
-            if spl[0]=="atom" and spl[1]=="charge":
-                index=idx+1
-                break
-        idx+=1
-    partialCharges=[]
-    for i in range(noOfAtoms):
-        partialCharges.append( float(lines[idx+1+i][10:18]) )
-    return(partialCharges)
\ No newline at end of file
+    return(qm_parsers.read_tm_output(outfilename, natoms=noOfAtoms)["partial_charges"])
\ No newline at end of file
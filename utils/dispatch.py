@@ -0,0 +1,114 @@
+import heapq
+import logging
+import os
+import queue
+import shutil
+import tempfile
+import time
+
+import utils.engine as engine
+
+logger = logging.getLogger(__name__)
+
+# Hands the jobs to the pool one per idle worker, so that the start time of every running job is known.
+# With speculative execution, workers that go idle once all jobs have been handed out start a second copy
+# of the longest running job (a straggler, e.g. on a slow node or stuck in a slow SCF) and whichever copy
+# finishes first is kept. The programs of the other copy are killed through its cancel file (see engine.run).
+# A job may wait for another one (after), e.g. for the orbitals of the cheaper flavour of the same geometry,
+# and is handed out once that job has finished.
+
+
+def run_cancellable(function, job, cancel_file):
+    """
+    Runs function(job) in a pool worker, the programs it starts are killed once cancel_file exists
+    """
+    engine.set_cancel_file(cancel_file)
+    try:
+        return function(job)
+    finally:
+        engine.set_cancel_file(None)
+
+
+def imap_unordered(pool, num_workers, function, jobs, speculative=False, stop=None, after=None):
+    """
+    Like pool.imap_unordered(function, jobs), yields the results in the order they complete
+    :param pool: pool made by cores.make_pool
+    :param num_workers: number of workers of the pool, as returned by cores.make_pool
+    :param function: module level function, called once per job (twice for a job run speculatively)
+    :param jobs: list of jobs, in the order they are handed out
+    :param speculative: If True, idle workers start a second copy of the longest running job once all jobs
+                        have been handed out, and the result of the copy that finishes first is yielded
+    :param stop: threading.Event, once it is set the running jobs are cancelled and no further results are yielded
+    :param after: list with the index of the job that every job waits for, None for jobs that wait for nothing
+    """
+    cancel_dir = tempfile.mkdtemp(prefix="cancel_")
+    done = queue.Queue()
+    # job index -> [start time, copies in flight]
+    running = {}
+    finished = set()
+    # jobs that may be handed out, by their position in jobs, and the jobs waiting for each job
+    ready = []
+    waiting = {}
+    for index in range(len(jobs)):
+        if after is None or after[index] is None:
+            ready.append(index)
+        else:
+            waiting.setdefault(after[index], []).append(index)
+    heapq.heapify(ready)
+    in_flight = 0
+
+    def submit(index):
+        pool.apply_async(run_cancellable, (function, jobs[index], os.path.join(cancel_dir, "job_%i" % (index))),
+                         callback=lambda result: done.put((index, result, None)),
+                         error_callback=lambda error: done.put((index, None, error)))
+
+    try:
+        while len(finished) < len(jobs):
+            if stop is not None and stop.is_set():
+                logger.warning("Stopping, cancelling %i running jobs", len(running))
+                for index in running:
+                    open(os.path.join(cancel_dir, "job_%i" % (index)), "w").close()
+                break
+            while len(ready) > 0 and in_flight < num_workers:
+                index = heapq.heappop(ready)
+                submit(index)
+                running[index] = [time.time(), 1]
+                in_flight += 1
+            if speculative and len(ready) == 0:
+                while in_flight < num_workers:
+                    single = [index for index, (start, copies) in running.items() if copies == 1]
+                    if len(single) == 0:
+                        break
+                    index = min(single, key=lambda i: running[i][0])
+                    logger.info("Starting a speculative copy of job %i, running for %.0f s", index, time.time() - running[index][0])
+                    submit(index)
+                    running[index][1] += 1
+                    in_flight += 1
+
+            try:
+                index, result, error = done.get(timeout=None if stop is None else engine.poll_interval)
+            except queue.Empty:
+                continue
+            in_flight -= 1
+            if index in finished:
+                # the slower copy of a job run speculatively
+                continue
+            running[index][1] -= 1
+            if error is not None:
+                if running[index][1] > 0:
+                    logger.warning("One copy of job %i failed, waiting for the other one: %s", index, error)
+                    continue
+                raise error
+            finished.add(index)
+            for waiting_index in waiting.pop(index, []):
+                heapq.heappush(ready, waiting_index)
+            if running.pop(index)[1] > 0:
+                open(os.path.join(cancel_dir, "job_%i" % (index)), "w").close()
+            yield result
+
+        # the cancelled jobs return within a few seconds, the cancel files have to stay until then
+        while in_flight > 0:
+            done.get()
+            in_flight -= 1
+    finally:
+        shutil.rmtree(cancel_dir, ignore_errors=True)
@@ -0,0 +1,200 @@
+import logging
+import numpy as np
+
+import utils.xyz_index as xyz_index
+import utils.xyz_utils as xyz
+
+logger = logging.getLogger(__name__)
+
+# Diversity-aware sampling for pools of conformers of one molecule (e.g. MD trajectories), where uniform
+# sampling pays again and again for nearly identical geometries.
+# Every frame is centred and rotated onto a reference frame (the first one) with a batched Kabsch alignment.
+# The distance of two aligned frames divided by sqrt(num_atoms) is their RMSD after alignment to the common
+# reference, an upper bound of their RMSD after optimal superposition onto each other.
+# A frame closer than dedup_rmsd to one of the last frames kept before it is dropped, on the full aligned
+# coordinates. The kept frames are then picked by farthest-point sampling on descriptors: the aligned coordinates,
+# for large molecules projected to at most max_dims dimensions and rescaled to keep distances in the same units.
+# The pool is streamed in chunks and every step works on chunks, so memory stays at the descriptors
+# (num_frames x dims float32) plus one chunk.
+
+
+def kabsch_rotations(reference, frames):
+    """
+    Rotations that best superimpose centred frames onto a centred reference (Kabsch), for all frames at once
+    :param reference: (num_atoms, 3)
+    :param frames: (num_frames, num_atoms, 3)
+    :return: (num_frames, 3, 3), frame @ rotation is aligned to the reference
+    """
+    covariance = np.einsum("fai,aj->fij", frames, reference)
+    u, _, vt = np.linalg.svd(covariance)
+    # no reflections
+    sign = np.sign(np.linalg.det(u @ vt))
+    u[:, :, 2] *= sign[:, None]
+    return u @ vt
+
+
+def iter_pool_chunks(filename, chunk_size=10000):
+    """
+    Yields the frames of a pool of one molecule as (start, coords) with coords of shape (chunk, num_atoms, 3).
+    Uncompressed pools are read chunk by chunk through their index, compressed ones are read as a whole.
+    """
+    compressed = filename.endswith((".gz", ".xz"))
+    if compressed:
+        coords_all, numbers_all, offsets = xyz.read_xyz_packed(filename)
+        natoms = np.diff(offsets)
+    else:
+        index = xyz_index.load_index(filename)
+        natoms = index["natoms"]
+    if len(natoms) == 0:
+        return
+    if np.any(natoms != natoms[0]):
+        raise ValueError("diversity sampling needs a pool of one molecule, %s has frames of %s atoms"
+                         % (filename, sorted(set(natoms.tolist()))))
+    num_atoms = int(natoms[0])
+    reference_numbers = None
+    for start in range(0, len(natoms), chunk_size):
+        stop = min(start + chunk_size, len(natoms))
+        if compressed:
+            coords = coords_all[start * num_atoms:stop * num_atoms]
+            numbers = numbers_all[start * num_atoms:stop * num_atoms]
+        else:
+            coords, numbers, _ = xyz_index.read_frames(filename, range(start, stop), index)
+        numbers = numbers.reshape(stop - start, num_atoms)
+        if reference_numbers is None:
+            reference_numbers = numbers[0]
+        # the alignment pairs atoms by their position in the frame
+        if np.any(numbers != reference_numbers):
+            raise ValueError("diversity sampling needs the atoms of all frames in the same order, frame %i of %s differs"
+                             % (start + int(np.argmax(np.any(numbers != reference_numbers, axis=1))), filename))
+        yield start, np.asarray(coords, dtype=np.float64).reshape(stop - start, num_atoms, 3)
+
+
+def deduplicate_chunk(aligned, squared_threshold, ring, num_kept):
+    """
+    Marks the frames of a chunk that are not closer than the threshold to one of the last frames kept before
+    them, in the order of the pool (a dropped frame is no reference for the next ones, so slowly drifting
+    frames are kept about every threshold of drift)
+    :param aligned: flattened aligned coordinates of the chunk (chunk, 3 * num_atoms)
+    :param squared_threshold: squared distance of the flattened coordinates, rmsd ** 2 * num_atoms
+    :param ring: (window, 3 * num_atoms) coordinates of the last kept frames, inf where there are none yet,
+                 carried over from chunk to chunk and updated in place
+    :param num_kept: number of frames kept before the chunk
+    :return: boolean mask of the frames to keep and the number of frames kept up to the end of the chunk
+    """
+    keep = np.zeros(len(aligned), dtype=bool)
+    for i, frame in enumerate(aligned):
+        difference = ring - frame
+        if np.min(np.einsum("fd,fd->f", difference, difference)) < squared_threshold:
+            continue
+        keep[i] = True
+        ring[num_kept % len(ring)] = frame
+        num_kept += 1
+    return keep, num_kept
+
+
+def deduplicate(frames, rmsd, window=64):
+    """
+    Marks near-duplicate frames of an array of frames, see deduplicate_chunk
+    :param frames: (num_frames, num_atoms, 3), aligned to a common reference
+    :param rmsd: Angstrom
+    :return: boolean mask of the frames to keep
+    """
+    frames = np.asarray(frames, dtype=np.float64).reshape(len(frames), -1)
+    ring = np.full((window, frames.shape[1]), np.inf)
+    return deduplicate_chunk(frames, rmsd ** 2 * frames.shape[1] / 3, ring, 0)[0]
+
+
+def pool_descriptors(filename, max_dims=96, chunk_size=10000, seed=0, dedup_rmsd=0.0, window=64):
+    """
+    Descriptors of all frames of a pool: coordinates after Kabsch alignment to the first frame
+    :param max_dims: larger descriptors are projected onto this many dimensions with a random orthonormal projection
+    :param dedup_rmsd: frames closer than this RMSD (Angstrom) to one of the last window frames kept are dropped
+    :return: float32 descriptors (num_frames, dims), the number of atoms and the boolean mask of the frames kept
+    """
+    descriptors = []
+    keep = []
+    ring, num_kept = None, 0
+    reference = None
+    projection = None
+    for start, frames in iter_pool_chunks(filename, chunk_size):
+        frames = frames - frames.mean(axis=1, keepdims=True)
+        if reference is None:
+            reference = frames[0]
+            num_dims = 3 * len(reference)
+            if num_dims > max_dims:
+                # an orthonormal projection to max_dims of num_dims dimensions shrinks distances by about
+                # sqrt(max_dims / num_dims) on average, scaled back so that distances stay RMSDs times sqrt(num_atoms)
+                projection, _ = np.linalg.qr(np.random.default_rng(seed).normal(size=(num_dims, max_dims)))
+                projection *= np.sqrt(num_dims / max_dims)
+            ring = np.full((window, num_dims), np.inf)
+        aligned = (frames @ kabsch_rotations(reference, frames)).reshape(len(frames), -1)
+        if dedup_rmsd > 0.0:
+            keep_chunk, num_kept = deduplicate_chunk(aligned, dedup_rmsd ** 2 * len(reference), ring, num_kept)
+            keep.append(keep_chunk)
+        else:
+            keep.append(np.ones(len(frames), dtype=bool))
+        if projection is not None:
+            aligned = aligned @ projection
+        descriptors.append(aligned.astype(np.float32))
+    if reference is None:
+        return np.zeros((0, 0), dtype=np.float32), 0, np.zeros(0, dtype=bool)
+    return np.concatenate(descriptors), len(reference), np.concatenate(keep)
+
+
+def farthest_point_sampling(descriptors, num_samples, candidates=None, first=0, chunk_size=8192):
+    """
+    Picks frames one at a time, each one the candidate farthest from all frames picked before it
+    :param candidates: boolean mask of the frames that may be picked, None for all
+    :param first: index of the first frame, must be a candidate
+    :return: indices of the picked frames in the order they were picked
+    """
+    num_frames = len(descriptors)
+    min_distances = np.full(num_frames, np.inf, dtype=np.float32)
+    if candidates is not None:
+        min_distances[~candidates] = -np.inf
+    picked = [int(first)]
+    for _ in range(num_samples - 1):
+        latest = descriptors[picked[-1]]
+        for start in range(0, num_frames, chunk_size):
+            stop = min(start + chunk_size, num_frames)
+            difference = descriptors[start:stop] - latest
+            np.minimum(min_distances[start:stop], np.einsum("fd,fd->f", difference, difference),
+                       out=min_distances[start:stop])
+        picked.append(int(np.argmax(min_distances)))
+    return np.array(picked, dtype=np.int64)
+
+
+def plan_diverse_samples(filename, num_flavours, num_molecules, overlap=0.0, seed=None, dedup_rmsd=0.05,
+                         max_dims=96, chunk_size=10000):
+    """
+    Builds the molecule x flavour assignment like sampling.plan_samples, but from a deduplicated pool by
+    farthest-point sampling: the shared molecules are the first picks, the remaining picks are dealt out
+    to the flavours in turn, so that every flavour covers the whole pool
+    :param dedup_rmsd: frames closer than this RMSD (Angstrom, after alignment) to a frame kept shortly before them are dropped
+    """
+    if not 0.0 <= overlap <= 1.0:
+        raise ValueError("overlap has to be between 0 and 1, got %s" % (overlap))
+    if seed is None:
+        seed = int(np.random.SeedSequence().generate_state(1)[0])
+    descriptors, _, keep = pool_descriptors(filename, max_dims=max_dims, chunk_size=chunk_size, seed=seed,
+                                            dedup_rmsd=dedup_rmsd)
+    num_unique = int(np.sum(keep))
+    logger.info("%i of the %i frames of the pool remain after deduplication", num_unique, len(descriptors))
+
+    num_shared = int(round(overlap * num_molecules))
+    num_samples = num_shared + num_flavours * (num_molecules - num_shared)
+    if num_samples > num_unique:
+        raise ValueError("cannot sample %i molecules from a pool of %i distinct frames" % (num_samples, num_unique))
+    rng = np.random.default_rng(seed)
+    first = rng.choice(np.flatnonzero(keep))
+    picked = farthest_point_sampling(descriptors, num_samples, candidates=keep, first=first)
+
+    shared = picked[:num_shared]
+    flavour_indices = [np.concatenate([shared, picked[num_shared + flavour::num_flavours]]).astype(np.int64)
+                       for flavour in range(num_flavours)]
+    return {"seed": seed,
+            "overlap": overlap,
+            "num_pool": len(descriptors),
+            "num_unique": num_unique,
+            "shared_indices": shared.astype(np.int64),
+            "flavour_indices": flavour_indices}
@@ -0,0 +1,176 @@
+import os
+import resource
+import signal
+import subprocess
+import threading
+import time
+
+import utils.cores as cores
+import utils.metrics as metrics
+
+# Runs the external QM programs (define, ridft, dscf, eiger, xtb, ...) directly, without a shell in between
+# and without changing the working directory of the Python process: every program gets its argv, run directory
+# and environment explicitly, and its standard streams are files in the run directory. Nothing here is global
+# state, so any number of threads of one process can run calculations at the same time.
+# A program is killed together with the processes it started when the deadline of its calculation passes
+# or the cancel file of its calculation appears, or when its monitor (e.g. scf_monitor.ScfMonitor) says so,
+# and run raises CalculationAborted.
+
+_stack_limit_raised = False
+
+# limits of the calculation the current thread runs, see set_deadline and set_cancel_file
+_job = threading.local()
+
+# seconds between two checks of the limits of a running program, and between SIGTERM and SIGKILL
+poll_interval = 1.0
+kill_grace = 5.0
+
+
+class CalculationAborted(Exception):
+    """
+    Raised by run when a program was killed before it finished
+    :param reason: "timeout" if the deadline of the calculation passed, "cancelled" if its cancel file appeared,
+                   otherwise the reason returned by the monitor of the program
+    """
+
+    def __init__(self, reason, argv):
+        super().__init__("%s was killed: %s" % (argv[0], reason))
+        self.reason = reason
+
+
+def raise_stack_limit():
+    """
+    Raises the soft stack limit to the hard limit once per process, the programs inherit it (Turbomole
+    needs a large stack, define used to get it from a preexec_fn, which is not safe with threads)
+    """
+    global _stack_limit_raised
+    if _stack_limit_raised:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_STACK)
+    if soft != hard:
+        resource.setrlimit(resource.RLIMIT_STACK, (hard, hard))
+    _stack_limit_raised = True
+
+
+def program_env(threads=None):
+    """
+    Environment of an external program
+    :param threads: threads of the program, None for the thread count of this worker
+    """
+    env = dict(os.environ)
+    threads = threads or cores.threads_per_calc()
+    for variable in cores.thread_variables:
+        env[variable] = "%i" % (threads)
+    return env
+
+
+def set_deadline(deadline):
+    """
+    Wall-clock limit of the calculation the current thread runs: the programs it starts are killed at deadline
+    :param deadline: time.time() of the deadline, None for no limit
+    """
+    _job.deadline = deadline
+
+
+def set_cancel_file(cancel_file):
+    """
+    The programs the current thread starts are killed as soon as cancel_file exists, None to never cancel them
+    """
+    _job.cancel_file = cancel_file
+
+
+def abort_reason(deadline, cancel_file, monitor=None):
+    if deadline is not None and time.time() > deadline:
+        return "timeout"
+    if cancel_file is not None and os.path.exists(cancel_file):
+        return "cancelled"
+    if monitor is not None:
+        return monitor()
+    return None
+
+
+def kill_process_group(pgid, sig):
+    try:
+        os.killpg(pgid, sig)
+    except ProcessLookupError:
+        pass
+
+
+def watch(process, deadline, cancel_file, monitor, stopped, aborted):
+    """
+    Watcher thread of run: kills the process group of the program once a limit is hit,
+    with SIGTERM first and SIGKILL for whatever is left after kill_grace seconds
+    """
+    while not stopped.wait(poll_interval):
+        reason = abort_reason(deadline, cancel_file, monitor)
+        if reason is None:
+            continue
+        aborted.append(reason)
+        kill_process_group(process.pid, signal.SIGTERM)
+        stopped.wait(kill_grace)
+        kill_process_group(process.pid, signal.SIGKILL)
+        return
+
+
+def run(argv, cwd, stdin=None, stdout=None, stderr=None, env=None, phase=None, monitor=None):
+    """
+    Runs an external program and waits for it
+    :param argv: program and arguments, e.g. ["ridft"]
+    :param cwd: run directory
+    :param stdin: file in cwd to read standard input from, None for no input
+    :param stdout: file in cwd to write standard output to, None to discard it
+    :param stderr: file in cwd to write standard error to, None to discard it
+    :param env: environment, None for program_env()
+    :param phase: metrics phase the wall time of the program is added to
+    :param monitor: callable polled while the program runs, returns the reason to kill it or None
+    :return: exit code of the program
+    :raises CalculationAborted: if the deadline of the calculation passed, its cancel file appeared or the monitor
+                                returned a reason
+    """
+    deadline = getattr(_job, "deadline", None)
+    cancel_file = getattr(_job, "cancel_file", None)
+    reason = abort_reason(deadline, cancel_file)
+    if reason is not None:
+        raise CalculationAborted(reason, argv)
+    raise_stack_limit()
+    if env is None:
+        env = program_env()
+    files = []
+    try:
+        streams = []
+        for filename, mode in ((stdin, "rb"), (stdout, "wb"), (stderr, "wb")):
+            if filename is None:
+                streams.append(subprocess.DEVNULL)
+            else:
+                files.append(open(os.path.join(cwd, filename), mode))
+                streams.append(files[-1])
+        with metrics.phase(phase):
+            # a session of its own, so that killing its process group also kills the processes the program started
+            process = subprocess.Popen(argv, cwd=cwd, env=env, stdin=streams[0], stdout=streams[1], stderr=streams[2],
+                                       start_new_session=True)
+            stopped = threading.Event()
+            aborted = []
+            watcher = None
+            if deadline is not None or cancel_file is not None or monitor is not None:
+                watcher = threading.Thread(target=watch, args=(process, deadline, cancel_file, monitor, stopped, aborted),
+                                           daemon=True)
+                watcher.start()
+            try:
+                # wait4 instead of wait, to get the CPU time and peak RSS of exactly this program
+                _, status, rusage = os.wait4(process.pid, 0)
+            except BaseException:
+                # e.g. KeyboardInterrupt, the program is not in the foreground process group and would survive it
+                kill_process_group(process.pid, signal.SIGKILL)
+                raise
+            finally:
+                stopped.set()
+                if watcher is not None:
+                    watcher.join()
+            process.returncode = os.waitstatus_to_exitcode(status)
+    finally:
+        for fp in files:
+            fp.close()
+    metrics.add_child_usage(rusage.ru_utime + rusage.ru_stime, rusage.ru_maxrss)
+    if aborted:
+        raise CalculationAborted(aborted[0], argv)
+    return process.returncode
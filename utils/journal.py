@@ -0,0 +1,53 @@
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+journal_name = "journal.jsonl"
+
+
+def append_to_journal(path_to_task, molidx, energy):
+    """
+    Appends the result of one molecule to the checkpoint journal of a task.
+    The line is written with a single write on a file opened in append mode and synced to disk,
+    so a crash can at most leave a truncated last line, which read_journal ignores.
+    :param path_to_task: path to placeholder category
+    :param molidx: index of the molecule in the task's xyz file
+    :param energy: energy of the molecule, None if the calculation failed
+    """
+    line = json.dumps({"molidx": int(molidx), "energy": energy}) + "\n"
+    fd = os.open(os.path.join(path_to_task, journal_name), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, line.encode("utf8"))
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def read_journal(path_to_task):
+    """
+    Reads the checkpoint journal of a task. A truncated last line left by a crash is cut off,
+    so that the next append starts on a fresh line.
+    :param path_to_task: path to placeholder category
+    :return: dictionary from molecule index to the last journaled energy
+    """
+    energies = {}
+    path_to_journal = os.path.join(path_to_task, journal_name)
+    if not os.path.exists(path_to_journal):
+        return energies
+    with open(path_to_journal, "rb") as fp:
+        content = fp.read()
+    complete = content[:content.rfind(b"\n") + 1]
+    if len(complete) < len(content):
+        logger.warning("Cutting off a truncated line at the end of the journal %s", path_to_journal)
+        with open(path_to_journal, "r+b") as fp:
+            fp.truncate(len(complete))
+    for line in complete.decode("utf8").splitlines():
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            logger.warning("Skipping a damaged line in the journal %s", path_to_journal)
+            continue
+        energies[entry["molidx"]] = entry["energy"]
+    return energies
@@ -0,0 +1,100 @@
+import logging
+import logging.handlers
+import multiprocessing.util
+import os
+import socket
+import sys
+import threading
+import time
+
+# The main process logs to stdout. Pool workers log to their own file in the log directory through a buffer
+# that is written out when it is full, every flush_interval seconds and right away for warnings, so
+# thousands of jobs neither flood the SLURM output nor make every worker wait on the shared filesystem.
+# Warnings of the workers also go to stderr.
+
+log_format = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+# remembered by setup_logging and handed to the pool workers by cores.make_pool
+_config = {"level": "INFO", "log_dir": None}
+
+
+class BufferedFileHandler(logging.handlers.MemoryHandler):
+    """
+    Buffers records in memory and appends them to a file in batches. A background thread writes out the
+    buffer every flush_interval seconds, also while the worker logs nothing (e.g. during a long SCF).
+    """
+
+    def __init__(self, filename, capacity=1000, flush_interval=10.0):
+        super().__init__(capacity, flushLevel=logging.WARNING, target=logging.FileHandler(filename))
+        self.target.setFormatter(logging.Formatter(log_format))
+        self.flush_interval = flush_interval
+        self.last_flush = time.time()
+        self._closed = threading.Event()
+        self._timer = threading.Thread(target=self._flush_periodically, daemon=True)
+        self._timer.start()
+
+    def _flush_periodically(self):
+        while not self._closed.wait(self.flush_interval):
+            if time.time() - self.last_flush >= self.flush_interval:
+                self.flush()
+
+    def shouldFlush(self, record):
+        return super().shouldFlush(record) or time.time() - self.last_flush > self.flush_interval
+
+    def flush(self):
+        super().flush()
+        self.last_flush = time.time()
+
+    def close(self):
+        self._closed.set()
+        target = self.target
+        super().close()
+        if target is not None:
+            target.close()
+
+
+def setup_logging(level="INFO", log_dir=None):
+    """
+    Sets up logging of the main process
+    :param level: DEBUG to log the full payload of every job (coordinates, settings, results), INFO for one line per job
+    :param log_dir: directory of the log files of the pool workers, None to let them log to stdout as well
+    """
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(logging.Formatter(log_format))
+    root.addHandler(handler)
+    root.setLevel(level)
+    # warnings.warn, e.g. of control_file.check_basis_and_func, goes through logging as well
+    logging.captureWarnings(True)
+    if log_dir is not None and not os.path.exists(log_dir):
+        os.makedirs(log_dir)
+    _config.update(level=level, log_dir=log_dir)
+
+
+def worker_config():
+    return dict(_config)
+
+
+def setup_worker_logging(config):
+    """
+    Pool initializer part: sends the records of this worker to its buffered log file
+    :param config: configuration of the main process, from worker_config
+    """
+    root = logging.getLogger()
+    root.setLevel(config["level"])
+    logging.captureWarnings(True)
+    if config["log_dir"] is None:
+        return
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    filename = os.path.join(config["log_dir"], "worker_%s_%i.log" % (socket.gethostname(), os.getpid()))
+    buffered = BufferedFileHandler(filename)
+    root.addHandler(buffered)
+    warnings = logging.StreamHandler(sys.stderr)
+    warnings.setLevel(logging.WARNING)
+    warnings.setFormatter(logging.Formatter(log_format))
+    root.addHandler(warnings)
+    # pool workers do not run atexit handlers, but they do run multiprocessing finalizers
+    multiprocessing.util.Finalize(None, buffered.close, exitpriority=1)
@@ -0,0 +1,126 @@
+import contextlib
+import json
+import os
+import socket
+import threading
+import time
+
+# Every calculation emits one metrics record, a JSON line in the metrics file of the worker that ran it
+# (<metrics_dir>/metrics_<host>_<pid>.jsonl, so workers never share a file). A record holds the wall time
+# of each phase, the SCF iterations, the CPU time of all external programs (see engine.run), the peak RSS
+# of the largest one and the outcome.
+# The functions below fill the record of the calculation currently running in this thread and do
+# nothing while no record is open, so code paths outside of a pool job need no special casing.
+
+# the open record and the end of the last calculation, per thread so that thread pool workers keep apart
+_state = threading.local()
+
+
+def worker_id():
+    if threading.current_thread() is threading.main_thread():
+        return "%s:%i" % (socket.gethostname(), os.getpid())
+    return "%s:%i:%s" % (socket.gethostname(), os.getpid(), threading.current_thread().name)
+
+
+def metrics_file(metrics_dir):
+    return os.path.join(metrics_dir, "metrics_%s_%i.jsonl" % (socket.gethostname(), os.getpid()))
+
+
+def start_record(metrics_dir, **fields):
+    """
+    Opens the record of a calculation
+    :param metrics_dir: directory of the metrics files, None to record nothing
+    :param fields: fields of the record, e.g. task, molidx, functional, basis, natoms
+    """
+    if metrics_dir is None:
+        _state.record = None
+        return
+    now = time.time()
+    last_finish = getattr(_state, "last_finish", None)
+    record = dict(fields)
+    record.update({"metrics_dir": metrics_dir,
+                   "worker": worker_id(),
+                   "start": now,
+                   # time the worker spent outside of calculations before this one: pool overhead and idling
+                   "between_jobs": None if last_finish is None else now - last_finish,
+                   "phases": {},
+                   "child_cpu_seconds": 0.0,
+                   "child_max_rss_kb": None})
+    _state.record = record
+
+
+@contextlib.contextmanager
+def phase(name):
+    """
+    Adds the wall time of the enclosed block to a phase of the open record
+    """
+    start = time.time()
+    try:
+        yield
+    finally:
+        add_phase(name, time.time() - start)
+
+
+def add_phase(name, seconds):
+    """
+    Adds wall time to a phase of the open record
+    """
+    record = getattr(_state, "record", None)
+    if record is not None and name is not None:
+        record["phases"][name] = record["phases"].get(name, 0.0) + seconds
+
+
+def note(**fields):
+    """
+    Sets fields of the open record, e.g. scf_iterations
+    """
+    record = getattr(_state, "record", None)
+    if record is not None:
+        record.update(fields)
+
+
+def add_child_usage(cpu_seconds, max_rss_kb):
+    """
+    Adds the CPU time of an external program to the open record and keeps its peak RSS if it is the largest so far
+    """
+    record = getattr(_state, "record", None)
+    if record is not None:
+        record["child_cpu_seconds"] += cpu_seconds
+        record["child_max_rss_kb"] = max(record["child_max_rss_kb"] or 0, max_rss_kb)
+
+
+def finish_record(outcome, **fields):
+    """
+    Closes the record of the current calculation and appends it to the worker's metrics file
+    :param outcome: ok, failed, cached or error
+    """
+    _state.last_finish = time.time()
+    record = getattr(_state, "record", None)
+    if record is None:
+        return
+    _state.record = None
+    record.update(fields)
+    record["outcome"] = outcome
+    record["wall_time"] = _state.last_finish - record["start"]
+    metrics_dir = record.pop("metrics_dir")
+    if not os.path.exists(metrics_dir):
+        os.makedirs(metrics_dir, exist_ok=True)
+    # threads of one process share its metrics file, a single write of a line on a file opened in append mode keeps lines whole
+    with open(metrics_file(metrics_dir), "a") as fp:
+        fp.write(json.dumps(record) + "\n")
+
+
+def read_metrics(metrics_dir):
+    """
+    Reads the records of all metrics files of a directory
+    """
+    records = []
+    for filename in sorted(os.listdir(metrics_dir)):
+        if not (filename.startswith("metrics_") and filename.endswith(".jsonl")):
+            continue
+        for line in open(os.path.join(metrics_dir, filename), "r"):
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                continue
+    return records
@@ -3,9 +3,10 @@ import numpy as np
 import shutil
 import uuid
 import getpass
-import warnings
+import logging
 
 import utils.dft_utils as dft
+import utils.control_file as control_file
 
 kcal_to_eV = 0.0433641153
 kB = 8.6173303e-5  # eV/K
@@ -14,30 +15,11 @@ kBT = kB * T
 AToBohr = 1.889725989
 HToeV = 27.211399
 
+logger = logging.getLogger(__name__)
+
 def check_basis_and_func(basis_todo, func_todo, path_to_control):
-    func = None
-    basis = None
-    for line in open(path_to_control, "r"):
-        if "functional" in line:
-            func = line.split()[1]
-        elif "basis =" in line and basis is None:
-            basis = line.split()[2]
-    if basis is None:
-        warnings.warn(f"Warning: No basis found in control file! (Path to control: {path_to_control})")
-        #exit(f"No basis found in control file! (Path to control: {path_to_control})")
-    if func is None:
-        warnings.warn(f"Warning: No functional found in control file! (Path to control: {path_to_control})")
-        #exit(f"No functional found in control file! (Path to control: {path_to_control})")
-    if basis != basis_todo:
-        warnings.warn(f"Warning: Wrong basis in control file: Expected {basis_todo} but found {basis}!"
-                      f" (Path to control: {path_to_control})")
-        #exit(f"Wrong basis in control file: Expected {basis_todo} but found {basis}! (Path to control: {path_to_control})")
-    if func != func_todo:
-        warnings.warn(f"Warning: Wrong functional in control file: Expected {func_todo} but found {func}! "
-                      f"(Path to control: {path_to_control})")
-        #exit("Wrong functional is control file: Expected %s but found %s" % (func_todo, func))
-
-    print(f"basis and functional seems to be correct for {path_to_control}")
+    control = control_file.ControlFile.read(path_to_control)
+    return control_file.check_basis_and_func(control, basis_todo, func_todo, path_to_control)
    
 
 def try_mkdir(dirname):
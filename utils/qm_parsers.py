@@ -0,0 +1,193 @@
+import os
+import numpy as np
+
+# Readers of the output files of Turbomole (ridft/dscf, aoforce, eiger) and xtb. Each file is read in one pass
+# and the numbers of a block are converted in bulk with np.fromstring into one array, instead of splitting
+# every line several times and growing lists of Python floats (a Hessian has (3N)^2 of them).
+# The readers return the units of the files (Hartree, Hartree/Bohr, cm^-1, amu), the callers convert.
+
+
+def _to_array(text, columns=None):
+    """
+    Converts the numbers of a text at once, Fortran D exponents included
+    :param columns: if given, the array is reshaped to this many columns
+    :raises ValueError: if the text holds something else than numbers (np.fromstring stops at it without an error)
+    """
+    if "D" in text:
+        text = text.replace("D", "E")
+    values = np.fromstring(text, sep=" ")
+    num_fields = len(text.split())
+    if len(values) != num_fields:
+        raise ValueError("expected %i numbers, could read only the first %i" % (num_fields, len(values)))
+    if columns is not None:
+        values = values.reshape(-1, columns)
+    return values
+
+
+def _without_keywords(text):
+    """
+    Drops the Turbomole keyword lines ($hessian, $end, ...) of a text, the rest of the lines stays as it is
+    """
+    parts = text.split("$")
+    return " ".join([parts[0]] + [part.partition("\n")[2] for part in parts[1:]])
+
+
+def read_tm_energy(moldir="."):
+    """
+    Total energy of the last SCF cycle from the energy file written by ridft and dscf, without running eiger
+    :return: energy in Hartree, None if there is no energy file
+    """
+    path = os.path.join(moldir, "energy")
+    if not os.path.exists(path):
+        return None
+    energy = None
+    with open(path, "r") as fp:
+        for line in fp:
+            if not line.startswith("$"):
+                fields = line.split(None, 2)
+                if len(fields) >= 2:
+                    energy = float(fields[1].replace("D", "E"))
+    return energy
+
+
+def read_eiger_energies(moldir="."):
+    """
+    HOMO, LUMO and total energy from eiger.out
+    :return: [HOMO, LUMO, total energy] in eV
+    """
+    path = os.path.join(moldir, "eiger.out")
+    if not os.path.exists(path):
+        raise FileNotFoundError("the eiger.out file is not found, was searching in directory", moldir)
+    total_energy, energy_homo, energy_lumo = 0.0, 0.0, 0.0
+    with open(path, "r") as fp:
+        for line in fp:
+            fields = line.split()
+            if len(fields) == 0:
+                continue
+            if fields[0] == "Total":
+                total_energy = fields[6]
+            elif fields[0] == "HOMO:":
+                energy_homo = fields[8]
+            elif fields[0] == "LUMO:":
+                energy_lumo = fields[8]
+                break
+    return [float(energy_homo), float(energy_lumo), float(total_energy)]
+
+
+def read_tm_output(path, natoms=None):
+    """
+    Reads the output of ridft or dscf (TM.out) in one pass
+    :param natoms: number of atoms, to also read the Mulliken charges (population analysis), None to skip them
+    :return: dict with "finished", "scf_iterations", "energy" (Hartree, None if not printed) and "partial_charges"
+    """
+    results = {"finished": False, "scf_iterations": None, "energy": None, "partial_charges": None}
+    charges = None
+    read_charges = 0
+    with open(path, "r") as fp:
+        for line in fp:
+            if read_charges > 0:
+                # fixed columns, the charge may touch the atom label
+                charges[natoms - read_charges] = float(line[10:18])
+                read_charges -= 1
+                if read_charges == 0:
+                    results["partial_charges"] = charges.tolist()
+            elif "convergence criteria satisfied after" in line:
+                results["scf_iterations"] = int(line.split()[4])
+            elif "total energy" in line and line.strip().startswith("|"):
+                try:
+                    results["energy"] = float(line.split("=")[1].split()[0].replace("D", "E"))
+                except (ValueError, IndexError):
+                    pass
+            elif natoms is not None and line.split()[:2] == ["atom", "charge"]:
+                charges = np.empty(natoms)
+                read_charges = natoms
+            elif "all done" in line:
+                results["finished"] = True
+                break
+    return results
+
+
+def read_gradient(moldir="."):
+    """
+    Cartesian gradient of the last cycle of a gradient file (Turbomole or xtb, $grad format)
+    :return: array of shape (natoms, 3) in Hartree/Bohr, None if there is none
+    """
+    path = os.path.join(moldir, "gradient")
+    if not os.path.exists(path):
+        return None
+    block = []
+    with open(path, "r") as fp:
+        for line in fp:
+            if "cycle" in line:
+                # only the last cycle counts
+                block = []
+            elif not line.startswith("$") and len(line.split()) == 3:
+                block.append(line)
+    if len(block) == 0:
+        return None
+    return _to_array(" ".join(block), columns=3)
+
+
+def read_hessian(moldir="."):
+    """
+    All numbers of the hessian file (aoforce or xtb) as one flat array, None if there is none
+    """
+    path = os.path.join(moldir, "hessian")
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as fp:
+        hessian = _to_array(_without_keywords(fp.read()))
+    if len(hessian) == 0:
+        return None
+    return hessian
+
+
+def read_vibspectrum(moldir="."):
+    """
+    Wave numbers of the vibspectrum file
+    :return: array in cm^-1, None if there are none
+    """
+    path = os.path.join(moldir, "vibspectrum")
+    if not os.path.exists(path):
+        return None
+    wave_numbers = []
+    read = False
+    with open(path, "r") as fp:
+        for line in fp:
+            if "end" in line:
+                read = False
+            if read:
+                fields = line.split()
+                # with or without a symmetry label
+                if len(fields) == 5:
+                    wave_numbers.append(fields[1])
+                elif len(fields) == 6:
+                    wave_numbers.append(fields[2])
+            if "RAMAN" in line:
+                read = True
+    if len(wave_numbers) == 0:
+        return None
+    return _to_array(" ".join(wave_numbers))
+
+
+def read_reduced_masses(moldir="."):
+    """
+    Reduced masses of the normal modes from g98.out
+    :return: array in amu, None if there are none
+    """
+    path = os.path.join(moldir, "g98.out")
+    if not os.path.exists(path):
+        return None
+    masses = []
+    with open(path, "r") as fp:
+        for line in fp:
+            if "Red. masses" in line:
+                # as before the bulk conversion, fields that are no numbers (e.g. ******** of an overflow) are skipped
+                for x in line.split()[3:]:
+                    try:
+                        masses.append(float(x))
+                    except ValueError:
+                        pass
+    if len(masses) == 0:
+        return None
+    return np.array(masses)
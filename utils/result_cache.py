@@ -0,0 +1,99 @@
+import hashlib
+import json
+import logging
+import os
+import pickle
+import time
+import uuid
+
+import utils.xyz_utils as xyz
+
+logger = logging.getLogger(__name__)
+
+# The result cache is a directory of pickled results dicts, <cache_dir>/<key[:2]>/<key>.pkl, keyed by a hash of the
+# rounded geometry and every setting that changes the result. Entries are written to a private file and renamed
+# into place, so workers on any node sharing the directory only ever see complete entries.
+# The mtime of an entry is its last use, which eviction relies on.
+
+
+def cache_key(method, coords, elements, **settings):
+    """
+    Key of a calculation
+    :param method: "dft" or "xtb"
+    :param settings: every setting that affects the result, e.g. functional, basis, charge
+    """
+    definition = {"method": method,
+                  "geometry": xyz.geometry_hash(coords, elements),
+                  "settings": settings}
+    return hashlib.sha256(json.dumps(definition, sort_keys=True, default=str).encode("utf8")).hexdigest()
+
+
+def entry_path(cache_dir, key):
+    return os.path.join(cache_dir, key[:2], "%s.pkl" % (key))
+
+
+def lookup(cache_dir, key):
+    """
+    :return: the cached results, or None if there are none
+    """
+    path = entry_path(cache_dir, key)
+    try:
+        with open(path, "rb") as fp:
+            results = pickle.load(fp)
+        os.utime(path)
+        # marks the results as not calculated in this run, e.g. for the timings of the cost model
+        results["from_cache"] = True
+    except (OSError, EOFError, pickle.UnpicklingError):
+        # missing, or evicted by another process while reading
+        return None
+    return results
+
+
+def store(cache_dir, key, results):
+    path = entry_path(cache_dir, key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = "%s.%s.tmp" % (path, uuid.uuid4())
+    with open(tmp_path, "wb") as fp:
+        pickle.dump(results, fp)
+    os.replace(tmp_path, path)
+
+
+def evict(cache_dir, max_bytes=None, max_age_days=None):
+    """
+    Removes entries unused for more than max_age_days, then the least recently used entries
+    until the cache is smaller than max_bytes
+    """
+    if not os.path.exists(cache_dir):
+        return
+    now = time.time()
+    entries = []
+    for subdir in os.listdir(cache_dir):
+        subdir_path = os.path.join(cache_dir, subdir)
+        if not os.path.isdir(subdir_path):
+            continue
+        for filename in os.listdir(subdir_path):
+            path = os.path.join(subdir_path, filename)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            if filename.endswith(".tmp") and now - stat.st_mtime < 3600:
+                # probably being written right now
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+    entries.sort()
+    total = sum([size for _, size, _ in entries])
+    removed = 0
+    for mtime, size, path in entries:
+        too_old = max_age_days is not None and now - mtime > max_age_days * 86400
+        too_big = max_bytes is not None and total > max_bytes
+        if not (too_old or too_big or path.endswith(".tmp")):
+            continue
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+        removed += 1
+    logger.info("Result cache eviction removed %i of %i entries, %.1f MB remain", removed, len(entries), total / 1e6)
@@ -0,0 +1,173 @@
+import json
+import os
+import socket
+import numpy as np
+
+import utils.xyz_utils as xyz
+
+# A result store is a directory of segments. Every writer (one per process and node) appends to its own
+# segment, so concurrent writers never share a file and need no locks. A segment holds one binary file
+# per column, the packed geometries (coords.bin, numbers.bin) and the table of its flavours (flavours.json).
+# A row is complete once all columns hold it, so a row cut short by a crash is dropped on the next open.
+
+columns = {"mol_id": np.uint64,       # first 64 bits of the geometry hash
+           "energy": np.float64,      # NaN if the calculation failed
+           "status": np.int8,
+           "flavour": np.int16,       # row of flavours.json
+           "geom_offset": np.int64,   # first atom of the geometry in coords.bin and numbers.bin
+           "natoms": np.int32}
+
+STATUS_OK = 0
+STATUS_FAILED = 1
+
+
+def segment_rows(segment_dir):
+    """
+    Returns the number of complete rows of a segment
+    """
+    rows = []
+    for column, dtype in columns.items():
+        path = os.path.join(segment_dir, "%s.bin" % (column))
+        size = os.path.getsize(path) if os.path.exists(path) else 0
+        rows.append(size // np.dtype(dtype).itemsize)
+    return min(rows)
+
+
+def read_column(segment_dir, column, rows):
+    """
+    Memory-maps the first rows of a column, so that only the selected entries are read from disk
+    """
+    if rows == 0:
+        return np.zeros(0, dtype=columns[column])
+    return np.memmap(os.path.join(segment_dir, "%s.bin" % (column)), dtype=columns[column], mode="r", shape=(rows,))
+
+
+def read_flavours(segment_dir):
+    path = os.path.join(segment_dir, "flavours.json")
+    if not os.path.exists(path):
+        return []
+    with open(path, "r") as fp:
+        return json.load(fp)
+
+
+class ResultStoreWriter:
+    """
+    Appends results to this process's segment of a result store
+    """
+
+    def __init__(self, store_dir, segment=None):
+        if segment is None:
+            segment = "segment_%s_%i" % (socket.gethostname(), os.getpid())
+        self.segment_dir = os.path.join(store_dir, segment)
+        if not os.path.exists(self.segment_dir):
+            os.makedirs(self.segment_dir)
+        self.flavours = read_flavours(self.segment_dir)
+
+        # cut off a row left incomplete by a crash and remember the geometries already stored
+        rows = segment_rows(self.segment_dir)
+        for column, dtype in columns.items():
+            path = os.path.join(self.segment_dir, "%s.bin" % (column))
+            with open(path, "ab") as fp:
+                fp.truncate(rows * np.dtype(dtype).itemsize)
+        self.geometries = {}
+        mol_ids = read_column(self.segment_dir, "mol_id", rows)
+        geom_offsets = read_column(self.segment_dir, "geom_offset", rows)
+        natoms = read_column(self.segment_dir, "natoms", rows)
+        for i in range(rows):
+            self.geometries[int(mol_ids[i])] = (int(geom_offsets[i]), int(natoms[i]))
+
+        self.files = {name: open(os.path.join(self.segment_dir, "%s.bin" % (name)), "ab")
+                      for name in list(columns) + ["coords", "numbers"]}
+        self.num_atoms = os.path.getsize(os.path.join(self.segment_dir, "numbers.bin"))
+        # geometries written after the last complete row are orphans, new geometries go behind them
+        self.files["coords"].truncate(self.num_atoms * 24)
+
+    def append(self, coords, elements, energy, functional, basis, task):
+        """
+        Appends the result of one calculation
+        :param energy: energy, None if the calculation failed
+        :param task: name of the task directory
+        """
+        mol_id = int(xyz.geometry_hash(coords, elements)[:16], 16)
+        if mol_id not in self.geometries:
+            coords_packed, numbers, _ = xyz.pack_frames([coords], [elements])
+            self.files["coords"].write(coords_packed.tobytes())
+            self.files["numbers"].write(numbers.tobytes())
+            self.files["coords"].flush()
+            self.files["numbers"].flush()
+            self.geometries[mol_id] = (self.num_atoms, len(elements))
+            self.num_atoms += len(elements)
+        geom_offset, natoms = self.geometries[mol_id]
+
+        row = {"mol_id": mol_id,
+               "energy": np.nan if energy is None else energy,
+               "status": STATUS_FAILED if energy is None else STATUS_OK,
+               "flavour": self.flavour_id(functional, basis, task),
+               "geom_offset": geom_offset,
+               "natoms": natoms}
+        for column, dtype in columns.items():
+            self.files[column].write(np.array([row[column]], dtype=dtype).tobytes())
+        for column in columns:
+            self.files[column].flush()
+
+    def flavour_id(self, functional, basis, task):
+        flavour = [functional, basis, task]
+        if flavour not in self.flavours:
+            self.flavours.append(flavour)
+            path = os.path.join(self.segment_dir, "flavours.json")
+            with open(path + ".tmp", "w") as fp:
+                json.dump(self.flavours, fp)
+            os.replace(path + ".tmp", path)
+        return self.flavours.index(flavour)
+
+    def close(self):
+        for fp in self.files.values():
+            fp.close()
+
+
+def load_results(store_dir, functional=None, basis=None, mol_id=None):
+    """
+    Reads the rows of a result store that match the given flavour and/or molecule.
+    Only the columns of the matching rows are read from disk, not the geometries.
+    :return: dictionary of column arrays, with the flavour as functional, basis and task columns
+             and the segment name of every row (needed by load_geometry)
+    """
+    selected = {column: [] for column in list(columns) + ["functional", "basis", "task", "segment"]}
+    if not os.path.exists(store_dir):
+        return {column: np.array(values) for column, values in selected.items()}
+
+    for segment in sorted(os.listdir(store_dir)):
+        segment_dir = os.path.join(store_dir, segment)
+        if not os.path.isdir(segment_dir):
+            continue
+        rows = segment_rows(segment_dir)
+        flavours = read_flavours(segment_dir)
+        wanted_flavours = [i for i, (f, b, t) in enumerate(flavours)
+                           if (functional is None or f == functional) and (basis is None or b == basis)]
+        mask = np.isin(read_column(segment_dir, "flavour", rows), wanted_flavours)
+        if mol_id is not None:
+            mask &= read_column(segment_dir, "mol_id", rows) == np.uint64(mol_id)
+        indices = np.nonzero(mask)[0]
+        for column in columns:
+            selected[column].append(np.array(read_column(segment_dir, column, rows)[indices]))
+        flavour_ids = selected["flavour"][-1]
+        selected["functional"].append(np.array([flavours[i][0] for i in flavour_ids], dtype=object))
+        selected["basis"].append(np.array([flavours[i][1] for i in flavour_ids], dtype=object))
+        selected["task"].append(np.array([flavours[i][2] for i in flavour_ids], dtype=object))
+        selected["segment"].append(np.array([segment] * len(indices), dtype=object))
+
+    return {column: np.concatenate(values) if len(values) > 0 else np.array([])
+            for column, values in selected.items()}
+
+
+def load_geometry(store_dir, segment, geom_offset, natoms):
+    """
+    Reads one geometry of a result store
+    :return: coordinates (natoms, 3) and atomic numbers
+    """
+    segment_dir = os.path.join(store_dir, segment)
+    coords = np.memmap(os.path.join(segment_dir, "coords.bin"), dtype=np.float64, mode="r",
+                       offset=int(geom_offset) * 24, shape=(int(natoms), 3))
+    numbers = np.memmap(os.path.join(segment_dir, "numbers.bin"), dtype=np.int8, mode="r",
+                        offset=int(geom_offset), shape=(int(natoms),))
+    return np.array(coords), np.array(numbers)
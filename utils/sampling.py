@@ -0,0 +1,53 @@
+import numpy as np
+
+# A sampling plan assigns molecules of the pool to flavours. Every flavour gets the same core of
+# shared molecules, round(overlap * num_molecules) of them, and fills up with molecules drawn from the
+# rest of the pool. With overlap 1 every flavour calculates the same geometries, which is what lets
+# warm starts and the result cache pay off, with overlap 0 the flavours are sampled independently.
+
+
+def plan_samples(num_pool, num_flavours, num_molecules, overlap=0.0, seed=None):
+    """
+    Builds the molecule x flavour assignment of all flavours at once
+    :param num_pool: number of molecules in the pool
+    :param num_flavours: number of flavours
+    :param num_molecules: number of molecules per flavour
+    :param overlap: fraction of the molecules of a flavour that all flavours share
+    :param seed: seed of the random generator, None for a random seed
+    :return: the plan, a dictionary with the seed, the shared indices and the pool indices of every flavour
+    """
+    if not 0.0 <= overlap <= 1.0:
+        raise ValueError("overlap has to be between 0 and 1, got %s" % (overlap))
+    if num_molecules > num_pool:
+        raise ValueError("cannot sample %i molecules from a pool of %i" % (num_molecules, num_pool))
+    if seed is None:
+        # drawn here, so the plan can always be reproduced from what is recorded
+        seed = int(np.random.SeedSequence().generate_state(1)[0])
+
+    rng = np.random.default_rng(seed)
+    num_shared = int(round(overlap * num_molecules))
+    permutation = rng.permutation(num_pool)
+    shared = permutation[:num_shared]
+    rest = permutation[num_shared:]
+
+    flavour_indices = []
+    for _ in range(num_flavours):
+        own = rest[rng.choice(len(rest), num_molecules - num_shared, replace=False)]
+        # shared molecules come first and in the same order in every flavour
+        flavour_indices.append(np.concatenate([shared, own]).astype(np.int64))
+
+    return {"seed": seed,
+            "overlap": overlap,
+            "num_pool": num_pool,
+            "shared_indices": shared.astype(np.int64),
+            "flavour_indices": flavour_indices}
+
+
+def assignment_matrix(plan):
+    """
+    :return: boolean matrix (num_pool, num_flavours), True where a molecule is calculated with a flavour
+    """
+    matrix = np.zeros((plan["num_pool"], len(plan["flavour_indices"])), dtype=bool)
+    for flavour, indices in enumerate(plan["flavour_indices"]):
+        matrix[indices, flavour] = True
+    return matrix
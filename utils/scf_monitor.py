@@ -0,0 +1,124 @@
+import logging
+import os
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Follows TM.out while ridft or dscf runs and tells engine.run to kill SCFs that will not converge anyway,
+# instead of letting them use their full iteration budget. It reads the per-iteration lines
+#
+#  ITERATION  ENERGY          1e-ENERGY        2e-ENERGY     NORM[dD(SAO)]  TOL
+#    1  -1408.4383718811    -3478.9658478     1216.3262651    0.000D+00 0.231D-10
+#
+# and judges the total energy (Hartree) and the norm of the density change. The first iteration has
+# no density change and is left out of the density criteria.
+
+default_thresholds = {"min_iterations": 10,          # no verdict before this many iterations
+                      "divergence_energy": 1.0,      # diverged: energy this far above the lowest energy so far (Hartree)
+                      "divergence_density": 100.0,   # diverged: density change this many times its lowest value so far
+                      "stall_iterations": 40,        # stalled: the lowest density change of this many iterations
+                      "stall_factor": 0.9,           # is not below this fraction of the lowest before them
+                      "oscillation_iterations": 16,  # oscillating: over this many iterations the energy change
+                      "oscillation_fraction": 0.9,   # flips its sign at this fraction of the steps,
+                      "oscillation_damping": 0.8,    # its amplitude does not fall below this fraction
+                      "oscillation_energy": 1e-4,    # and stays above this (Hartree)
+                      }
+
+
+def parse_thresholds(pairs):
+    """
+    Thresholds from KEY=VALUE strings, e.g. ["stall_iterations=60"], the other thresholds keep their defaults
+    """
+    thresholds = {}
+    for pair in pairs:
+        key, _, value = pair.partition("=")
+        if key not in default_thresholds:
+            raise ValueError("unknown SCF monitor threshold %s, known are: %s" % (key, ", ".join(default_thresholds)))
+        thresholds[key] = float(value)
+    return thresholds
+
+
+def parse_iteration_line(line):
+    """
+    :return: iteration number, energy and density change of an SCF iteration line, None for other lines
+    """
+    fields = line.split()
+    if len(fields) != 6 or not fields[0].isdigit():
+        return None
+    try:
+        return int(fields[0]), float(fields[1]), float(fields[4].replace("D", "E"))
+    except ValueError:
+        return None
+
+
+class ScfMonitor:
+    """
+    Called by the watcher of engine.run about once a second, reads what the SCF has written to its output
+    since the last call and returns the reason to abort it ("scf_diverged", "scf_stalled" or "scf_oscillating")
+    or None to let it go on
+    :param path: output file of the SCF program
+    :param thresholds: thresholds differing from default_thresholds
+    """
+
+    def __init__(self, path, thresholds=None):
+        self.path = path
+        self.thresholds = dict(default_thresholds, **(thresholds or {}))
+        self.energies = []
+        self.density_changes = []
+        self._offset = 0
+        self._partial = b""
+
+    def __call__(self):
+        self.read()
+        reason = self.check()
+        if reason is not None:
+            logger.warning("Aborting the SCF in %s after %i iterations: %s, energy %.8f, density change %.2e",
+                           os.path.dirname(self.path), len(self.energies), reason, self.energies[-1],
+                           self.density_changes[-1])
+        return reason
+
+    def read(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "rb") as fp:
+            fp.seek(self._offset)
+            data = fp.read()
+        self._offset += len(data)
+        lines = (self._partial + data).split(b"\n")
+        # the last line may still be incomplete
+        self._partial = lines.pop()
+        for line in lines:
+            parsed = parse_iteration_line(line.decode(errors="replace"))
+            # the iteration number has to follow on, other tables of the output have numbered lines as well
+            if parsed is None or parsed[0] != len(self.energies) + 1:
+                continue
+            self.energies.append(parsed[1])
+            if parsed[0] > 1:
+                self.density_changes.append(parsed[2])
+
+    def check(self):
+        t = self.thresholds
+        if len(self.energies) < max(2, t["min_iterations"]):
+            return None
+        energies = np.array(self.energies)
+        density_changes = np.array(self.density_changes)
+
+        if not np.isfinite(energies[-1]) or energies[-1] - np.min(energies) > t["divergence_energy"]:
+            return "scf_diverged"
+        if 0 < np.min(density_changes) and density_changes[-1] > t["divergence_density"] * np.min(density_changes):
+            return "scf_diverged"
+
+        window = int(t["stall_iterations"])
+        if len(density_changes) > window and np.min(density_changes[-window:]) > t["stall_factor"] * np.min(density_changes[:-window]):
+            return "scf_stalled"
+
+        window = int(t["oscillation_iterations"])
+        if len(energies) > window:
+            steps = np.diff(energies[-window - 1:])
+            flips = np.sum(np.sign(steps[1:]) != np.sign(steps[:-1]))
+            half = len(steps) // 2
+            first, last = np.mean(np.abs(steps[:half])), np.mean(np.abs(steps[half:]))
+            if flips >= t["oscillation_fraction"] * (len(steps) - 1) and last >= t["oscillation_damping"] * first \
+                    and last > t["oscillation_energy"]:
+                return "scf_oscillating"
+        return None
@@ -0,0 +1,109 @@
+import logging
+import multiprocessing.util
+import os
+import queue
+import shutil
+import threading
+import uuid
+
+import utils.calc_archive as calc_archive
+
+logger = logging.getLogger(__name__)
+
+_copy_queue = None
+_copy_pid = None
+_copy_lock = threading.Lock()
+
+
+def scratch_root():
+    """
+    Node-local directory for the calculations: $TMPDIR if the batch system provides one, /tmp otherwise
+    """
+    return os.environ.get("TMPDIR", "/tmp")
+
+
+def worker_rundir(scratch_dir, prefix):
+    """
+    Returns the run directory of this worker on the scratch disk. The directory is the same for
+    all jobs of a worker and is emptied before each job.
+    """
+    rundir = os.path.join(scratch_dir, "%s_scratch_%i_%i" % (prefix, os.getpid(), threading.get_ident()))
+    if os.path.exists(rundir):
+        clear_rundir(rundir)
+    else:
+        os.makedirs(rundir)
+    return rundir
+
+
+def clear_rundir(rundir):
+    for filename in os.listdir(rundir):
+        path = os.path.join(rundir, filename)
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        else:
+            os.remove(path)
+
+
+def copy_back(rundir, destination, keep_files=None, archive_path=None, name=None):
+    """
+    Copies the artifacts of a finished calculation from the scratch run directory to destination
+    in a background thread. The run directory is renamed away first (a cheap local operation),
+    so the worker can start its next job in a fresh run directory right away.
+    :param rundir: run directory on the scratch disk
+    :param destination: directory on the shared filesystem
+    :param keep_files: names of the files to copy back, None to copy all files
+    :param archive_path: if given, the files are appended to this archive under name instead of copied to destination
+    :param name: name of the calculation in the archive
+    """
+    outgoing = "%s_outgoing_%s" % (rundir, uuid.uuid4())
+    os.rename(rundir, outgoing)
+    os.makedirs(rundir)
+    _start_copy_thread()
+    _copy_queue.put((outgoing, destination, keep_files, archive_path, name))
+
+
+def wait_for_copy_back():
+    """
+    Blocks until everything handed to copy_back has been copied
+    """
+    if _copy_queue is not None and _copy_pid == os.getpid():
+        _copy_queue.join()
+
+
+def _start_copy_thread():
+    global _copy_queue, _copy_pid
+    # the workers of a thread pool share one copy thread
+    with _copy_lock:
+        # a forked pool worker inherits the queue of its parent, but not the thread
+        if _copy_queue is not None and _copy_pid == os.getpid():
+            return
+        _copy_queue = queue.Queue()
+        _copy_pid = os.getpid()
+        threading.Thread(target=_copy_loop, args=(_copy_queue,), daemon=True).start()
+        # pool workers do not run atexit handlers, but they do run multiprocessing finalizers
+        multiprocessing.util.Finalize(None, wait_for_copy_back, exitpriority=10)
+
+
+def _copy_loop(copy_queue):
+    while True:
+        outgoing, destination, keep_files, archive_path, name = copy_queue.get()
+        try:
+            if archive_path is not None:
+                calc_archive.archive_calculation(archive_path, name, outgoing, keep_files)
+                shutil.rmtree(outgoing)
+            else:
+                _copy_files(outgoing, destination, keep_files)
+        except Exception as exc:
+            logger.warning("copying back %s to %s has failed: %s", outgoing, destination, exc)
+        finally:
+            copy_queue.task_done()
+
+
+def _copy_files(outgoing, destination, keep_files):
+    if not os.path.exists(destination):
+        os.makedirs(destination)
+    for filename in os.listdir(outgoing):
+        path = os.path.join(outgoing, filename)
+        if os.path.isfile(path) and (keep_files is None or filename in keep_files):
+            shutil.copy(path, os.path.join(destination, filename))
+    shutil.rmtree(outgoing)
@@ -0,0 +1,52 @@
+import hashlib
+import os
+import shutil
+import uuid
+
+import utils.xyz_utils as xyz
+
+# converged orbitals of closed shell (mos) and open shell (alpha, beta) calculations
+orbital_files = ["mos", "alpha", "beta"]
+
+
+def warm_start_key(coords, elements, dft_settings, charge, uhf):
+    """
+    Key of the converged orbitals of a geometry. Turbomole orbitals are only valid in the basis they
+    were computed in, so the functional is not part of the key but the basis is.
+    """
+    definition = "%s %s %s %s %s" % (xyz.geometry_hash(coords, elements), dft_settings["turbomole_basis"],
+                                     dft_settings["turbomole_method"], int(charge), uhf)
+    return hashlib.sha1(definition.encode("utf8")).hexdigest()
+
+
+def seed_orbitals(store_dir, key, moldir):
+    """
+    Copies converged orbitals of an earlier flavour into moldir
+    :return: True if orbitals were found, False otherwise
+    """
+    orbitals_dir = os.path.join(store_dir, key)
+    if not os.path.isdir(orbitals_dir):
+        return False
+    for filename in os.listdir(orbitals_dir):
+        shutil.copy(os.path.join(orbitals_dir, filename), os.path.join(moldir, filename))
+    return True
+
+
+def keep_orbitals(store_dir, key, moldir):
+    """
+    Keeps the converged orbitals of moldir for later flavours. The first (cheapest) flavour that
+    converges for a geometry wins; the orbitals are renamed into place so readers never see partial files.
+    """
+    if os.path.isdir(os.path.join(store_dir, key)):
+        return
+    if not os.path.exists(store_dir):
+        os.makedirs(store_dir, exist_ok=True)
+    build_dir = os.path.join(store_dir, "build_%s" % (uuid.uuid4()))
+    os.makedirs(build_dir)
+    for filename in orbital_files:
+        if os.path.exists(os.path.join(moldir, filename)):
+            shutil.copy(os.path.join(moldir, filename), os.path.join(build_dir, filename))
+    try:
+        os.rename(build_dir, os.path.join(store_dir, key))
+    except OSError:
+        shutil.rmtree(build_dir)
@@ -1,13 +1,19 @@
 from __future__ import print_function
 from __future__ import absolute_import
+import logging
 import uuid
 import os
 import numpy as np
 import subprocess
 import shlex
-import yaml
+import shutil
 
 import utils.xyz_utils as xyz
+import utils.cores as cores
+import utils.scratch as scratch
+import utils.result_cache as result_cache
+import utils.engine as engine
+import utils.qm_parsers as qm_parsers
 
 kcal_to_eV=0.0433641153
 kB=8.6173303e-5 #eV/K
@@ -16,47 +22,74 @@ kBT=kB*T
 AToBohr=1.889725989
 HToeV = 27.211399
 
+logger = logging.getLogger(__name__)
+
 def do_xtb_runs(settings, name, coords_todo, elements_todo):
     if "test" in name:
         outdir = settings["outdir_test"]
     else:
         outdir = settings["outdir"]
-    # initial xtb runs
-    if os.path.exists("%s/es_%s.txt"%(outdir, name)) and not settings["overwrite"]:
-        print("   ---   load %s labels"%(name))
-        es = np.loadtxt("%s/es_%s.txt"%(outdir, name))
+    # initial xtb runs, the labels are kept as binary .npy files
+    if os.path.exists("%s/es_%s.npy"%(outdir, name)) and not settings["overwrite"]:
+        logger.info("   ---   load %s labels", name)
+        es = np.load("%s/es_%s.npy"%(outdir, name))
     else:
-        print("   ---   load t%s labels"%(name))
-        es = run_xtb(coords_todo, elements_todo)
-        np.savetxt("%s/es_train.txt"%(outdir, name), es)
+        logger.info("   ---   calculate %s labels", name)
+        es = run_xtb(coords_todo, elements_todo, number_of_workers=settings.get("num_workers"))
+        np.save("%s/es_%s.npy"%(outdir, name), es)
     return(es)
 
 
-def run_xtb(coords, elements):
-    es = []
+def run_xtb(coords, elements, number_of_workers=None, pool=None):
+    """
+    xtb energies of molecules with any elements, the molecules of the same elements are run as one batch
+    :param pool: pool made by cores.make_pool that runs all batches, with number_of_workers its number of workers.
+                 None for one pool for all batches, made here
+    :return: energies in eV, NaN for failed calculations
+    """
+    if pool is None:
+        pool, number_of_workers = cores.make_pool(number_of_workers, 1)
+        with pool:
+            es = run_xtb(coords, elements, number_of_workers=number_of_workers, pool=pool)
+            pool.close()
+            pool.join()
+        return(es)
+    es = np.full(len(coords), np.nan)
+    batches = {}
     for molidx in range(len(coords)):
-        c_here = coords[molidx]
-        el_here = elements[molidx]
-        results = xtb_calc(c_here, el_here, opt=False, grad=False, hess=False, charge=0, freeze=[])
-        e = results["energy"]
-        es.append(e)
-    es = np.array(es)
+        batches.setdefault(tuple(elements[molidx]), []).append(molidx)
+    for elements_here, molidxs in batches.items():
+        es[molidxs], _ = xtb_batch(np.array([coords[molidx] for molidx in molidxs]), list(elements_here),
+                                   number_of_workers=number_of_workers, pool=pool)
     return(es)
 
 
+def save_results(path, results):
+    """
+    Writes a results dict of xtb_calc as .npz, the entries that are None are left out
+    """
+    np.savez(path, **{key: np.asarray(value) for key, value in results.items() if value is not None})
+
+
+def load_results(path, keys=("energy", "coords", "elements", "gradient", "hessian", "vibspectrum", "reduced_masses")):
+    with np.load(path) as data:
+        results = {key: data[key] if key in data else None for key in keys}
+    if results["energy"] is not None:
+        results["energy"] = float(results["energy"])
+    if results["elements"] is not None:
+        results["elements"] = results["elements"].tolist()
+    return(results)
+
+
 def get_hess(settings):
     outdir = settings["outdir"]
-    if os.path.exists("%s/results_start.yml"%(outdir)) and not settings["overwrite"]:
-        print("   ---   load optimized molecule and hessian")
-        infile=open("%s/results_start.yml"%(outdir),"r")
-        results_start = yaml.load(infile, Loader=yaml.Loader)
+    if os.path.exists("%s/results_start.npz"%(outdir)) and not settings["overwrite"]:
+        logger.info("   ---   load optimized molecule and hessian")
+        results_start = load_results("%s/results_start.npz"%(outdir))
     else:
-        print("   ---   optimize molecule and calculate hessian")
+        logger.info("   ---   optimize molecule and calculate hessian")
         results_start = xtb_calc(settings["coords"], settings["elements"], opt=True, grad=False, hess=True, charge=0, freeze=[])
-        outfilename="%s/results_start.yml"%(outdir)
-        outfile=open(outfilename,"w")
-        outfile.write(yaml.dump(results_start, default_flow_style=False))
-        outfile.close()
+        save_results("%s/results_start.npz"%(outdir), results_start)
     n = settings["n"]
     hess = results_start["hessian"].reshape(3*n,n,3)
     settings["hess"] = hess
@@ -65,32 +98,112 @@ def get_hess(settings):
     return(hess)
 
 
-
-def xtb_calc(coords, elements, opt=False, grad=False, hess=False, charge=0, freeze=[]):
+def xtb_batch(coords, elements, number_of_workers=None, grad=False, charge=0, threads_per_calc=1, chunk_size=None,
+              scratch_dir=None, result_cache_dir=None, backend="process", pool=None):
+    """
+    xtb energies (and gradients) of a batch of geometries of the same molecule, run in chunks by a pool of workers
+    that split the CPUs between them (one thread per xtb run by default, small molecules do not scale further)
+    :param coords: packed geometries, array of shape (num_molecules, num_atoms, 3) in Angstrom
+    :param elements: elements of the atoms, the same for all geometries
+    :param number_of_workers: number of workers, None for as many as the CPUs allow with threads_per_calc threads each.
+                              With pool, the number of workers of that pool as returned by cores.make_pool
+    :param chunk_size: geometries per pool job, None for about four jobs per worker
+    :param scratch_dir: directory of the run directories of the workers, None for the node-local scratch disk
+    :param pool: pool made by cores.make_pool to run the chunks on, it stays open for the next batch.
+                 None to make a pool for this batch only
+    :return: energies (num_molecules,) in eV and gradients (num_molecules, num_atoms, 3) in eV/Angstrom (None without grad),
+             NaN for failed calculations
+    """
+    coords = np.asarray(coords, dtype=np.float64)
+    num_molecules = len(coords)
+    energies = np.full(num_molecules, np.nan)
+    gradients = np.full(coords.shape, np.nan) if grad else None
+    if num_molecules == 0:
+        return(energies, gradients)
+    if scratch_dir is None:
+        scratch_dir = scratch.scratch_root()
+
+    if pool is None:
+        pool, pool_workers = cores.make_pool(number_of_workers, threads_per_calc, backend)
+        with pool:
+            run_xtb_chunks(pool, pool_workers, coords, elements, energies, gradients, grad, charge, chunk_size,
+                           scratch_dir, result_cache_dir)
+            pool.close()
+            pool.join()
+    else:
+        if number_of_workers is None:
+            raise ValueError("xtb_batch needs the number of workers of the pool it is given")
+        run_xtb_chunks(pool, number_of_workers, coords, elements, energies, gradients, grad, charge, chunk_size,
+                       scratch_dir, result_cache_dir)
+    logger.info("xtb batch of %i geometries done, %i failed", num_molecules, np.sum(np.isnan(energies)))
+    return(energies, gradients)
+
+
+def run_xtb_chunks(pool, num_workers, coords, elements, energies, gradients, grad, charge, chunk_size, scratch_dir,
+                   result_cache_dir):
+    """
+    Runs the geometries of a batch in chunks on the pool and writes the results into energies and gradients
+    """
+    num_molecules = len(coords)
+    if chunk_size is None:
+        chunk_size = max(1, min(256, num_molecules // (4 * num_workers)))
+    jobs = [(start, coords[start:start + chunk_size], elements, grad, charge, scratch_dir, result_cache_dir)
+            for start in range(0, num_molecules, chunk_size)]
+    for start, energies_chunk, gradients_chunk in pool.imap_unordered(xtb_chunk, jobs):
+        energies[start:start + len(energies_chunk)] = energies_chunk
+        if grad:
+            gradients[start:start + len(energies_chunk)] = gradients_chunk
+
+
+def xtb_chunk(job):
+    """
+    Pool job of xtb_batch: runs the geometries of one chunk one after the other in the run directory of the worker
+    """
+    start, coords, elements, grad, charge, scratch_dir, result_cache_dir = job
+    energies = np.full(len(coords), np.nan)
+    gradients = np.full(coords.shape, np.nan) if grad else None
+    for i in range(len(coords)):
+        results = xtb_calc(coords[i].tolist(), elements, opt=False, grad=grad, hess=False, charge=charge, freeze=[],
+                           scratch_dir=scratch_dir, result_cache_dir=result_cache_dir)
+        if results["energy"] is not None:
+            energies[i] = results["energy"]
+        if grad and results["gradient"] is not None:
+            gradients[i] = results["gradient"]
+    return(start, energies, gradients)
+
+
+def xtb_calc(coords, elements, opt=False, grad=False, hess=False, charge=0, freeze=[], scratch_dir=None, result_cache_dir=None):
 
     if opt and grad:
-        exit("opt and grad are exclusive")
+        raise ValueError("opt and grad are exclusive")
     if hess and grad:
-        exit("hess and grad are exclusive")
+        raise ValueError("hess and grad are exclusive")
 
     if hess or grad:
         if len(freeze)!=0:
-            print("WARNING: please test the combination of hess/grad and freeze carefully")
+            logger.warning("please test the combination of hess/grad and freeze carefully")
 
-    rundir="xtb_tmpdir_%s"%(uuid.uuid4())
+    if result_cache_dir is not None:
+        cache_key = result_cache.cache_key("xtb", coords, elements, opt=opt, grad=grad, hess=hess, charge=charge, freeze=list(freeze))
+        cached = result_cache.lookup(result_cache_dir, cache_key)
+        if cached is not None:
+            return(cached)
+
+    if scratch_dir is not None:
+        rundir = scratch.worker_rundir(scratch_dir, "xtb")
+    else:
+        rundir="xtb_tmpdir_%s"%(uuid.uuid4())
     if not os.path.exists(rundir):
         os.makedirs(rundir)
     else:
         if len(os.listdir(rundir))>0:
-            os.system("rm %s/*"%(rundir))
+            scratch.clear_rundir(rundir)
 
-    startdir=os.getcwd()
-    os.chdir(rundir)
-
-    xyz.exportXYZ(coords, elements, "in.xyz")
+    # no chdir: the working directory is shared by all threads of the process, every path below includes rundir
+    xyz.exportXYZ(coords, elements, os.path.join(rundir, "in.xyz"))
 
     if len(freeze)>0:
-        outfile=open("xcontrol","w")
+        outfile=open(os.path.join(rundir, "xcontrol"),"w")
         outfile.write("$fix\n")
         outfile.write(" atoms: ")
         for counter,i in enumerate(freeze):
@@ -129,128 +242,80 @@ def xtb_calc(coords, elements, opt=False, grad=False, hess=False, charge=0, free
                 command = "xtb %s in.xyz --chrg %i"%(add,charge)
 
 
-    os.environ["OMP_NUM_THREADS"]="10" # "%s"%(settings["OMP_NUM_THREADS"])
-    os.environ["MKL_NUM_THREADS"]="10" # "%s"%(settings["MKL_NUM_THREADS"])
-
-
     args = shlex.split(command)
 
-    mystdout = open("xtb.log", "a")
-    process = subprocess.Popen(args, stdout=mystdout, stderr=subprocess.PIPE)
-    out, err = process.communicate()
-    mystdout.close()
-
+    try:
+        engine.run(args, rundir, stdout="xtb.log", stderr="xtb.err", phase="xtb")
+    except engine.CalculationAborted as error:
+        logger.warning("xtb calculation in %s was aborted: %s", rundir, error.reason)
+        if scratch_dir is not None:
+            scratch.clear_rundir(rundir)
+        else:
+            shutil.rmtree(rundir)
+        return {"energy": None, "coords": coords, "elements": elements, "gradient": None, "hessian": None, "vibspectrum": None, "reduced_masses": None, "aborted": error.reason}
 
     if opt:
-        if not os.path.exists("xtbopt.xyz"):
-            print("WARNING: xtb geometry optimization did not work")
+        if not os.path.exists(os.path.join(rundir, "xtbopt.xyz")):
+            logger.warning("xtb geometry optimization did not work")
             coords_new, elements_new = None, None
         else:
-            coords_new, elements_new = xyz.readXYZ("xtbopt.xyz")
+            coords_new, elements_new = xyz.readXYZ(os.path.join(rundir, "xtbopt.xyz"))
     else:
-        coords_new, elements_new = None, None
+        coords_new, elements_new = coords, elements
 
     if grad:
-        grad = read_xtb_grad()
+        grad = read_xtb_grad(rundir)
     else:
         grad = None
 
     if hess:
-        hess, vibspectrum, reduced_masses = read_xtb_hess()
+        hess, vibspectrum, reduced_masses = read_xtb_hess(rundir)
     else:
         hess, vibspectrum, reduced_masses = None, None, None
 
-    e = read_xtb_energy()
+    e = read_xtb_energy(rundir)
 
-    os.chdir(startdir)
-
-    os.system("rm -r %s"%(rundir))
+    if scratch_dir is not None:
+        scratch.clear_rundir(rundir)
+    else:
+        shutil.rmtree(rundir)
 
     results={"energy": e, "coords": coords_new, "elements": elements_new, "gradient": grad, "hessian": hess, "vibspectrum": vibspectrum, "reduced_masses": reduced_masses}
+    if result_cache_dir is not None and e is not None:
+        result_cache.store(result_cache_dir, cache_key, results)
     return(results)
 
 
-def read_xtb_energy():
-    if not os.path.exists("xtb.log"):
+def read_xtb_energy(moldir="."):
+    if not os.path.exists(os.path.join(moldir, "xtb.log")):
         return(None)
     energy=None
-    for line in open("xtb.log"):
+    for line in open(os.path.join(moldir, "xtb.log")):
         if "| TOTAL ENERGY" in line:
-            energy = float(line.split()[3])*HToeV
+            energy = float(line.split(None, 4)[3])*HToeV
     return(energy)
 
 
-def read_xtb_grad():
-    if not os.path.exists("gradient"):
-        return(None)
-    grad = []
-    for line in open("gradient","r"):
-        if len(line.split())==3:
-            grad.append([float(line.split()[0]), float(line.split()[1]), float(line.split()[2])])
-    if len(grad)==0:
-        grad=None
-    else:
-        grad = np.array(grad)*HToeV*AToBohr
+def read_xtb_grad(moldir="."):
+    grad = qm_parsers.read_gradient(moldir)
+    if grad is not None:
+        grad = grad*HToeV*AToBohr
     return(grad)
 
 
-def read_xtb_hess():
-    hess = None
-    if not os.path.exists("hessian"):
+def read_xtb_hess(moldir="."):
+    if not os.path.exists(os.path.join(moldir, "hessian")):
         return(None, None, None)
-    hess = []
-    for line in open("hessian","r"):
-        if "hess" not in line:
-            for x in line.split():
-                hess.append(float(x))
-    if len(hess)==0:
-        hess=None
-    else:
-        hess = np.array(hess)
-
-    vibspectrum = None
-    if not os.path.exists("vibspectrum"):
+    hess = qm_parsers.read_hessian(moldir)
+    if not os.path.exists(os.path.join(moldir, "vibspectrum")):
         return(None, None, None)
-    vibspectrum = []
-    read=False
-    for line in open("vibspectrum","r"):
-        if "end" in line:
-            read=False
-
-        if read:
-            if len(line.split())==5:
-                vibspectrum.append(float(line.split()[1]))
-            elif len(line.split())==6:
-                vibspectrum.append(float(line.split()[2]))
-            else:
-                print("WARNING: weird line length: %s"%(line))
-        if "RAMAN" in line:
-            read=True
-    
-    reduced_masses = None
-    if not os.path.exists("g98.out"):
-        print("g98.out not found")
+    if not os.path.exists(os.path.join(moldir, "g98.out")):
+        logger.warning("g98.out not found")
         return(None, None, None)
-    reduced_masses = []
-    read=False
-    for line in open("g98.out","r"):
-        if "Red. masses" in line:
-            for x in line.split()[3:]:
-                try:
-                    reduced_masses.append(float(x))
-                except:
-                    pass
-
-    if len(vibspectrum)==0:
-        vibspectrum=None
-        print("no vibspectrum found")
-    else:
-        vibspectrum = np.array(vibspectrum)
-
-    if len(reduced_masses)==0:
-        reduced_masses = None
-        print("no reduced masses found")
-    else:
-        reduced_masses = np.array(reduced_masses)
-
+    vibspectrum = qm_parsers.read_vibspectrum(moldir)
+    if vibspectrum is None:
+        logger.warning("no vibspectrum found")
+    reduced_masses = qm_parsers.read_reduced_masses(moldir)
+    if reduced_masses is None:
+        logger.warning("no reduced masses found")
     return(hess, vibspectrum, reduced_masses)
@@ -0,0 +1,121 @@
+import logging
+import os
+import numpy as np
+
+import utils.xyz_utils as xyz
+
+logger = logging.getLogger(__name__)
+
+# The index of a multi-frame xyz file is kept next to it as <file>.index.npz. It stores the byte offset,
+# atom count and composition of every frame, together with size and mtime of the file it was built from.
+# Byte offsets only allow cheap seeks in uncompressed files, compressed pools are read as a whole instead.
+
+
+def index_path(filename):
+    return "%s.index.npz" % (filename)
+
+
+def build_index(filename):
+    """
+    Builds the frame index of an xyz file in one pass
+    :return: dictionary with offsets (int64), natoms (int32), elements (int8 atomic numbers of the columns
+             of composition) and composition (int32, atoms of each element per frame)
+    """
+    stat = os.stat(filename)
+    offsets = []
+    natoms = []
+    symbols = []
+    with open(filename, "rb") as infile:
+        position = 0
+        for header in infile:
+            if len(header.strip()) == 0:
+                position += len(header)
+                continue
+            offsets.append(position)
+            count = int(header)
+            natoms.append(count)
+            position += len(header) + len(infile.readline())
+            for _ in range(count):
+                line = infile.readline()
+                position += len(line)
+                symbols.append(line.split(None, 1)[0].decode("utf8"))
+
+    lookup = {symbol: xyz.atomic_numbers[symbol.capitalize()] for symbol in set(symbols)}
+    numbers = np.fromiter([lookup[symbol] for symbol in symbols], dtype=np.int8, count=len(symbols))
+    elements = np.unique(numbers)
+    frame_of_atom = np.repeat(np.arange(len(natoms)), natoms)
+    composition = np.zeros((len(natoms), len(elements)), dtype=np.int32)
+    np.add.at(composition, (frame_of_atom, np.searchsorted(elements, numbers)), 1)
+
+    return {"offsets": np.array(offsets, dtype=np.int64),
+            "natoms": np.array(natoms, dtype=np.int32),
+            "elements": elements,
+            "composition": composition,
+            "size": np.int64(stat.st_size),
+            "mtime_ns": np.int64(stat.st_mtime_ns)}
+
+
+def load_index(filename):
+    """
+    Loads the frame index of an xyz file, building (and storing) it if it is missing or outdated
+    """
+    stat = os.stat(filename)
+    path = index_path(filename)
+    if os.path.exists(path):
+        with np.load(path) as stored:
+            index = {key: stored[key] for key in stored.files}
+        if index["size"] == stat.st_size and index["mtime_ns"] == stat.st_mtime_ns:
+            return index
+        logger.info("The frame index of %s is outdated, rebuilding it", filename)
+
+    index = build_index(filename)
+    try:
+        tmp_path = "%s.%i.tmp.npz" % (path[:-len(".npz")], os.getpid())
+        np.savez(tmp_path, **index)
+        os.replace(tmp_path, path)
+    except OSError as exc:
+        logger.warning("Could not store the frame index next to %s: %s", filename, exc)
+    return index
+
+
+def read_frames(filename, indices, index):
+    """
+    Reads selected frames of an xyz file by seeking straight to them
+    :param indices: frame indices to read
+    :param index: frame index from load_index
+    :return: packed coordinates, atomic numbers and frame offsets (see xyz_utils.read_xyz_packed)
+    """
+    atom_lines = []
+    natoms = []
+    with open(filename, "rb") as infile:
+        for frame in indices:
+            infile.seek(int(index["offsets"][frame]))
+            count = int(infile.readline())
+            infile.readline() #comment line
+            for _ in range(count):
+                atom_lines.append(infile.readline().decode("utf8"))
+            natoms.append(count)
+    offsets = np.zeros(len(natoms) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(natoms)
+    coords, numbers = xyz.parse_atom_lines(atom_lines)
+    return coords, numbers, offsets
+
+
+def read_frames_list(filename, indices, index):
+    """
+    Like read_frames, but returns lists of frames as xyz_utils.readXYZs does
+    """
+    return xyz.unpack_frames(*read_frames(filename, indices, index))
+
+
+def read_pool_frames(filename, indices):
+    """
+    Reads selected frames of a pool, seeking through its index or, for compressed pools, reading it as a whole
+    :return: dictionary from frame index to (coords, elements)
+    """
+    indices = np.unique(np.asarray(indices, dtype=np.int64))
+    if filename.endswith((".gz", ".xz")):
+        coords_all, elements_all = xyz.readXYZs(filename)
+        return {i: (coords_all[i], elements_all[i]) for i in indices}
+    coords, elements = read_frames_list(filename, indices, load_index(filename))
+    return dict(zip(indices, zip(coords, elements)))
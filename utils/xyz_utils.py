@@ -1,6 +1,10 @@
 import numpy as np
 import os
 import subprocess
+import hashlib
+import gzip
+import lzma
+from itertools import islice
 
 kcal_to_eV=0.0433641153
 kB=8.6173303e-5 #eV/K
@@ -9,6 +13,19 @@ kBT=kB*T
 AToBohr=1.889725989
 HToeV = 27.211399
 
+element_symbols = ["X",
+                   "H", "He",
+                   "Li", "Be", "B", "C", "N", "O", "F", "Ne",
+                   "Na", "Mg", "Al", "Si", "P", "S", "Cl", "Ar",
+                   "K", "Ca", "Sc", "Ti", "V", "Cr", "Mn", "Fe", "Co", "Ni", "Cu", "Zn", "Ga", "Ge", "As", "Se", "Br", "Kr",
+                   "Rb", "Sr", "Y", "Zr", "Nb", "Mo", "Tc", "Ru", "Rh", "Pd", "Ag", "Cd", "In", "Sn", "Sb", "Te", "I", "Xe",
+                   "Cs", "Ba", "La", "Ce", "Pr", "Nd", "Pm", "Sm", "Eu", "Gd", "Tb", "Dy", "Ho", "Er", "Tm", "Yb", "Lu",
+                   "Hf", "Ta", "W", "Re", "Os", "Ir", "Pt", "Au", "Hg", "Tl", "Pb", "Bi", "Po", "At", "Rn"]
+atomic_numbers = {symbol: number for number, symbol in enumerate(element_symbols)}
+
+#number of atom lines converted to arrays at once by read_xyz_packed
+read_block_size = 1000000
+
 #converts XYZ files into turbomole coordinates
 def x2t_command(infile, outfile, moldir):
     startdir = os.getcwd() #gets the current working directory
@@ -33,18 +50,90 @@ def readXYZ(filename):
 
 
 def readXYZs(filename):
-    infile=open(filename,"r")
-    coords=[[]]
-    elements=[[]]
-    for line in infile.readlines():
-        if len(line.split())==1 and len(coords[-1])!=0:
-            coords.append([])
-            elements.append([])
-        elif len(line.split())==4:
-            elements[-1].append(line.split()[0].capitalize())
-            coords[-1].append([float(line.split()[1]),float(line.split()[2]),float(line.split()[3])])
-    infile.close()
-    return coords,elements
+    coords_packed, numbers, offsets = read_xyz_packed(filename)
+    return unpack_frames(coords_packed, numbers, offsets)
+
+
+#opens plain, gzip (.gz) and xz (.xz) compressed files in text mode
+def open_xyz(filename, mode="r"):
+    if filename.endswith(".gz"):
+        return gzip.open(filename, mode + "t")
+    if filename.endswith(".xz"):
+        return lzma.open(filename, mode + "t")
+    return open(filename, mode)
+
+
+def read_xyz_packed(filename):
+    """
+    Reads a multi-frame xyz file into packed arrays
+    :return: float64 coordinates (total_atoms, 3), int8 atomic numbers (total_atoms,)
+             and int64 frame offsets (num_frames + 1,), frame i is coords[offsets[i]:offsets[i+1]]
+    """
+    natoms = []
+    coords_blocks = []
+    numbers_blocks = []
+    atom_lines = []
+    with open_xyz(filename, "r") as infile:
+        for header in infile:
+            if len(header.strip()) == 0:
+                continue
+            count = int(header)
+            natoms.append(count)
+            infile.readline() #comment line
+            atom_lines.extend(islice(infile, count))
+            if len(atom_lines) >= read_block_size:
+                coords_block, numbers_block = parse_atom_lines(atom_lines)
+                coords_blocks.append(coords_block)
+                numbers_blocks.append(numbers_block)
+                atom_lines = []
+    if len(atom_lines) > 0 or len(coords_blocks) == 0:
+        coords_block, numbers_block = parse_atom_lines(atom_lines)
+        coords_blocks.append(coords_block)
+        numbers_blocks.append(numbers_block)
+
+    offsets = np.zeros(len(natoms) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(natoms)
+    return np.concatenate(coords_blocks), np.concatenate(numbers_blocks), offsets
+
+
+def parse_atom_lines(atom_lines):
+    if len(atom_lines) == 0:
+        return np.zeros((0, 3)), np.zeros(0, dtype=np.int8)
+    tokens = "".join(atom_lines).split()
+    if len(tokens) != 4 * len(atom_lines):
+        #extra columns, e.g. forces: keep element and position only
+        tokens = [t for line in atom_lines for t in line.split()[:4]]
+    symbols = tokens[0::4]
+    del tokens[0::4]
+    coords = np.fromstring(" ".join(tokens), dtype=np.float64, sep=" ").reshape(-1, 3)
+    lookup = {symbol: atomic_numbers[symbol.capitalize()] for symbol in set(symbols)}
+    numbers = np.fromiter([lookup[symbol] for symbol in symbols], dtype=np.int8, count=len(symbols))
+    return coords, numbers
+
+
+def pack_frames(coords, elements):
+    """
+    Converts lists of frames (as returned by readXYZs) into packed arrays
+    """
+    natoms = [len(e) for e in elements]
+    offsets = np.zeros(len(natoms) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(natoms)
+    if offsets[-1] == 0:
+        return np.zeros((0, 3)), np.zeros(0, dtype=np.int8), offsets
+    coords_packed = np.concatenate([np.array(c, dtype=np.float64).reshape(-1, 3) for c in coords])
+    numbers = np.array([atomic_numbers[e.capitalize()] for frame in elements for e in frame], dtype=np.int8)
+    return coords_packed, numbers, offsets
+
+
+def unpack_frames(coords_packed, numbers, offsets):
+    """
+    Converts packed arrays into lists of frames (as returned by readXYZs)
+    """
+    coords_list = coords_packed.tolist()
+    symbols = np.array(element_symbols)[numbers].tolist()
+    coords = [coords_list[offsets[i]:offsets[i + 1]] for i in range(len(offsets) - 1)]
+    elements = [symbols[offsets[i]:offsets[i + 1]] for i in range(len(offsets) - 1)]
+    return coords, elements
 
 #Adrian's one
 def exportXYZ(coords, elements, filename, mask=[]):
@@ -63,12 +152,32 @@ def exportXYZ(coords, elements, filename, mask=[]):
 
 #Marlen's one
 def exportXYZs(coords,elements,filename):
-    outfile=open(filename,"w")
-    for idx in range(len(coords)):
-        outfile.write("%i\n\n"%(len(elements[idx])))
-        for atomidx,atom in enumerate(coords[idx]):
-            outfile.write("%s %f %f %f\n"%(elements[idx][atomidx].capitalize(),atom[0],atom[1],atom[2]))
-    outfile.close()
+    coords_packed, numbers, offsets = pack_frames(coords, elements)
+    export_xyz_packed(coords_packed, numbers, offsets, filename)
+
+
+def export_xyz_packed(coords, numbers, offsets, filename, comments=None, block_size=10000):
+    """
+    Writes packed arrays (see read_xyz_packed) as multi-frame xyz file, formatting whole frames at once
+    :param comments: optional comment line per frame
+    :param block_size: number of frames converted at once
+    """
+    symbols_all = np.array(element_symbols, dtype=object)
+    with open_xyz(filename, "w") as outfile:
+        for first in range(0, len(offsets) - 1, block_size):
+            last = min(first + block_size, len(offsets) - 1)
+            start, end = offsets[first], offsets[last]
+            table = np.empty((end - start, 4), dtype=object)
+            table[:, 0] = symbols_all[numbers[start:end]]
+            table[:, 1:] = coords[start:end]
+            values = table.ravel().tolist()
+            chunks = []
+            for idx in range(first, last):
+                natoms = offsets[idx + 1] - offsets[idx]
+                comment = comments[idx] if comments is not None else ""
+                chunks.append("%i\n%s\n" % (natoms, comment))
+                chunks.append("%s %f %f %f\n" * natoms % tuple(values[4 * (offsets[idx] - start):4 * (offsets[idx + 1] - start)]))
+            outfile.write("".join(chunks))
 
 def exportXYZs_with_tasks(coords, elements, tasks, filename):
     outfile=open(filename,"w")
@@ -86,4 +195,12 @@ def a2bohr_exportXYZ(coords, elements, filename):
     outfile.write("%i\n\n"%(len(elements))) #first the number of elements, then a blank line
     for atomidx,atom in enumerate(coords):
         outfile.write("%s %f %f %f\n"%(elements[atomidx].capitalize(), atom[0]* AToBohr, atom[1]* AToBohr, atom[2]* AToBohr))
-    outfile.close()
\ No newline at end of file
+    outfile.close()
+
+#hash of a geometry, rounded so that coordinates read back from an xyz file give the same hash
+def geometry_hash(coords, elements, decimals=5):
+    rounded = np.round(np.array(coords, dtype=np.float64), decimals) + 0.0 #+0.0 turns -0.0 into 0.0
+    h = hashlib.sha1()
+    h.update(" ".join([e.capitalize() for e in elements]).encode("utf8"))
+    h.update(rounded.tobytes())
+    return h.hexdigest()